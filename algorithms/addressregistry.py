@@ -0,0 +1,42 @@
+# Address Registry
+# Interns every address string to a dense integer id so the routing core only
+# compares and indexes integers. Ids follow the order addresses are registered in,
+# which for our data is the row order of the distance matrix, so an id is also the
+# row and column of that address in the matrix. Strings are only needed for display.
+class AddressRegistry:
+    def __init__(self, addresses=()):
+        self._names = []
+        self._ids = {}
+        for address in addresses:
+            self.intern(address)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __contains__(self, address):
+        return address in self._ids
+
+    # Return the id of an address, registering it if it is new
+    # Time Complexity: O(1) average, hashing the address string
+    # Space Complexity: O(1)
+    def intern(self, address):
+        address_id = self._ids.get(address)
+        if address_id is None:
+            address_id = len(self._names)
+            self._names.append(address)
+            self._ids[address] = address_id
+        return address_id
+
+    # Return the id of a known address and raise a KeyError for an unknown one
+    # Time Complexity: O(1) average, hashing the address string
+    # Space Complexity: O(1)
+    def idOf(self, address):
+        return self._ids[address]
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def nameOf(self, address_id):
+        return self._names[address_id]
@@ -0,0 +1,146 @@
+import math
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, insertions are scored one at a time without it
+    numpy = None
+
+
+# Deadline aware route construction using time window insertion
+# Times are minutes since midnight. Every stop has a latest arrival time, stops without a deadline use infinity.
+# Stops with a deadline are inserted first, earliest deadline first, then every other stop is placed at the
+# cheapest position over all remaining stops. The cost of an insertion is the extra distance plus a penalty
+# for using up the slack of the stops after it:
+#     cost = extra miles + slack_weight * extra minutes / (slack + 1)
+# Feasibility is checked without driving the route again. For every position we keep the arrival time and the
+# slack, the smallest (latest - arrival) of that stop and every stop after it. An insertion that adds
+# d minutes is feasible when the new stop is on time and d is not more than the slack of the next stop.
+# If no position keeps every stop on time we take the one that makes stops the least late.
+# The route being built lives in a PartialRoute of its own call, so one router can build the routes of many
+# trucks at the same time, for example for days simulated in a thread pool.
+class DeadlineRouter:
+    def __init__(self, distances, slack_weight=0.5):
+        self.distances = distances
+        self.slack_weight = slack_weight
+
+    # Build the stop order for a route from start to end that leaves at start_minutes
+    # latest maps a stop to its latest arrival time in minutes, stops missing from it have no deadline
+    # Time Complexity: O(n^3) where n is the number of stops, the inner O(n^2) is vectorized when numpy is installed
+    # Space Complexity: O(n^2) where n is the number of stops
+    def route(self, start, start_minutes, stops, latest, end=None, truck_speed=18.0):
+        end = start if end is None else end
+        route = PartialRoute(self.distances, start, end, start_minutes, truck_speed)
+
+        stops = list(dict.fromkeys(stops))
+        with_deadline = sorted((stop for stop in stops if stop in latest), key=lambda stop: latest[stop])
+        for stop in with_deadline:
+            self._insertBest(route, [stop], latest)
+        remaining = [stop for stop in stops if stop not in latest]
+        while remaining:
+            stop = self._insertBest(route, remaining, latest)
+            remaining.remove(stop)
+        return route.nodes[1:-1]
+
+    # Insert the candidate with the best score at its best position and return it
+    # Time Complexity: O(c * n) where c is the number of candidates and n is the number of stops
+    # Space Complexity: O(c * n)
+    def _insertBest(self, route, candidates, latest):
+        if self.distances.array is not None:
+            candidate, position = self._bestVectorized(route, candidates, latest)
+        else:
+            candidate, position = self._best(route, candidates, latest)
+        route.insert(candidate, position, latest.get(candidate, math.inf))
+        return candidate
+
+    # Score of every candidate at every position, lower is better
+    # lateness: minutes the candidate would be late plus minutes later stops would become late
+    # Time Complexity: O(c * n)
+    # Space Complexity: O(c * n)
+    def _bestVectorized(self, route, candidates, latest):
+        matrix = self.distances.array
+        nodes = numpy.asarray(route.nodes)
+        stops = numpy.asarray(candidates)
+        scale = route.minutes_per_mile
+        before, after = nodes[:-1], nodes[1:]
+        extra = matrix[before[None, :], stops[:, None]] + matrix[stops[:, None], after[None, :]] \
+            - matrix[before, after][None, :]
+        extra_minutes = extra * scale
+        arrival = numpy.asarray(route.arrival[:-1])[None, :] + matrix[before[None, :], stops[:, None]] * scale
+        stop_latest = numpy.asarray([latest.get(stop, math.inf) for stop in candidates])[:, None]
+        next_slack = numpy.asarray(route.slack[1:])[None, :]
+        lateness = numpy.maximum(arrival - stop_latest, 0) + \
+            numpy.maximum(extra_minutes - numpy.maximum(next_slack, 0), 0)
+        with numpy.errstate(invalid='ignore'):
+            cost = extra + self.slack_weight * numpy.where(numpy.isinf(next_slack), 0.0,
+                                                           extra_minutes / (numpy.maximum(next_slack, 0) + 1))
+        # lateness first, cost breaks ties
+        best_lateness = lateness.min()
+        cost = numpy.where(lateness <= best_lateness, cost, numpy.inf)
+        index = int(cost.argmin())
+        row, column = divmod(index, cost.shape[1])
+        return candidates[row], column
+
+    # Time Complexity: O(c * n)
+    # Space Complexity: O(1)
+    def _best(self, route, candidates, latest):
+        best, best_move = None, None
+        for stop in candidates:
+            stop_latest = latest.get(stop, math.inf)
+            for position in range(len(route.nodes) - 1):
+                before, after = route.nodes[position], route.nodes[position + 1]
+                extra = self.distances.distance(before, stop) + self.distances.distance(stop, after) - \
+                    self.distances.distance(before, after)
+                extra_minutes = extra * route.minutes_per_mile
+                arrival = route.arrival[position] + route.minutes(before, stop)
+                next_slack = route.slack[position + 1]
+                lateness = max(arrival - stop_latest, 0) + max(extra_minutes - max(next_slack, 0), 0)
+                cost = extra
+                if not math.isinf(next_slack):
+                    cost += self.slack_weight * extra_minutes / (max(next_slack, 0) + 1)
+                if best is None or (lateness, cost) < best:
+                    best, best_move = (lateness, cost), (stop, position)
+        return best_move
+
+
+# A route while DeadlineRouter builds it: the stops from start to end with the arrival time, the latest
+# arrival time and the slack of every position
+class PartialRoute:
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def __init__(self, distances, start, end, start_minutes, truck_speed):
+        self.distances = distances
+        self.minutes_per_mile = 60 / truck_speed
+        self.nodes = [start, end]
+        self.arrival = [start_minutes, start_minutes + self.minutes(start, end)]
+        self.latest = [math.inf, math.inf]
+        self.updateSlack()
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def minutes(self, address1, address2):
+        return self.distances.distance(address1, address2) * self.minutes_per_mile
+
+    # slack[i] = smallest (latest - arrival) over position i and every position after it
+    # Time Complexity: O(n) where n is the number of stops
+    # Space Complexity: O(n)
+    def updateSlack(self):
+        slack = [math.inf] * len(self.nodes)
+        smallest = math.inf
+        for index in range(len(self.nodes) - 1, -1, -1):
+            smallest = min(smallest, self.latest[index] - self.arrival[index])
+            slack[index] = smallest
+        self.slack = slack
+
+    # Put a stop with its latest arrival time between position and position + 1, push back the arrival
+    # of every later stop and work out the slack again
+    # Time Complexity: O(n) where n is the number of stops
+    # Space Complexity: O(n)
+    def insert(self, stop, position, latest):
+        before, after = self.nodes[position], self.nodes[position + 1]
+        added = self.minutes(before, stop) + self.minutes(stop, after) - self.minutes(before, after)
+        self.nodes.insert(position + 1, stop)
+        self.arrival.insert(position + 1, self.arrival[position] + self.minutes(before, stop))
+        self.latest.insert(position + 1, latest)
+        for index in range(position + 2, len(self.arrival)):
+            self.arrival[index] += added
+        self.updateSlack()
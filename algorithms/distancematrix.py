@@ -0,0 +1,207 @@
+import array
+import csv
+import hashlib
+import mmap
+import os
+import struct
+
+from algorithms import instrumentation
+from algorithms.neighbourindex import NeighbourIndex
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, the matrix works on plain buffers without it
+    numpy = None
+
+
+# Compact distance matrix
+# All distances live in one contiguous buffer of floats (row major, n * n) instead of a list of lists.
+# The symmetric half of a lower-triangular CSV is filled in while parsing so every lookup is a
+# single index. The matrix is written once to a binary cache file next to the CSV, later startups
+# memory-map the cache so loading costs a file open instead of parsing the CSV again.
+# When numpy is installed the same buffer is exposed as a 2D array for vectorized work.
+class DistanceMatrix:
+    # Cache layout: header, addresses as utf-8 separated by new lines, padding, then the matrix
+    # header fields: magic, version, address count, typecode, length of the address block, source hash
+    _MAGIC = b'DMAT'
+    _VERSION = 1
+    _HEADER = struct.Struct('<4sHIcxI16s')
+    _ALIGNMENT = 8
+
+    # neighbours can be a NeighbourIndex that was already built for this matrix, for example from a snapshot
+    def __init__(self, addresses, flat, typecode='d', source_hash=b'', neighbours=None):
+        self.addresses = addresses
+        self.size = len(addresses)
+        self.typecode = typecode
+        self.source_hash = source_hash
+        self._flat = flat
+        self._array = None
+        self._neighbours = neighbours
+
+    def __len__(self):
+        return self.size
+
+    # Keeps matrix[i][j] working like the old list of lists
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def __getitem__(self, index):
+        start = index * self.size
+        return self._flat[start:start + self.size]
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def distance(self, index1, index2):
+        return self._flat[index1 * self.size + index2]
+
+    # The length of every leg of a route of address ids, in one vectorized lookup when numpy is installed
+    # Time Complexity: O(r) where r is the number of addresses on the route
+    # Space Complexity: O(r)
+    def legs(self, route):
+        if self.array is not None:
+            route = numpy.asarray(route)
+            return self.array[route[:-1], route[1:]]
+        return [self._flat[route[index] * self.size + route[index + 1]] for index in range(len(route) - 1)]
+
+    # The flat buffer holding the matrix, row major
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    @property
+    def buffer(self):
+        return self._flat
+
+    # The whole matrix as a 2D numpy array sharing the same memory, None when numpy is not installed
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    @property
+    def array(self):
+        if self._array is None and numpy is not None:
+            self._array = numpy.frombuffer(self._flat, dtype=self.typecode).reshape(self.size, self.size)
+        return self._array
+
+    # Sorted neighbour lists for the greedy router, built the first time they are needed
+    # Time Complexity: O(n^2 log n) the first time, O(1) after that
+    # Space Complexity: O(n^2) where n is the number of addresses
+    def neighbours(self):
+        if self._neighbours is None:
+            self._neighbours = NeighbourIndex(self)
+        return self._neighbours
+
+    # The hash used to tell if a cache file still matches its CSV
+    # Time Complexity: O(n) where n is the size of the file in bytes
+    # Space Complexity: O(1)
+    @staticmethod
+    def hashFile(path):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.digest()
+
+    # Default cache file for a CSV, data/distances.csv is cached in data/distances.bin
+    @staticmethod
+    def cachePathFor(csv_path):
+        return os.path.splitext(csv_path)[0] + '.bin'
+
+    # Parse the distance CSV. The first column holds the location name and the address on separate lines,
+    # the distances start in the third column. Blank cells are filled from the symmetric half.
+    # Time Complexity: O(n^2) where n is the number of addresses
+    # Space Complexity: O(n^2) where n is the number of addresses
+    @classmethod
+    def fromCsv(cls, path, typecode='d'):
+        addresses = []
+        rows = []
+        with open(path) as file:
+            reader = csv.reader(file)
+            next(reader)  # skip header row
+            for row in reader:
+                addresses.append(row[0].split('\n')[1].strip())
+                rows.append(row[2:])
+
+        size = len(addresses)
+        flat = array.array(typecode, bytes(size * size * array.array(typecode).itemsize))
+        for i, row in enumerate(rows):
+            for j, cell in enumerate(row[:size]):
+                cell = cell.strip()
+                if cell:
+                    value = float(cell)
+                    flat[i * size + j] = value
+                    flat[j * size + i] = value
+        return cls(addresses, memoryview(flat), typecode, cls.hashFile(path))
+
+    # Load the matrix for a CSV, using the binary cache when it matches the CSV
+    # and writing the cache when it does not
+    # Time Complexity: O(1) plus hashing the CSV when the cache is valid, O(n^2) when the CSV has to be parsed
+    # Space Complexity: O(n^2) where n is the number of addresses, backed by the page cache when memory-mapped
+    @classmethod
+    def load(cls, csv_path, cache_path=None, typecode='d'):
+        if cache_path is None:
+            cache_path = cls.cachePathFor(csv_path)
+        source_hash = cls.hashFile(csv_path)
+        try:
+            matrix = cls.open(cache_path)
+            if matrix.source_hash == source_hash and matrix.typecode == typecode:
+                return matrix
+        except (OSError, ValueError):
+            pass  # missing or unreadable cache, rebuild it
+
+        matrix = cls.fromCsv(csv_path, typecode)
+        try:
+            matrix.write(cache_path)
+        except OSError:
+            pass  # a read-only data directory only costs us the cache
+        return matrix
+
+    # Write the matrix to a binary cache file, the file is replaced atomically
+    # Time Complexity: O(n^2) where n is the number of addresses
+    # Space Complexity: O(1)
+    def write(self, path):
+        address_block = '\n'.join(self.addresses).encode('utf-8')
+        header = self._HEADER.pack(self._MAGIC, self._VERSION, self.size, self.typecode.encode('ascii'),
+                                   len(address_block), self.source_hash.ljust(16, b'\0'))
+        padding = -(len(header) + len(address_block)) % self._ALIGNMENT
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(header)
+            file.write(address_block)
+            file.write(b'\0' * padding)
+            file.write(self._flat.cast('B'))
+        os.replace(temp_path, path)
+
+    # Memory-map a binary cache file, nothing is copied until a page is touched
+    # Time Complexity: O(n) where n is the number of addresses, for decoding the address names
+    # Space Complexity: O(n) where n is the number of addresses
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < cls._HEADER.size:
+            raise ValueError(f'{path} is not a distance matrix cache')
+        magic, version, size, typecode, block_length, source_hash = cls._HEADER.unpack_from(mapped)
+        if magic != cls._MAGIC or version != cls._VERSION:
+            raise ValueError(f'{path} is not a distance matrix cache')
+
+        typecode = typecode.decode('ascii')
+        start = cls._HEADER.size
+        addresses = mapped[start:start + block_length].decode('utf-8').split('\n') if size else []
+        start += block_length
+        start += -start % cls._ALIGNMENT
+        end = start + size * size * array.array(typecode).itemsize
+        if len(addresses) != size or len(mapped) < end:
+            raise ValueError(f'{path} is truncated')
+        flat = memoryview(mapped)[start:end].cast(typecode)
+        return cls(addresses, flat, typecode, source_hash)
+
+
+# Counts every distance read from the matrix, one per leg of a route
+def _countingLegs(original, probe):
+    def legs(self, route):
+        result = original(self, route)
+        probe.count('distances.reads', len(result))
+        probe.peak('distances.longest route', len(result))
+        return result
+    return legs
+
+
+instrumentation.hook(DistanceMatrix, 'distance', instrumentation.counting('distances.reads'))
+instrumentation.hook(DistanceMatrix, 'legs', _countingLegs)
+instrumentation.hook(NeighbourIndex, 'nearest', instrumentation.counting('neighbours.nearest'))
@@ -1,24 +1,58 @@
+import threading
+
+from algorithms import instrumentation
 from algorithms.linkedlist import LinkedList
 
 
+# Smallest prime number greater than or equal to n, used to pick the bucket size when we grow
+# Time Complexity: O(g * sqrt(n)) where g is the gap to the next prime, tiny in practice
+# Space Complexity: O(1)
+def _next_prime(n):
+    n = max(n, 2)
+    while True:
+        if n == 2 or (n % 2 and all(n % divisor for divisor in range(3, int(n ** 0.5) + 1, 2))):
+            return n
+        n += 1
+
+
 # Hash Table backed by a self-adjusting linked list
 # This hash table stores data in buckets, each bucket is a linked list
 # The bucket is determined by the hash of the key, the key can be any hashable object
 # In case of a collision, the new item is appended to the linked list
 # Collisions are handled by chaining, and can be minimized by using a large bucket size
 # Items are stored in key-value pairs
+# Once the number of items passes load_factor times the number of buckets, the table grows to
+# the next prime above twice its size and rehashes, so chains stay short as the table fills up
+# Secondary indexes can be added on item attributes, see addIndex and lookup
 class HashTable:
     _bucket_size = 61  # rule of thumb is to use a prime number between 1.5 and 2 times the number of expected entries
+    _load_factor = 0.75
 
-    def __init__(self, bucket_size=_bucket_size):
+    def __init__(self, bucket_size=_bucket_size, load_factor=_load_factor):
         self._bucket_size = bucket_size
+        self._load_factor = load_factor
+        self._count = 0
         self._buckets = [LinkedList() for _ in range(bucket_size)]
+        # attribute -> attribute value -> key -> item, plus attribute -> key -> indexed value
+        self._indexes = {}
+        self._indexed_values = {}
+
+    def __len__(self):
+        return self._count
 
     def __iter__(self):
         for bucket in self._buckets:
             for item in bucket:
                 yield item
 
+    # Iterate over the key-value pairs without reordering any bucket
+    def _items(self):
+        for bucket in self._buckets:
+            node = bucket.head
+            while node is not None:
+                yield node.key, node.data
+                node = node.next
+
     # Provide a string representation of the hash table
     def __str__(self):
         return "".join([str(bucket) for bucket in self._buckets if bucket.head is not None])
@@ -44,18 +78,21 @@ class HashTable:
     # user to pass in either a string or an integer, for the option of a hash function that
     # will provide a highly unique hash value but cost O(n) time complexity where n is the length of the key;
     # or a hash function that will provide a less unique hash value but cost O(1) time complexity.
+    # bucket_size hashes for a table of another size than the current one, used while the table is resized
     # Time Complexity: O(n) or O(1) time complexity based on the key type (string or integer)
     # Space Complexity: O(1)
-    def _hash(self, key):
+    def _hash(self, key, bucket_size=None):
+        if bucket_size is None:
+            bucket_size = self._bucket_size
         if isinstance(key, str):
             hash_multiplier = 31
             hash_value = 0
             for char in key:
                 # ord() returns an integer representing the Unicode character
-                hash_value = (hash_value * hash_multiplier + ord(char)) % self._bucket_size
+                hash_value = (hash_value * hash_multiplier + ord(char)) % bucket_size
             return hash_value
         else:
-            return key % self._bucket_size
+            return key % bucket_size
 
     # Time Complexity: O(n) where n is the number of hash collisions
     # Space Complexity: O(1)
@@ -68,12 +105,29 @@ class HashTable:
             # Catch the exception and re-raise it
             raise e
 
-    # Time Complexity: O(1)
+    # Time Complexity: O(1), amortized over the occasional resize
     # Space Complexity: O(1)
     def append(self, key, data):
         index = self._hash(key)
         bucket = self._buckets[index]
         bucket.append(key, data)
+        self._index(key, data)
+        self._count += 1
+        if self._count > self._bucket_size * self._load_factor:
+            self._resize(_next_prime(self._bucket_size * 2))
+
+    # Move every item into a new set of buckets, the bucket of a key depends on the bucket size
+    # Time Complexity: O(n) where n is the number of items
+    # Space Complexity: O(n) where n is the number of items
+    def _resize(self, bucket_size):
+        old_buckets = self._buckets
+        self._bucket_size = bucket_size
+        self._buckets = [LinkedList() for _ in range(bucket_size)]
+        for bucket in old_buckets:
+            node = bucket.head
+            while node is not None:
+                self._buckets[self._hash(node.key)].append(node.key, node.data)
+                node = node.next
 
     # Time Complexity: O(n) where n is the number of hash collisions
     # Space Complexity: O(1)
@@ -86,6 +140,8 @@ class HashTable:
         except KeyError as e:
             # Catch the exception and re-raise it
             raise e
+        self._unindex(key)
+        self._index(key, data)
 
     # Time Complexity: O(n) where n is the number of hash collisions
     # Space Complexity: O(1)
@@ -97,26 +153,432 @@ class HashTable:
         except KeyError as e:
             # Catch the exception and re-raise it
             raise e
+        self._unindex(key)
+        self._count -= 1
 
     # Ultimately unused but a good method to have
     # Time Complexity: O(n) where n is the number of buckets
     # Space Complexity: O(n) where n is the number of buckets
     def copy(self):
-        new_table = HashTable(self._bucket_size)
-        for bucket in self._buckets:
-            new_table._buckets.append(bucket.copy())
+        new_table = HashTable(self._bucket_size, self._load_factor)
+        new_table._buckets = [bucket.copy() for bucket in self._buckets]
+        new_table._count = self._count
+        for attribute in self._indexes:
+            new_table.addIndex(attribute)
         return new_table
 
+    # Keep a secondary index on an item attribute, for example the flag or status of a package
+    # The index is kept up to date by append, update and remove, so an item changed in place
+    # has to be written back with table[key] = item (or reindex) for the index to see the change
+    # Time Complexity: O(n) where n is the number of items, to index the items already in the table
+    # Space Complexity: O(n) where n is the number of items
+    def addIndex(self, attribute):
+        if attribute in self._indexes:
+            return
+        self._indexes[attribute] = {}
+        self._indexed_values[attribute] = {}
+        for key, data in self._items():
+            self._indexItem(attribute, key, data)
+
+    # Re-read the indexed attributes of an item that was changed in place
+    # Time Complexity: O(c + a) where c is the number of hash collisions and a is the number of indexes
+    # Space Complexity: O(1)
+    def reindex(self, key):
+        data = self.get(key)
+        self._unindex(key)
+        self._index(key, data)
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def _indexItem(self, attribute, key, data):
+        value = getattr(data, attribute, None)
+        self._indexes[attribute].setdefault(value, {})[key] = data
+        self._indexed_values[attribute][key] = value
+
+    # Time Complexity: O(a) where a is the number of indexes
+    # Space Complexity: O(1)
+    def _index(self, key, data):
+        for attribute in self._indexes:
+            self._indexItem(attribute, key, data)
+
+    # Time Complexity: O(a) where a is the number of indexes
+    # Space Complexity: O(1)
+    def _unindex(self, key):
+        for attribute, index in self._indexes.items():
+            values = self._indexed_values[attribute]
+            if key not in values:
+                continue
+            value = values.pop(key)
+            matches = index[value]
+            del matches[key]
+            if not matches:
+                del index[value]
+
     # Allows for the user to search the hash table for a specific item
     # This search is object independent and can apply to any object stored in the hash table
-    # Time Complexity: O(n^c^k) where n is the number of buckets and c is the number of hash collisions and k is the number of kwargs
-    # Consider collisions to be a constant and rare, this becomes O(n^k)
-    # Space Complexity: O(n) where n is the number of items in the hash table
+    # Every keyword has to match. Indexed attributes are answered from their index, starting with the
+    # smallest set of matches, and only the remaining attributes are checked item by item.
+    # Time Complexity: O(m * k) where m is the smallest number of matches on an indexed attribute
+    # and k is the number of kwargs, O(n * k) where n is the number of items when nothing is indexed
+    # Space Complexity: O(m) where m is the number of matches
     def lookup(self, **kwargs):
+        indexed = [self._indexes[key].get(value, {}) for key, value in kwargs.items() if key in self._indexes]
+        others = [(key, value) for key, value in kwargs.items() if key not in self._indexes]
+        if indexed:
+            indexed.sort(key=len)
+            candidates = indexed[0].items()
+            rest = indexed[1:]
+        else:
+            candidates = self._items()
+            rest = []
+
         matches = []
-        for bucket in self._buckets:
-            for item in bucket:
-                for key, value in kwargs.items():
-                    if getattr(item, key) == value:
-                        matches.append(item)
+        for item_key, item in candidates:
+            if all(item_key in index for index in rest) and \
+                    all(getattr(item, key) == value for key, value in others):
+                matches.append(item)
         return matches
+
+
+# Hash Table using open addressing
+# Keys and values are stored in two flat lists instead of a linked list of nodes per bucket,
+# a collision moves on to the next slot (linear probing) until an empty one is found.
+# Removed items leave a marker behind so the probe sequence of later keys is not cut short.
+# The table keeps the same dictionary style interface as the chained HashTable, and grows when
+# the number of used slots, removed ones included, passes load_factor times the number of slots.
+class OpenAddressingHashTable(HashTable):
+    _load_factor = 0.5
+    _EMPTY = object()
+    _DELETED = object()
+
+    def __init__(self, bucket_size=HashTable._bucket_size, load_factor=_load_factor):
+        self._bucket_size = bucket_size
+        self._load_factor = load_factor
+        self._count = 0
+        self._used = 0  # live items plus removed markers
+        self._keys = [self._EMPTY] * bucket_size
+        self._values = [None] * bucket_size
+        self._indexes = {}
+        self._indexed_values = {}
+
+    def __iter__(self):
+        for index, key in enumerate(self._keys):
+            if key is not self._EMPTY and key is not self._DELETED:
+                yield self._values[index]
+
+    def __str__(self):
+        return "".join([f'{item}\n' for item in self])
+
+    def _items(self):
+        for index, key in enumerate(self._keys):
+            if key is not self._EMPTY and key is not self._DELETED:
+                yield key, self._values[index]
+
+    # Slot holding the key, or None when the key is not in the table
+    # Time Complexity: O(1) on average with a load factor below one
+    # Space Complexity: O(1)
+    def _find(self, key):
+        keys = self._keys
+        index = self._hash(key)
+        for _ in range(self._bucket_size):
+            slot_key = keys[index]
+            if slot_key is self._EMPTY:
+                return None
+            if slot_key is not self._DELETED and slot_key == key:
+                return index
+            index = (index + 1) % self._bucket_size
+        return None
+
+    # Time Complexity: O(1) on average
+    # Space Complexity: O(1)
+    def get(self, key):
+        index = self._find(key)
+        if index is None:
+            raise KeyError(key)
+        return self._values[index]
+
+    # Time Complexity: O(1) on average, amortized over the occasional resize
+    # Space Complexity: O(1)
+    def append(self, key, data):
+        self._place(key, data)
+        self._index(key, data)
+        if self._used > self._bucket_size * self._load_factor:
+            # only grow when live items fill the table, otherwise rehashing just clears removed markers
+            bucket_size = self._bucket_size
+            if self._count > bucket_size * self._load_factor / 2:
+                bucket_size = _next_prime(bucket_size * 2)
+            self._resize(bucket_size)
+
+    # Put a key-value pair in a free slot
+    # Time Complexity: O(1) on average
+    # Space Complexity: O(1)
+    def _place(self, key, data):
+        keys = self._keys
+        index = self._hash(key)
+        # reuse the first removed slot, otherwise take the empty slot that ends the probe
+        while keys[index] is not self._EMPTY and keys[index] is not self._DELETED:
+            index = (index + 1) % self._bucket_size
+        if keys[index] is self._EMPTY:
+            self._used += 1
+        keys[index] = key
+        self._values[index] = data
+        self._count += 1
+
+    # Time Complexity: O(n) where n is the number of slots
+    # Space Complexity: O(n) where n is the number of slots
+    def _resize(self, bucket_size):
+        old_keys, old_values = self._keys, self._values
+        self._bucket_size = bucket_size
+        self._keys = [self._EMPTY] * bucket_size
+        self._values = [None] * bucket_size
+        self._count = 0
+        self._used = 0
+        for index, key in enumerate(old_keys):
+            if key is not self._EMPTY and key is not self._DELETED:
+                self._place(key, old_values[index])
+
+    # Time Complexity: O(1) on average
+    # Space Complexity: O(1)
+    def update(self, key, data):
+        index = self._find(key)
+        if index is None:
+            raise KeyError(key)
+        self._values[index] = data
+        self._unindex(key)
+        self._index(key, data)
+
+    # Time Complexity: O(1) on average
+    # Space Complexity: O(1)
+    def remove(self, key):
+        index = self._find(key)
+        if index is None:
+            raise KeyError(key)
+        self._keys[index] = self._DELETED
+        self._values[index] = None
+        self._unindex(key)
+        self._count -= 1
+
+    # Time Complexity: O(n) where n is the number of slots
+    # Space Complexity: O(n) where n is the number of slots
+    def copy(self):
+        new_table = OpenAddressingHashTable(self._bucket_size, self._load_factor)
+        new_table._keys = list(self._keys)
+        new_table._values = list(self._values)
+        new_table._count = self._count
+        new_table._used = self._used
+        for attribute in self._indexes:
+            new_table.addIndex(attribute)
+        return new_table
+
+
+# Hash Table that can be shared between threads, for example by threads answering status queries
+# Buckets are guarded by lock striping: bucket i belongs to stripe i % stripes and a write locks only the
+# stripe of its bucket, a resize locks every stripe. Reads take no lock at all, they peek into the bucket
+# without reordering it, and only check again under the stripe lock when the key was not found, which is
+# the one thing a concurrent write or resize can make a lock free reader see.
+# The move to head of the self-adjusting buckets is optional. With move_to_front the keys that were read are
+# queued per stripe and moved to the head of their bucket batch_size at a time, by whichever reader finds
+# the stripe lock free, so readers never wait for each other to reorder a bucket.
+# Item counts and the secondary indexes are shared by all buckets and kept under a lock of their own. A write
+# takes that lock while it still holds its stripe lock, so the indexes change in the same order as the buckets;
+# locks are always taken stripe first.
+# Unlike the HashTable, append refuses a key that is already in the table and table[key] = data inserts or
+# replaces under one stripe lock, so two threads writing the same key never both insert it.
+class ConcurrentHashTable(HashTable):
+    _stripes = 16
+    _batch_size = 64
+
+    def __init__(self, bucket_size=HashTable._bucket_size, load_factor=HashTable._load_factor, stripes=_stripes,
+                 move_to_front=False, batch_size=_batch_size):
+        super().__init__(bucket_size, load_factor)
+        self.move_to_front = move_to_front
+        self.batch_size = batch_size
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._pending = [[] for _ in range(stripes)]
+        self._meta_lock = threading.RLock()
+
+    # Lock the stripe of the bucket of a key, returns the bucket and the held lock
+    # A resize between picking the lock and taking it moves the key, so the lock is picked again
+    # Time Complexity: O(1), O(n) for a string key of length n
+    # Space Complexity: O(1)
+    def _lockBucket(self, key):
+        while True:
+            buckets = self._buckets
+            index = self._hash(key, len(buckets))
+            lock = self._locks[index % len(self._locks)]
+            lock.acquire()
+            if self._buckets is buckets:
+                return buckets[index], lock
+            lock.release()
+
+    # Time Complexity: O(n) where n is the number of hash collisions
+    # Space Complexity: O(1)
+    def get(self, key):
+        buckets = self._buckets
+        index = self._hash(key, len(buckets))
+        try:
+            data = buckets[index].peek(key)
+        except KeyError:
+            bucket, lock = self._lockBucket(key)
+            try:
+                data = bucket.peek(key)
+            finally:
+                lock.release()
+        if self.move_to_front:
+            self._recordHit(index % len(self._locks), key)
+        return data
+
+    # Queue a key that was read, and move the queued keys of the stripe to the head of their buckets once
+    # there are batch_size of them and nobody holds the stripe lock
+    # Time Complexity: O(1) amortized over batch_size reads, each move is O(n) where n is the number of collisions
+    # Space Complexity: O(batch_size) per stripe
+    def _recordHit(self, stripe, key):
+        pending = self._pending[stripe]
+        pending.append(key)
+        if len(pending) < self.batch_size:
+            return
+        lock = self._locks[stripe]
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            keys, self._pending[stripe] = self._pending[stripe], []
+            buckets = self._buckets
+            stripes = len(self._locks)
+            for key in keys:
+                index = self._hash(key, len(buckets))
+                # a resize since the read may have moved the key to a bucket of another stripe
+                if index % stripes == stripe:
+                    buckets[index].moveToFront(key)
+        finally:
+            lock.release()
+
+    # Insert a key, raises a KeyError when the key is already in the table
+    # Time Complexity: O(n) where n is the number of hash collisions, amortized over the occasional resize
+    # Space Complexity: O(1)
+    def append(self, key, data):
+        self._put(key, data, replace=False)
+
+    # Time Complexity: O(n) where n is the number of hash collisions, amortized over the occasional resize
+    # Space Complexity: O(1)
+    def __setitem__(self, key, data):
+        self._put(key, data)
+
+    # Write a key under the lock of its stripe, insert and replace say what the caller allows,
+    # the count and the indexes are updated before the stripe lock is released
+    # Time Complexity: O(n) where n is the number of hash collisions, amortized over the occasional resize
+    # Space Complexity: O(1)
+    def _put(self, key, data, insert=True, replace=True):
+        bucket, lock = self._lockBucket(key)
+        try:
+            try:
+                bucket.peek(key)
+                found = True
+            except KeyError:
+                found = False
+            if found and not replace:
+                raise KeyError(f"{key} is already in the table")
+            if not found and not insert:
+                raise KeyError(key)
+            if found:
+                bucket.update(key, data)
+            else:
+                bucket.append(key, data)
+            with self._meta_lock:
+                if found:
+                    self._unindex(key)
+                else:
+                    self._count += 1
+                self._index(key, data)
+                grow = self._count > self._bucket_size * self._load_factor
+        finally:
+            lock.release()
+        if grow:
+            self._resize(_next_prime(self._bucket_size * 2))
+
+    # Build the new buckets on the side while every stripe is locked and swap them in at once,
+    # lock free readers keep reading the old buckets, which are not changed
+    # Time Complexity: O(n) where n is the number of items
+    # Space Complexity: O(n) where n is the number of items
+    def _resize(self, bucket_size):
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            # another writer may have grown the table while we waited for the locks
+            if bucket_size <= self._bucket_size:
+                return
+            buckets = [LinkedList() for _ in range(bucket_size)]
+            for bucket in self._buckets:
+                node = bucket.head
+                while node is not None:
+                    buckets[self._hash(node.key, bucket_size)].append(node.key, node.data)
+                    node = node.next
+            self._buckets = buckets
+            self._bucket_size = bucket_size
+            self._pending = [[] for _ in self._locks]
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    # Time Complexity: O(n) where n is the number of hash collisions
+    # Space Complexity: O(1)
+    def update(self, key, data):
+        self._put(key, data, insert=False)
+
+    # Time Complexity: O(n) where n is the number of hash collisions
+    # Space Complexity: O(1)
+    def remove(self, key):
+        bucket, lock = self._lockBucket(key)
+        try:
+            bucket.remove(key)
+            with self._meta_lock:
+                self._unindex(key)
+                self._count -= 1
+        finally:
+            lock.release()
+
+    # Time Complexity: O(n) where n is the number of buckets
+    # Space Complexity: O(n) where n is the number of buckets
+    def copy(self):
+        new_table = ConcurrentHashTable(self._bucket_size, self._load_factor, len(self._locks), self.move_to_front,
+                                        self.batch_size)
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            new_table._buckets = [bucket.copy() for bucket in self._buckets]
+            new_table._bucket_size = self._bucket_size
+            new_table._count = self._count
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+        with self._meta_lock:
+            for attribute in self._indexes:
+                new_table.addIndex(attribute)
+        return new_table
+
+    # Time Complexity: O(n) where n is the number of items
+    # Space Complexity: O(n) where n is the number of items
+    def addIndex(self, attribute):
+        with self._meta_lock:
+            super().addIndex(attribute)
+
+    # Time Complexity: O(c + a) where c is the number of hash collisions and a is the number of indexes
+    # Space Complexity: O(1)
+    def reindex(self, key):
+        bucket, lock = self._lockBucket(key)
+        try:
+            data = bucket.peek(key)
+            with self._meta_lock:
+                self._unindex(key)
+                self._index(key, data)
+        finally:
+            lock.release()
+
+    # Time Complexity: O(m * k), see HashTable.lookup
+    # Space Complexity: O(m) where m is the number of matches
+    def lookup(self, **kwargs):
+        with self._meta_lock:
+            return super().lookup(**kwargs)
+
+
+instrumentation.hook(HashTable, 'get', instrumentation.counting('hashtable.get'))
+instrumentation.hook(ConcurrentHashTable, 'get', instrumentation.counting('hashtable.get'))
@@ -0,0 +1,133 @@
+import contextlib
+import cProfile
+import pstats
+import time
+
+# Opt-in instrumentation for the hot paths
+# Counters are added by swapping instrumented versions of the hot methods onto their classes while a probe is
+# enabled and putting the originals back afterwards, so a run without a probe runs exactly the code it did before.
+# Every module registers the hooks of its own classes at its bottom with hook().
+# Phases are coarse timers around the steps of a run; phase() hands back a shared do-nothing context when
+# no probe is enabled.
+#
+#     with instrumentation.enabled() as probe:
+#         deliver()
+#     print(probe.report())
+
+# (class, method name, function that takes the original method and the probe and returns the replacement)
+_hooks = []
+_probe = None
+_NO_PHASE = contextlib.nullcontext()
+
+
+# Counters, maxima and phase timers of one run
+class Probe:
+    def __init__(self):
+        self.counters = {}
+        self.maxima = {}
+        self.timers = {}
+        self.profile = None
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def peak(self, name, value):
+        if value > self.maxima.get(name, value - 1):
+            self.maxima[name] = value
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            calls, seconds = self.timers.get(name, (0, 0.0))
+            self.timers[name] = (calls + 1, seconds + time.perf_counter() - started)
+
+    # Everything measured as plain data, ready for json.dumps
+    # profile_limit is the number of functions of the cProfile run to include, by cumulative time
+    # Time Complexity: O(c + t + f log f) where c is the number of counters, t of timers and f of profiled functions
+    # Space Complexity: O(c + t + profile_limit)
+    def report(self, profile_limit=25):
+        report = {
+            'counters': dict(sorted(self.counters.items())),
+            'maxima': dict(sorted(self.maxima.items())),
+            'phases': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.timers.items()},
+        }
+        walks = self.counters.get('hashtable.get')
+        if walks:
+            report['average chain walk'] = self.counters.get('linkedlist.walk steps', 0) / walks
+        if self.profile is not None:
+            stats = pstats.Stats(self.profile)
+            rows = []
+            for (file_name, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+                rows.append({'function': f'{file_name}:{line}({function})', 'calls': calls,
+                             'total_seconds': total, 'cumulative_seconds': cumulative})
+            rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+            report['profile'] = rows[:profile_limit]
+        return report
+
+
+# Register a method to instrument, wrap(original, probe) returns the method to use while a probe is enabled
+def hook(owner, name, wrap):
+    _hooks.append((owner, name, wrap))
+
+
+# A hook that only counts the calls of a method
+def counting(counter):
+    def wrap(original, probe):
+        def counted(*args, **kwargs):
+            probe.count(counter)
+            return original(*args, **kwargs)
+        return counted
+    return wrap
+
+
+# Timer for a step of a run, does nothing unless a probe is enabled
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def phase(name):
+    return _NO_PHASE if _probe is None else _probe.phase(name)
+
+
+# Turn instrumentation on for the block and give back the probe that collects everything
+# With profile the block also runs under cProfile and the report lists the most expensive functions
+@contextlib.contextmanager
+def enabled(profile=False):
+    global _probe
+    if _probe is not None:
+        raise RuntimeError("Instrumentation is already enabled")
+    probe = Probe()
+    originals = []
+    for owner, name, wrap in _hooks:
+        original = owner.__dict__[name]
+        originals.append((owner, name, original))
+        setattr(owner, name, wrap(original, probe))
+    _probe = probe
+    if profile:
+        probe.profile = cProfile.Profile()
+        probe.profile.enable()
+    try:
+        yield probe
+    finally:
+        if probe.profile is not None:
+            probe.profile.disable()
+        _probe = None
+        for owner, name, original in reversed(originals):
+            setattr(owner, name, original)
+
+
+# A hook that counts the calls of a method and keeps the largest size of what it returned
+def counting_sizes(counter, largest):
+    def wrap(original, probe):
+        def counted(*args, **kwargs):
+            result = original(*args, **kwargs)
+            probe.count(counter)
+            probe.peak(largest, len(result))
+            return result
+        return counted
+    return wrap
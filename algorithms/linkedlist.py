@@ -1,3 +1,4 @@
+from algorithms import instrumentation
 from algorithms.node import Node
 
 
@@ -16,13 +17,15 @@ class LinkedList:
             current_node = current_node.next
 
     # Makes printing the linked list easier
+    # Time Complexity: O(n)
+    # Space Complexity: O(n)
     def __str__(self):
+        lines = []
         current_node = self.head
-        string = ''
         while current_node is not None:
-            string += f'{current_node}\n'
+            lines.append(f'{current_node}\n')
             current_node = current_node.next
-        return string
+        return ''.join(lines)
 
     # Our self-adjusting linked list will move the node to the head
     # This works on the memory principal of locality of reference
@@ -36,15 +39,65 @@ class LinkedList:
         while current_node is not None:
             if current_node.key == key:
                 if self.head != current_node:
-                    # Move the node to the head
-                    previous_node.next = current_node.next
-                    current_node.next = self.head
-                    self.head = current_node
+                    self._moveToHead(previous_node, current_node)
                 return current_node.data
             previous_node = current_node
             current_node = current_node.next
         raise KeyError(key)
 
+    # Move a node that is not the head to the head, previous_node is the node before it
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def _moveToHead(self, previous_node, node):
+        if self.tail == node:
+            self.tail = previous_node
+        previous_node.next = node.next
+        node.next = self.head
+        self.head = node
+
+    # The node of the key, the node before it and how many nodes come before it, in one walk
+    # The node is None and the steps are the length of the list when the key is not in it
+    # Time Complexity: O(n)
+    # Space Complexity: O(1)
+    def locate(self, key):
+        steps = 0
+        previous_node = None
+        current_node = self.head
+        while current_node is not None and current_node.key != key:
+            steps += 1
+            previous_node = current_node
+            current_node = current_node.next
+        return previous_node, current_node, steps
+
+    # Read without moving the node, for lookups that must not write to the list
+    # A reader that walks the list while another thread moves a node to the head never loops or sees the
+    # wrong data, at worst it misses the key, so concurrent callers check again under a lock on a miss
+    # Time Complexity: O(n)
+    # Space Complexity: O(1)
+    def peek(self, key):
+        current_node = self.head
+        while current_node is not None:
+            if current_node.key == key:
+                return current_node.data
+            current_node = current_node.next
+        raise KeyError(key)
+
+    # The move to head of get on its own, so it can be done later than the read
+    # Returns False when the key is not in the list
+    # Time Complexity: O(n)
+    # Space Complexity: O(1)
+    def moveToFront(self, key):
+        current_node = self.head
+        previous_node = None
+        while current_node is not None:
+            if current_node.key == key:
+                if previous_node is not None:
+                    self._moveToHead(previous_node, current_node)
+                return True
+            previous_node = current_node
+            current_node = current_node.next
+        return False
+
     # Time Complexity: O(1)
     # Space Complexity: O(1)
     def append(self, key, data):
@@ -107,3 +160,39 @@ class LinkedList:
             new_list.append(current_node.key, current_node.data)
             current_node = current_node.next
         return new_list
+
+
+# Counts the nodes a read walked past, a miss or the longest walk, from the result of locate()
+def _countWalk(probe, key, node, steps):
+    probe.count('linkedlist.walk steps', steps)
+    if node is None:
+        probe.count('linkedlist.misses')
+        raise KeyError(key)
+    probe.peak('linkedlist.longest walk', steps)
+
+
+# LinkedList.get that also counts how many nodes it walked past and whether it moved the node to the head
+# The list is walked once by locate(), the move to the head is done here instead of by the original get
+def _countedGet(original, probe):
+    def get(self, key):
+        previous_node, node, steps = self.locate(key)
+        _countWalk(probe, key, node, steps)
+        if previous_node is not None:
+            self._moveToHead(previous_node, node)
+            probe.count('linkedlist.move to front')
+        return node.data
+    return get
+
+
+# LinkedList.peek, the read of the ConcurrentHashTable, counts its walk like get
+# A ConcurrentHashTable miss peeks twice, lock free and under the stripe lock, and both walks are counted
+def _countedPeek(original, probe):
+    def peek(self, key):
+        _, node, steps = self.locate(key)
+        _countWalk(probe, key, node, steps)
+        return node.data
+    return peek
+
+
+instrumentation.hook(LinkedList, 'get', _countedGet)
+instrumentation.hook(LinkedList, 'peek', _countedPeek)
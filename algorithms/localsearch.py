@@ -0,0 +1,147 @@
+import time
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, moves are evaluated one at a time without it
+    numpy = None
+
+
+# Local search over a route of address ids
+# A route starts at the truck's location and ends at the hub, both ends stay in place.
+# Two kinds of moves are tried until neither improves the route or the time budget runs out:
+#   2-opt   reverse the stops between two positions, replacing two legs with two shorter ones
+#   Or-opt  move a run of one to three stops, forwards or reversed, to another place in the route
+# When numpy is installed every move of a kind is evaluated at once as a matrix of distance deltas
+# and the best one is applied, otherwise the same moves are checked one by one.
+class RouteOptimizer:
+    _EPSILON = 1e-9
+    _SEGMENT_LENGTHS = (1, 2, 3)
+
+    def __init__(self, distances, time_budget=0.05):
+        self.distances = distances
+        self.time_budget = time_budget
+        self.moves = 0
+
+    # Time Complexity: O(n) where n is the number of stops
+    # Space Complexity: O(1)
+    def routeLength(self, route):
+        return sum(self.distances.distance(route[index], route[index + 1]) for index in range(len(route) - 1))
+
+    # Improve a route and return the new route, the given route is not changed
+    # Time Complexity: O(I * n^2) where I is the number of improving moves and n is the number of stops,
+    # bounded by the time budget
+    # Space Complexity: O(n^2) where n is the number of stops, for the delta matrices
+    def improve(self, route):
+        route = list(route)
+        if len(route) < 4:
+            return route
+        deadline = time.perf_counter() + self.time_budget
+        vectorized = self.distances.array is not None
+        while time.perf_counter() < deadline:
+            move = self._bestTwoOptVectorized(route) if vectorized else self._bestTwoOpt(route)
+            if move is None:
+                move = self._bestOrOptVectorized(route) if vectorized else self._bestOrOpt(route)
+            if move is None:
+                break
+            route = move
+            self.moves += 1
+        return route
+
+    # Best 2-opt move: reversing route[i..j] replaces legs (i-1, i) and (j, j+1) with (i-1, j) and (i, j+1)
+    # Time Complexity: O(n^2) where n is the number of stops, in numpy
+    # Space Complexity: O(n^2)
+    def _bestTwoOptVectorized(self, route):
+        matrix = self.distances.array
+        nodes = numpy.asarray(route)
+        previous, current, following = nodes[:-2], nodes[1:-1], nodes[2:]
+        delta = matrix[previous[:, None], current[None, :]] + matrix[current[:, None], following[None, :]] \
+            - matrix[previous, current][:, None] - matrix[current, following][None, :]
+        # only reverse runs of at least two stops, i < j
+        delta[numpy.tril_indices(len(current))] = numpy.inf
+        best = int(delta.argmin())
+        i, j = divmod(best, len(current))
+        if not delta[i, j] < -self._EPSILON:
+            return None
+        i, j = i + 1, j + 1
+        return route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+
+    # Time Complexity: O(n^2) where n is the number of stops
+    # Space Complexity: O(n)
+    def _bestTwoOpt(self, route):
+        distance = self.distances.distance
+        best, best_move = -self._EPSILON, None
+        for i in range(1, len(route) - 2):
+            removed_i = distance(route[i - 1], route[i])
+            for j in range(i + 1, len(route) - 1):
+                delta = distance(route[i - 1], route[j]) + distance(route[i], route[j + 1]) \
+                    - removed_i - distance(route[j], route[j + 1])
+                if delta < best:
+                    best, best_move = delta, (i, j)
+        if best_move is None:
+            return None
+        i, j = best_move
+        return route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+
+    # Best Or-opt move: take route[s..s+length-1] out and put it between route[p] and route[p+1]
+    # Time Complexity: O(n^2) where n is the number of stops, in numpy
+    # Space Complexity: O(n^2)
+    def _bestOrOptVectorized(self, route):
+        matrix = self.distances.array
+        nodes = numpy.asarray(route)
+        size = len(route)
+        best, best_move = -self._EPSILON, None
+        positions = numpy.arange(size - 1)
+        edge_from, edge_to = nodes[:-1], nodes[1:]
+        edge_length = matrix[edge_from, edge_to]
+        for length in self._SEGMENT_LENGTHS:
+            starts = numpy.arange(1, size - length)
+            if len(starts) == 0:
+                break
+            first, last = nodes[starts], nodes[starts + length - 1]
+            before, after = nodes[starts - 1], nodes[starts + length]
+            gain = matrix[before, first] + matrix[last, after] - matrix[before, after]
+            # the segment can not go back next to itself
+            overlap = (positions[None, :] >= starts[:, None] - 1) & (positions[None, :] <= starts[:, None] + length - 1)
+            for reverse in (False, True):
+                head, tail = (last, first) if reverse else (first, last)
+                delta = matrix[edge_from[None, :], head[:, None]] + matrix[tail[:, None], edge_to[None, :]] \
+                    - edge_length[None, :] - gain[:, None]
+                delta[overlap] = numpy.inf
+                index = int(delta.argmin())
+                row, column = divmod(index, delta.shape[1])
+                if delta[row, column] < best:
+                    best, best_move = float(delta[row, column]), (int(starts[row]), length, column, reverse)
+        return self._moveSegment(route, *best_move) if best_move else None
+
+    # Time Complexity: O(n^2) where n is the number of stops
+    # Space Complexity: O(n)
+    def _bestOrOpt(self, route):
+        distance = self.distances.distance
+        size = len(route)
+        best, best_move = -self._EPSILON, None
+        for length in self._SEGMENT_LENGTHS:
+            for start in range(1, size - length):
+                first, last = route[start], route[start + length - 1]
+                before, after = route[start - 1], route[start + length]
+                gain = distance(before, first) + distance(last, after) - distance(before, after)
+                for position in range(size - 1):
+                    if start - 1 <= position <= start + length - 1:
+                        continue
+                    edge = distance(route[position], route[position + 1])
+                    for reverse in (False, True):
+                        head, tail = (last, first) if reverse else (first, last)
+                        delta = distance(route[position], head) + distance(tail, route[position + 1]) - edge - gain
+                        if delta < best:
+                            best, best_move = delta, (start, length, position, reverse)
+        return self._moveSegment(route, *best_move) if best_move else None
+
+    # Time Complexity: O(n) where n is the number of stops
+    # Space Complexity: O(n)
+    @staticmethod
+    def _moveSegment(route, start, length, position, reverse):
+        segment = route[start:start + length]
+        if reverse:
+            segment = segment[::-1]
+        if position < start:
+            return route[:position + 1] + segment + route[position + 1:start] + route[start + length:]
+        return route[:start] + route[start + length:position + 1] + segment + route[position + 1:]
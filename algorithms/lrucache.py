@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+
+# Least Recently Used cache
+# Items are kept in the order they were last used, the least recently used ones are dropped once there are
+# more than max_entries items or their sizes add up to more than max_bytes. sizeof gives the size of a value,
+# it is only needed with max_bytes. Either limit can be None for no limit.
+# hits, misses and evictions count what happened since the cache was created.
+class LRUCache:
+    def __init__(self, max_entries=128, max_bytes=None, sizeof=None):
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("max_bytes needs a sizeof function")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def get(self, key):
+        try:
+            value, size = self._items[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    # Time Complexity: O(1) amortized, plus sizeof
+    # Space Complexity: O(1)
+    def put(self, key, value):
+        if key in self._items:
+            self.remove(key)
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        self._items[key] = (value, size)
+        self.bytes += size
+        while self._items and ((self.max_entries is not None and len(self._items) > self.max_entries) or
+                               (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            _, (_, evicted_size) = self._items.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def remove(self, key):
+        _, size = self._items.pop(key)
+        self.bytes -= size
+
+    # Time Complexity: O(n) where n is the number of items
+    # Space Complexity: O(1)
+    def clear(self):
+        self._items.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._items),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
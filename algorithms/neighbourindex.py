@@ -0,0 +1,87 @@
+import array
+import math
+
+
+# Nearest Neighbour Index
+# For every address we keep the other addresses sorted by distance, closest first, ties by address id.
+# Zero and infinite distances are left out because the greedy router never drives those legs.
+# The index is built once per distance matrix, finding the closest pending stop then only walks
+# past the stops that are closer but have nothing left to deliver.
+class NeighbourIndex:
+    # Time Complexity: O(n^2 log n) where n is the number of addresses
+    # Space Complexity: O(n^2) where n is the number of addresses
+    def __init__(self, distances=None):
+        self._neighbours = []
+        self._distances = []
+        if distances is None:
+            return
+        matrix = distances.array
+        for index in range(len(distances)):
+            row = distances[index]
+            if matrix is not None:
+                # a stable sort keeps equal distances in address id order
+                order = matrix[index].argsort(kind='stable').tolist()
+            else:
+                order = sorted(range(len(distances)), key=row.__getitem__)
+            neighbours = []
+            neighbour_distances = []
+            for neighbour in order:
+                distance = row[neighbour]
+                if distance != 0.0 and not math.isinf(distance):
+                    neighbours.append(neighbour)
+                    neighbour_distances.append(distance)
+            self._neighbours.append(neighbours)
+            self._distances.append(neighbour_distances)
+
+    # The lists of every address packed into three flat arrays: where the list of every address starts
+    # (one extra entry for the end of the last list), the neighbours and their distances
+    # Time Complexity: O(n^2) where n is the number of addresses
+    # Space Complexity: O(n^2) where n is the number of addresses
+    def toArrays(self):
+        offsets = array.array('q', [0])
+        neighbours = array.array('i')
+        distances = array.array('d')
+        for address_neighbours, address_distances in zip(self._neighbours, self._distances):
+            neighbours.extend(address_neighbours)
+            distances.extend(address_distances)
+            offsets.append(len(neighbours))
+        return offsets, neighbours, distances
+
+    # An index over the arrays from toArrays(), the arrays are sliced but not copied
+    # so they can point into a memory-mapped file
+    # Time Complexity: O(n) where n is the number of addresses
+    # Space Complexity: O(n) where n is the number of addresses
+    @classmethod
+    def fromArrays(cls, offsets, neighbours, distances):
+        index = cls()
+        neighbours, distances = memoryview(neighbours), memoryview(distances)
+        for address in range(len(offsets) - 1):
+            start, end = offsets[address], offsets[address + 1]
+            index._neighbours.append(neighbours[start:end])
+            index._distances.append(distances[start:end])
+        return index
+
+    # The count closest addresses to an address, closest first
+    # Time Complexity: O(count)
+    # Space Complexity: O(count)
+    def closest(self, address, count):
+        return list(self._neighbours[address][:count])
+
+    # Find the closest pending stop from an address
+    # pending maps the address id of every stop that still has packages to its position in the truck load,
+    # when two stops are the same distance away the one loaded first wins, just like scanning the load in order
+    # Returns (None, inf) when no pending stop can be reached
+    # Time Complexity: O(k) where k is the number of addresses closer than the answer
+    # Space Complexity: O(1)
+    def nearest(self, address, pending):
+        best = None
+        best_distance = float('inf')
+        distances = self._distances[address]
+        for position, neighbour in enumerate(self._neighbours[address]):
+            distance = distances[position]
+            if best is not None and distance != best_distance:
+                break
+            if neighbour in pending and (best is None or pending[neighbour] < pending[best]):
+                best = neighbour
+                best_distance = distance
+        return best, best_distance
@@ -1,6 +1,8 @@
 class Node:
     # because we are not allowed to use the built-in dictionary data structure
     # we will use a linked list to store the key-value pairs
+    __slots__ = ('key', 'data', 'next')
+
     def __init__(self, key, data):
         self.key = key
         self.data = data
@@ -0,0 +1,195 @@
+import array
+import math
+import mmap
+import os
+import struct
+
+from algorithms.distancematrix import DistanceMatrix
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, Floyd-Warshall runs in plain loops without it
+    numpy = None
+
+
+# All-pairs shortest paths over a distance matrix
+# The CSV holds direct mileages that do not always satisfy the triangle inequality, driving through another
+# address can be shorter than the direct leg. Floyd-Warshall finds the shortest drive between every two
+# addresses. Next to the shortest distances we keep a next-hop table: next_hop[i * n + j] is the first address
+# after i on the shortest drive from i to j (-1 when j can not be reached), so the addresses a driver passes
+# through can be listed for a manifest.
+# When numpy is installed every round of Floyd-Warshall relaxes the whole matrix at once, otherwise the
+# rounds run in plain loops.
+# The result is cached next to the CSV, data/distances.csv is cached in data/distances.paths.bin, and is
+# only used while the CSV has the hash it was computed for.
+class ShortestPaths:
+    # Cache layout: header, padding, the distances, then the next-hop table
+    # header fields: magic, version, address count, distance typecode, source hash
+    _MAGIC = b'SPTH'
+    _VERSION = 1
+    _HEADER = struct.Struct('<4sHIcx16s')
+    _ALIGNMENT = 8
+    # a drive through k must be shorter by more than this to replace the direct leg, so rounding noise
+    # in the CSV does not add detours
+    _EPSILON = 1e-9
+
+    # distances is a DistanceMatrix of the shortest distances, next_hop a flat buffer of ints, row major
+    def __init__(self, distances, next_hop):
+        self.distances = distances
+        self.next_hop = next_hop
+        self.size = len(distances)
+
+    # Run Floyd-Warshall over a DistanceMatrix
+    # Time Complexity: O(n^3) where n is the number of addresses, n rounds of O(n^2) numpy work with numpy
+    # Space Complexity: O(n^2) where n is the number of addresses
+    @classmethod
+    def compute(cls, distances):
+        size = len(distances)
+        typecode = distances.typecode
+        if distances.array is not None:
+            shortest, next_hop = cls._floydWarshallVectorized(distances.array, size)
+            flat = array.array(typecode, shortest.tobytes())
+            hops = array.array('i', next_hop.tobytes())
+        else:
+            flat, hops = cls._floydWarshall(distances, size, typecode)
+        matrix = DistanceMatrix(distances.addresses, memoryview(flat), typecode, distances.source_hash)
+        return cls(matrix, memoryview(hops))
+
+    # Time Complexity: O(n^3), as n rounds of whole matrix operations
+    # Space Complexity: O(n^2)
+    @classmethod
+    def _floydWarshallVectorized(cls, matrix, size):
+        shortest = numpy.array(matrix, copy=True)
+        next_hop = numpy.tile(numpy.arange(size, dtype=numpy.int32), (size, 1))
+        next_hop[numpy.isinf(shortest)] = -1
+        # scratch buffers reused by every round
+        through = numpy.empty_like(shortest)
+        gain = numpy.empty_like(shortest)
+        better = numpy.empty(shortest.shape, dtype=bool)
+        for k in range(size):
+            # through[i, j] is the drive from i to j through k
+            numpy.add(shortest[:, k, None], shortest[k, None, :], out=through)
+            numpy.subtract(shortest, through, out=gain)
+            numpy.greater(gain, cls._EPSILON, out=better)
+            numpy.copyto(shortest, through, where=better)
+            # a drive through k starts the way the drive to k does
+            numpy.copyto(next_hop, next_hop[:, k, None].copy(), where=better)
+        return shortest, next_hop
+
+    # Time Complexity: O(n^3)
+    # Space Complexity: O(n^2)
+    @classmethod
+    def _floydWarshall(cls, distances, size, typecode):
+        rows = [list(distances[index]) for index in range(size)]
+        hops = [[column if not math.isinf(distance) else -1 for column, distance in enumerate(row)] for row in rows]
+        for k in range(size):
+            row_k = rows[k]
+            for i in range(size):
+                to_k = rows[i][k]
+                if math.isinf(to_k):
+                    continue
+                row_i, hops_i = rows[i], hops[i]
+                hop = hops_i[k]
+                for j in range(size):
+                    through = to_k + row_k[j]
+                    if row_i[j] - through > cls._EPSILON:
+                        row_i[j] = through
+                        hops_i[j] = hop
+        flat = array.array(typecode, (distance for row in rows for distance in row))
+        next_hop = array.array('i', (hop for row in hops for hop in row))
+        return flat, next_hop
+
+    # The addresses of the shortest drive from one address to another, both ends included,
+    # an empty list when there is no drive
+    # Time Complexity: O(p) where p is the number of addresses on the drive
+    # Space Complexity: O(p)
+    def path(self, start, end):
+        if self.next_hop[start * self.size + end] == -1:
+            return []
+        path = [start]
+        while start != end and len(path) <= self.size:
+            start = self.next_hop[start * self.size + end]
+            path.append(start)
+        return path
+
+    # A route of stops with every address the truck drives through between two stops added in,
+    # what a driver manifest lists
+    # Time Complexity: O(p) where p is the number of addresses on the whole route
+    # Space Complexity: O(p)
+    def expand(self, route):
+        route = list(route)
+        if not route:
+            return []
+        expanded = [route[0]]
+        for index in range(len(route) - 1):
+            expanded.extend(self.path(route[index], route[index + 1])[1:])
+        return expanded
+
+    # Default cache file for a CSV, data/distances.csv is cached in data/distances.paths.bin
+    @staticmethod
+    def cachePathFor(csv_path):
+        return os.path.splitext(csv_path)[0] + '.paths.bin'
+
+    # The shortest paths of a DistanceMatrix loaded from csv_path, from the cache when it was computed for
+    # the same CSV and computed and cached when it was not
+    # Time Complexity: O(1) when the cache is valid, O(n^3) when it has to be computed
+    # Space Complexity: O(n^2) where n is the number of addresses, backed by the page cache when memory-mapped
+    @classmethod
+    def load(cls, distances, csv_path='data/distances.csv', cache_path=None):
+        if cache_path is None:
+            cache_path = cls.cachePathFor(csv_path)
+        try:
+            paths = cls.open(cache_path, distances.addresses)
+            if paths.distances.source_hash == distances.source_hash and \
+                    paths.distances.typecode == distances.typecode and paths.size == len(distances):
+                return paths
+        except (OSError, ValueError):
+            pass  # missing or unreadable cache, compute it again
+
+        paths = cls.compute(distances)
+        try:
+            paths.write(cache_path)
+        except OSError:
+            pass  # a read-only data directory only costs us the cache
+        return paths
+
+    # Write the shortest paths to a binary cache file, the file is replaced atomically
+    # Time Complexity: O(n^2) where n is the number of addresses
+    # Space Complexity: O(1)
+    def write(self, path):
+        header = self._HEADER.pack(self._MAGIC, self._VERSION, self.size, self.distances.typecode.encode('ascii'),
+                                   self.distances.source_hash.ljust(16, b'\0'))
+        distances = self.distances.buffer.cast('B')
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(header)
+            file.write(b'\0' * (-len(header) % self._ALIGNMENT))
+            file.write(distances)
+            file.write(b'\0' * (-len(distances) % self._ALIGNMENT))
+            file.write(self.next_hop.cast('B'))
+        os.replace(temp_path, path)
+
+    # Memory-map a cache file, addresses are those of the matrix the paths were computed for
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    @classmethod
+    def open(cls, path, addresses):
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < cls._HEADER.size:
+            raise ValueError(f'{path} is not a shortest paths cache')
+        magic, version, size, typecode, source_hash = cls._HEADER.unpack_from(mapped)
+        if magic != cls._MAGIC or version != cls._VERSION:
+            raise ValueError(f'{path} is not a shortest paths cache')
+
+        typecode = typecode.decode('ascii')
+        start = cls._HEADER.size
+        start += -start % cls._ALIGNMENT
+        end = start + size * size * array.array(typecode).itemsize
+        hops_start = end + -end % cls._ALIGNMENT
+        hops_end = hops_start + size * size * array.array('i').itemsize
+        if len(addresses) != size or len(mapped) < hops_end:
+            raise ValueError(f'{path} does not match the distance matrix')
+        view = memoryview(mapped)
+        distances = DistanceMatrix(addresses, view[start:end].cast(typecode), typecode, source_hash)
+        return cls(distances, view[hops_start:hops_end].cast('i'))
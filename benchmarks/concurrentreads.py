@@ -0,0 +1,85 @@
+# Read throughput of a hash table shared by threads answering lookups
+# Compares the chained HashTable behind one global lock, which every read has to take because every read
+# reorders a bucket, with the ConcurrentHashTable, with and without the batched move to head.
+# Run from the repository root: python -m benchmarks.concurrentreads [--threads 1 2 4 8] [--packages 10000]
+import argparse
+import random
+import threading
+import time
+
+from algorithms.hashtable import ConcurrentHashTable, HashTable
+
+_READS = 200000
+
+
+# A HashTable whose every operation takes the same lock
+class GlobalLockHashTable(HashTable):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return super().get(key)
+
+    def append(self, key, data):
+        with self._lock:
+            super().append(key, data)
+
+
+# Reads per second of threads reading the keys from the table, every thread reads its own share of the keys
+# Time Complexity: O(R * c) where R is the number of reads and c the length of a bucket
+# Space Complexity: O(R)
+def read_throughput(table, keys, threads):
+    shares = [keys[thread::threads] for thread in range(threads)]
+    start = threading.Barrier(threads + 1)
+
+    def reader(share):
+        get = table.get
+        start.wait()
+        for key in share:
+            get(key)
+
+    workers = [threading.Thread(target=reader, args=(share,)) for share in shares]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return len(keys) / (time.perf_counter() - started)
+
+
+# Time Complexity: O(N + R * T) where N is the number of packages, R of reads and T of thread counts
+# Space Complexity: O(N + R)
+def run(thread_counts=(1, 2, 4, 8), package_count=10000, reads=_READS, bucket_size=61, seed=0):
+    randomizer = random.Random(seed)
+    # status queries keep asking about the same few packages, so most reads go to a hot tenth of the keys
+    hot = max(package_count // 10, 1)
+    keys = [randomizer.randrange(1, hot + 1) if randomizer.random() < 0.8 else randomizer.randrange(1, package_count + 1)
+            for _ in range(reads)]
+    tables = (
+        ('HashTable, global lock', lambda: GlobalLockHashTable(bucket_size)),
+        ('ConcurrentHashTable', lambda: ConcurrentHashTable(bucket_size)),
+        ('ConcurrentHashTable, batched move to head', lambda: ConcurrentHashTable(bucket_size, move_to_front=True)),
+    )
+    results = []
+    for name, make in tables:
+        for threads in thread_counts:
+            table = make()
+            for key in range(1, package_count + 1):
+                table.append(key, key)
+            results.append((name, threads, read_throughput(table, keys, threads)))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare multi-threaded read throughput of the hash tables')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--packages', type=int, default=10000)
+    parser.add_argument('--reads', type=int, default=_READS)
+    arguments = parser.parse_args()
+
+    print(f"{'Table':<44}{'Threads':>8}{'Reads/s':>14}")
+    for name, threads, per_second in run(arguments.threads, arguments.packages, arguments.reads):
+        print(f'{name:<44}{threads:>8}{per_second:>14,.0f}')
@@ -0,0 +1,178 @@
+# Load generator for the query service in server.py
+# Opens a number of connections and keeps every one of them busy with a mix of status, package and mileage
+# queries at random times of the day, then reports queries per second and latency percentiles.
+# A share of the queries asks for another variant of the day (optimized, deadline aware, shortest paths).
+# The server simulates a variant the first time it is asked for and again once it fell out of its cache, so
+# these queries measure the runs of the day in the executor; their latencies are also reported on their own.
+# Run from the repository root against a running server:
+#     python -m benchmarks.loadgen [--port 8765 | --unix PATH] [--connections 16] [--requests 5000]
+# or let it start a local server of its own with --spawn, --max-days sets the size of its cache of days so
+# variants keep being evicted and simulated again.
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+
+# share of each kind of query in the mix, status returns every package so it is the expensive one
+_MIX = (('package', 0.6), ('mileage', 0.3), ('status', 0.1))
+# variants of the day other than the default one, and the share of queries asking for one of them
+_VARIANTS = (
+    {'optimize': True},
+    {'deadline_aware': True},
+    {'shortest_paths': True},
+    {'optimize': True, 'deadline_aware': True},
+    {'optimize': True, 'shortest_paths': True},
+    {'deadline_aware': True, 'shortest_paths': True},
+    {'optimize': True, 'deadline_aware': True, 'shortest_paths': True},
+)
+_VARIANT_SHARE = 0.05
+_LATENCY_PERCENTILES = (50, 90, 99, 99.9)
+
+
+# A random query, times are between 8:00 AM and 5:59 PM
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def make_query(randomizer, package_count, variant_share=_VARIANT_SHARE):
+    op = randomizer.choices([op for op, _ in _MIX], [weight for _, weight in _MIX])[0]
+    hour = randomizer.randrange(8, 18)
+    query = {'op': op, 'time': f'{hour % 12 or 12}:{randomizer.randrange(60):02d} {"AM" if hour < 12 else "PM"}'}
+    if op == 'package':
+        query['package'] = randomizer.randrange(1, package_count + 1)
+    if randomizer.random() < variant_share:
+        query['options'] = randomizer.choice(_VARIANTS)
+    return query
+
+
+# Latency at a percentile, nearest rank over sorted latencies
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def percentile(latencies, percent):
+    if not latencies:
+        return 0.0
+    rank = max(int(len(latencies) * percent / 100 + 0.5), 1)
+    return latencies[min(rank, len(latencies)) - 1]
+
+
+async def _connect(host, port, unix_path):
+    if unix_path is not None:
+        return await asyncio.open_unix_connection(unix_path)
+    return await asyncio.open_connection(host, port)
+
+
+# Send queries one after the other over one connection and record the latency of every answer,
+# the latencies of queries for another variant of the day also go to variant_latencies
+async def _client(host, port, unix_path, requests, seed, package_count, latencies, variant_latencies, errors,
+                  variant_share):
+    reader, writer = await _connect(host, port, unix_path)
+    randomizer = random.Random(seed)
+    try:
+        for request_id in range(requests):
+            query = make_query(randomizer, package_count, variant_share)
+            query['id'] = request_id
+            started = time.perf_counter()
+            writer.write(json.dumps(query).encode('utf-8') + b'\n')
+            await writer.drain()
+            answer = json.loads(await reader.readline())
+            latency = time.perf_counter() - started
+            latencies.append(latency)
+            if 'options' in query:
+                variant_latencies.append(latency)
+            if not answer.get('ok') or answer.get('id') != request_id:
+                errors.append(answer)
+    finally:
+        writer.close()
+
+
+# Run the load and return the report
+# requests is the total over all connections
+# Time Complexity: O(R log R) where R is the number of requests, for the percentiles
+# Space Complexity: O(R)
+async def run(host='127.0.0.1', port=8765, unix_path=None, connections=16, requests=5000, seed=0,
+              variant_share=_VARIANT_SHARE):
+    reader, writer = await _connect(host, port, unix_path)
+    writer.write(b'{"op": "stats"}\n')
+    await writer.drain()
+    package_count = json.loads(await reader.readline())['result']['packages']
+    writer.close()
+
+    latencies = []
+    variant_latencies = []
+    errors = []
+    share, extra = divmod(requests, connections)
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, unix_path, share + (index < extra), seed + index, package_count,
+                                   latencies, variant_latencies, errors, variant_share)
+                           for index in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    variant_latencies.sort()
+    return {
+        'connections': connections,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': elapsed,
+        'qps': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_ms': {f'p{percent:g}': percentile(latencies, percent) * 1000 for percent in _LATENCY_PERCENTILES},
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        'variant_requests': len(variant_latencies),
+        'variant_latency_ms': {f'p{percent:g}': percentile(variant_latencies, percent) * 1000
+                               for percent in _LATENCY_PERCENTILES},
+    }
+
+
+# Start server.py on a free port in a child process, returns the process and the port
+# max_days is the size of the cache of days of the server, None for its default
+def spawn_server(max_days=None):
+    command = [sys.executable, 'server.py', '--port', '0']
+    if max_days is not None:
+        command += ['--max-days', str(max_days)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('listening on '):
+        process.kill()
+        raise RuntimeError(f"server did not start: {line!r}")
+    return process, int(line.rsplit(':', 1)[1])
+
+
+def print_report(report):
+    print(f"{report['requests']} queries over {report['connections']} connections in {report['seconds']:.2f}s, "
+          f"{report['errors']} errors")
+    print(f"{report['qps']:,.0f} queries per second")
+    print('latency ' + '  '.join(f'{name} {value:.2f}ms' for name, value in report['latency_ms'].items()) +
+          f"  max {report['max_ms']:.2f}ms")
+    if report['variant_requests']:
+        print(f"{report['variant_requests']} queries for other variants of the day, latency " +
+              '  '.join(f'{name} {value:.2f}ms' for name, value in report['variant_latency_ms'].items()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the throughput and latency of the query service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='connect to this Unix socket path instead of TCP')
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--variant-share', type=float, default=_VARIANT_SHARE,
+                        help='share of queries for another variant of the day')
+    parser.add_argument('--spawn', action='store_true', help='start a local server for the run')
+    parser.add_argument('--max-days', type=int, help='cache size of the spawned server, small to keep re-simulating')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    arguments = parser.parse_args()
+
+    server = None
+    if arguments.spawn:
+        server, arguments.port = spawn_server(arguments.max_days)
+    try:
+        report = asyncio.run(run(arguments.host, arguments.port, arguments.unix, arguments.connections,
+                                 arguments.requests, variant_share=arguments.variant_share))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print_report(report)
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,77 @@
+# Memory used per package by each way of storing the package table
+# Run from the repository root: python -m benchmarks.packagememory [number of packages]
+import sys
+import tracemalloc
+
+from algorithms.hashtable import HashTable
+from models.package import Package
+from models.packagestore import PackageStore
+
+_DEADLINES = ('EOD', 'EOD', 'EOD', '10:30 AM', '9:00 AM', '5:00 PM')
+_FLAGS = ('', '', '', '', 'Can only be on truck 2', 'Delayed on flight---will not arrive to depot until 9:05 am')
+
+
+# A package like the ones before __slots__, every instance carries its own __dict__
+class DictPackage:
+    def __init__(self, package):
+        for name in Package.__slots__:
+            setattr(self, name, getattr(package, name))
+
+
+# count packages spread over a few hundred addresses, like a large manifest
+def make_packages(count):
+    for package_id in range(1, count + 1):
+        package = Package(package_id, f"{package_id % 400} W {package_id % 37 * 100} S", 'Salt Lake City',
+                          84100 + package_id % 20, _DEADLINES[package_id % len(_DEADLINES)], package_id % 50 + 1,
+                          _FLAGS[package_id % len(_FLAGS)])
+        package.address_id = package_id % 400
+        yield package
+
+
+def hash_table_of_dicts(count):
+    table = HashTable()
+    for package in make_packages(count):
+        table.append(package.id, DictPackage(package))
+    return table
+
+
+def hash_table_of_slots(count):
+    table = HashTable()
+    for package in make_packages(count):
+        table.append(package.id, package)
+    return table
+
+
+def package_store(count):
+    store = PackageStore()
+    for package in make_packages(count):
+        store.append(package.id, package)
+    return store
+
+
+# Bytes still allocated once the table is built, divided by the number of packages
+def bytes_per_package(build, count):
+    tracemalloc.start()
+    table = build(count)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del table
+    return used / count
+
+
+def run(count=100000):
+    results = []
+    for name, build in (('HashTable of __dict__ packages', hash_table_of_dicts),
+                        ('HashTable of __slots__ packages', hash_table_of_slots),
+                        ('Columnar PackageStore', package_store)):
+        results.append((name, bytes_per_package(build, count)))
+    return results
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    results = run(count)
+    baseline = results[0][1]
+    print(f"{'Store':<34}{'Bytes/package':>15}{'vs __dict__':>13}")
+    for name, per_package in results:
+        print(f"{name:<34}{per_package:>15.1f}{per_package / baseline:>12.0%}")
@@ -0,0 +1,212 @@
+# Benchmark suite over synthetic cities of growing size
+# Every benchmark is timed as the best of a few repeats and the results are written as JSON,
+# so two runs can be compared with --compare to spot regressions.
+# Run from the repository root: python -m benchmarks.suite [--sizes 50x500x3 200x2000x8] [--output FILE]
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from algorithms.deadlinerouting import DeadlineRouter
+from algorithms.distancematrix import DistanceMatrix
+from algorithms.hashtable import HashTable, OpenAddressingHashTable
+from algorithms.linkedlist import LinkedList
+from algorithms.localsearch import RouteOptimizer
+from algorithms.shortestpaths import ShortestPaths
+from benchmarks.synthetic import generate, make_trucks
+from main import deliver_with, load_distance_data, load_page_data
+from models.assignment import LoadPlanner
+from models.dispatch import Dispatch
+from models.packagestore import PackageStore
+from models.report import ReportFormat, ReportWriter
+from models.simulation import Simulation
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, the suite then measures the pure python paths
+    numpy = None
+
+# addresses x packages x trucks
+DEFAULT_SIZES = ('50x500x3', '200x2000x8', '500x10000x20', '300x5000x50')
+_LOOKUPS = 10000
+_LINKED_LIST_SIZE = 1000
+
+
+# Best wall time of repeats runs of work, setup runs before every repeat and is not timed
+# Time Complexity: O(repeats) runs of work
+# Space Complexity: O(1)
+def best_time(work, repeats, setup=None):
+    best = float('inf')
+    for _ in range(repeats):
+        argument = setup() if setup is not None else None
+        started = time.perf_counter()
+        work(argument)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def fresh_world(distances_path, packages_path, store=None):
+    addresses, distances = load_distance_data(distances_path)
+    packages = load_page_data(addresses, path=packages_path, store=store)
+    return addresses, distances, packages
+
+
+# Every benchmark for one size, as a list of (name, number of items, seconds)
+# Time Complexity: O(A^2 + N * D) where A is the number of addresses, N the number of packages and D the
+# cost of a delivery
+# Space Complexity: O(A^2 + N)
+def run_size(directory, address_count, package_count, truck_count, repeats):
+    distances_path, packages_path = generate(directory, address_count, package_count, truck_count=truck_count)
+    results = []
+
+    def record(name, items, seconds):
+        results.append((name, items, seconds))
+
+    record('distances csv parse', address_count * address_count,
+           best_time(lambda _: DistanceMatrix.fromCsv(distances_path), repeats))
+    DistanceMatrix.load(distances_path)
+    record('distances cache open', address_count * address_count,
+           best_time(lambda _: DistanceMatrix.load(distances_path), repeats))
+    addresses, distances = load_distance_data(distances_path)
+    record('shortest paths compute', address_count * address_count,
+           best_time(lambda _: ShortestPaths.compute(distances), repeats))
+    record('ingest into HashTable', package_count,
+           best_time(lambda _: load_page_data(addresses, path=packages_path), repeats))
+    record('ingest into PackageStore', package_count,
+           best_time(lambda _: load_page_data(addresses, path=packages_path, store=PackageStore()), repeats))
+
+    randomizer = random.Random(0)
+    keys = [randomizer.randrange(1, package_count + 1) for _ in range(_LOOKUPS)]
+    for name, table_type in (('HashTable', HashTable), ('OpenAddressingHashTable', OpenAddressingHashTable)):
+        def fill(_, table_type=table_type):
+            table = table_type()
+            for key in range(1, package_count + 1):
+                table.append(key, key)
+            return table
+
+        record(f'{name} append', package_count, best_time(fill, repeats))
+        table = fill(None)
+        record(f'{name} get', _LOOKUPS, best_time(lambda _: [table.get(key) for key in keys], repeats))
+
+    def linked_list(_):
+        nodes = LinkedList()
+        for key in range(_LINKED_LIST_SIZE):
+            nodes.append(key, key)
+        return nodes
+
+    linked = linked_list(None)
+    list_keys = [randomizer.randrange(_LINKED_LIST_SIZE) for _ in range(_LOOKUPS // 10)]
+    record('LinkedList get', len(list_keys), best_time(lambda _: [linked.get(key) for key in list_keys], repeats))
+
+    def dispatch_setup():
+        _, _, packages = fresh_world(distances_path, packages_path)
+        trucks = make_trucks(truck_count)
+        return Dispatch(0, packages, addresses, distances), trucks
+
+    dispatch, _ = dispatch_setup()
+    record('HashTable lookup indexed', 100,
+           best_time(lambda _: [dispatch.packages.lookup(deadline='EOD', truck=None) for _ in range(100)], repeats))
+
+    record('HashTable str', package_count, best_time(lambda _: str(dispatch.packages), repeats))
+    for report_format in ReportFormat.FORMATS:
+        record(f'report {report_format}', package_count,
+               best_time(lambda _: ReportWriter(io.StringIO(), report_format).write(dispatch.packages), repeats))
+
+    def first_wave_routes(setup, optimize=False, deadline_aware=False):
+        dispatch, trucks = setup
+        planner = LoadPlanner(dispatch.packages, trucks, distances)
+        for truck, waves in zip(trucks, planner.plan()):
+            dispatch.loadTruckWithPackageList(truck, waves[0])
+        optimizer = RouteOptimizer(distances) if optimize else None
+        router = DeadlineRouter(distances) if deadline_aware else None
+        started = time.perf_counter()
+        for truck in trucks:
+            dispatch.planStops(truck, optimizer, router)
+        return time.perf_counter() - started
+
+    for name, options in (('greedy', {}), ('deadline aware', {'deadline_aware': True}),
+                          ('optimized', {'optimize': True})):
+        seconds = min(first_wave_routes(dispatch_setup(), **options) for _ in range(repeats))
+        record(f'route first wave {name}', truck_count, seconds)
+
+    record('LoadPlanner plan', package_count,
+           best_time(lambda setup: LoadPlanner(setup[0].packages, setup[1], distances).plan(), repeats, dispatch_setup))
+    record('full day deliver', package_count,
+           best_time(lambda setup: deliver_with(*setup), repeats, dispatch_setup))
+
+    def simulate(setup):
+        dispatch, trucks = setup
+        planner = LoadPlanner(dispatch.packages, trucks, distances)
+        Simulation(dispatch, trucks, planner.plan(), planner).run()
+
+    record('full day simulation', package_count, best_time(simulate, repeats, dispatch_setup))
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': numpy.__version__ if numpy is not None else None,
+    }
+
+
+# Time Complexity: O(S) runs of every benchmark where S is the number of sizes
+# Space Complexity: O(S) results
+def run(sizes=DEFAULT_SIZES, repeats=3):
+    report = {'environment': environment(), 'results': []}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            address_count, package_count, truck_count = (int(part) for part in size.split('x'))
+            print(f'size {size}', file=sys.stderr)
+            for name, items, seconds in run_size(os.path.join(directory, size), address_count, package_count,
+                                                 truck_count, repeats):
+                report['results'].append({'benchmark': name, 'size': size, 'items': items, 'seconds': seconds,
+                                          'per_item_us': seconds / items * 1e6 if items else None})
+    return report
+
+
+def print_report(report, baseline=None):
+    previous = {}
+    if baseline is not None:
+        previous = {(result['benchmark'], result['size']): result['seconds'] for result in baseline['results']}
+    print(f"{'Benchmark':<36}{'Size':>16}{'Seconds':>12}{'us/item':>12}" + (f"{'vs base':>10}" if previous else ''))
+    for result in report['results']:
+        line = f"{result['benchmark']:<36}{result['size']:>16}{result['seconds']:>12.4f}{result['per_item_us']:>12.2f}"
+        before = previous.get((result['benchmark'], result['size']))
+        if before:
+            line += f"{result['seconds'] / before:>9.2f}x"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the data structures, loaders, routing and simulation')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='ADDRESSESxPACKAGESxTRUCKS')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    arguments = parser.parse_args()
+
+    report = run(arguments.sizes, arguments.repeats)
+    baseline = None
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(report, file, indent=2)
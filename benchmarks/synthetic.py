@@ -0,0 +1,137 @@
+# Deterministic synthetic cities and package manifests for benchmarks
+# The same size and seed always give the same files, in the layout of the files in data/.
+# Run from the repository root: python -m benchmarks.synthetic DIRECTORY ADDRESSES PACKAGES [TRUCKS]
+import csv
+import os
+import random
+import sys
+
+from models.flag import Flag
+from models.truck import Truck
+
+# Share of packages with each deadline and note, close to the sample manifest
+_DEADLINES = (('EOD', 0.6), ('10:30 AM', 0.3), ('9:00 AM', 0.05), ('12:00 PM', 0.05))
+_TRUCK_ONLY = 0.1
+_TRUCK_ONLY_NOTE = 'Can only be on truck {}'
+_DELAYED = 0.1
+_GROUPED = 0.05
+_GROUP_SIZE = 3
+# Addresses sit on a grid of blocks a tenth of a mile apart
+_BLOCK = 0.1
+_GRID = 200
+
+
+# Every address gets a name, a street address, a zip and a place on the grid, the first one is the hub
+# Time Complexity: O(A) where A is the number of addresses
+# Space Complexity: O(A)
+def generate_city(address_count, seed=0):
+    randomizer = random.Random(seed)
+    places = set()
+    city = []
+    while len(city) < address_count:
+        x, y = randomizer.randrange(_GRID), randomizer.randrange(_GRID)
+        if (x, y) in places:
+            continue
+        places.add((x, y))
+        index = len(city)
+        name = 'Hub' if index == 0 else f'Stop {index}'
+        city.append((name, f'{x * 10 + 1} W {y * 10 + 1} S', f'{84100 + (x + y) % 60}', x, y))
+    return city
+
+
+# Street distance between two addresses: blocks east-west plus blocks north-south
+# Distances on a grid always satisfy the triangle inequality, and a whole number of blocks
+# is written to the CSV exactly
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def blocks_between(place1, place2):
+    return abs(place1[3] - place2[3]) + abs(place1[4] - place2[4])
+
+
+# Write the lower-triangular distance table of data/distances.csv: a header row of location names,
+# then one row per location with its name and address, its address and zip, and the distances to
+# every location up to itself
+# Time Complexity: O(A^2) where A is the number of addresses
+# Space Complexity: O(A)
+def write_distances_csv(path, city):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['DISTANCE BETWEEN HUBS IN MILES', ''] + [f'{name}\n{address}' for name, address, *_ in city])
+        for index, place in enumerate(city):
+            name, address, zip_code = place[:3]
+            row = [f'{name}\n {address}', f' {address}\n({zip_code})']
+            row.extend(f'{blocks_between(place, other) * _BLOCK:.1f}' for other in city[:index + 1])
+            row.extend([''] * (len(city) - index - 1))
+            writer.writerow(row)
+
+
+# Write a manifest in the layout of data/packages.csv with a mix of deadlines and notes
+# Grouped packages are written as a run of packages that must be delivered with each other
+# Packages that can only go on one truck are spread over every truck of make_trucks(truck_count) but the
+# first, so a large fleet does not pile all of them onto truck 2. With two trucks they all go on truck 2.
+# Time Complexity: O(N) where N is the number of packages
+# Space Complexity: O(1)
+def write_packages_csv(path, city, package_count, seed=0, truck_count=2):
+    randomizer = random.Random(seed)
+    deadlines = [deadline for deadline, _ in _DEADLINES]
+    weights = [weight for _, weight in _DEADLINES]
+    restricted_trucks = max(truck_count, 2) - 1
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Package ID', 'Address', 'City ', 'State', 'Zip', 'Delivery Deadline', 'Mass KILO',
+                         'PageSpecial Notes'])
+        package_id = 1
+        while package_id <= package_count:
+            roll = randomizer.random()
+            group = 1
+            if roll < _GROUPED and package_id + _GROUP_SIZE - 1 <= package_count:
+                group = _GROUP_SIZE
+            for member in range(group):
+                _, address, zip_code, *_ = city[randomizer.randrange(1, len(city))]
+                note = ''
+                if group > 1:
+                    others = [str(package_id - member + other) for other in range(group) if other != member]
+                    note = f'Must be delivered with {", ".join(others)}'
+                elif roll < _GROUPED + _TRUCK_ONLY:
+                    note = _TRUCK_ONLY_NOTE.format(2 + package_id % restricted_trucks)
+                elif roll < _GROUPED + _TRUCK_ONLY + _DELAYED:
+                    note = Flag.DELAYED
+                deadline = randomizer.choices(deadlines, weights)[0]
+                writer.writerow([package_id, address, 'Salt Lake City', 'UT', zip_code, deadline,
+                                 randomizer.randint(1, 90), note])
+                package_id += 1
+
+
+# A fleet of trucks at the hub, leaving every 15 minutes from 8:00, truck 2 is always in the fleet
+# The start is set on the truck clock directly, a large fleet keeps leaving into the afternoon and evening
+# Time Complexity: O(K) where K is the number of trucks
+# Space Complexity: O(K)
+def make_trucks(truck_count, hub=0):
+    trucks = []
+    for index in range(max(truck_count, 2)):
+        truck = Truck(index + 1, current_location=hub)
+        truck.minutes += 15 * index
+        trucks.append(truck)
+    return trucks
+
+
+# Write a city and a manifest into a directory and return the paths of the distance and package files
+# truck_count is the size of the fleet the manifest is for, see write_packages_csv
+# Time Complexity: O(A^2 + N) where A is the number of addresses and N is the number of packages
+# Space Complexity: O(A)
+def generate(directory, address_count, package_count, seed=0, truck_count=2):
+    os.makedirs(directory, exist_ok=True)
+    city = generate_city(address_count, seed)
+    distances_path = os.path.join(directory, 'distances.csv')
+    packages_path = os.path.join(directory, 'packages.csv')
+    write_distances_csv(distances_path, city)
+    write_packages_csv(packages_path, city, package_count, seed, truck_count)
+    return distances_path, packages_path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (4, 5):
+        print('usage: python -m benchmarks.synthetic DIRECTORY ADDRESSES PACKAGES [TRUCKS]')
+        sys.exit(1)
+    trucks = int(sys.argv[4]) if len(sys.argv) == 5 else 2
+    print(*generate(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), truck_count=trucks), sep='\n')
@@ -1,113 +1,258 @@
 # Author: Nicholas Ollis
 # Student ID: #011097828
-import csv
 import datetime
+import sys
 
+from algorithms.addressregistry import AddressRegistry
+from algorithms.deadlinerouting import DeadlineRouter
+from algorithms.distancematrix import DistanceMatrix
 from algorithms.hashtable import HashTable
+from algorithms import instrumentation
+from algorithms.localsearch import RouteOptimizer
+from algorithms.shortestpaths import ShortestPaths
+from models import clock
+from models.assignment import LoadPlanner
+from models.ingest import IngestReport, ingest_packages
+from models.packagestore import PackageStore
+from models.report import ReportFormat, ReportWriter
+from models.resultcache import ResultCache
+from models.snapshot import WorldSnapshot
 from models.package import Package
 from models.truck import Truck
 from models.dispatch import Dispatch
+from models.simulation import Simulation
 
 
 # read data from package.csv and load into our hash table
+# when an address registry is given every package also gets the integer id of its address
+# The file is streamed in chunks, bad rows are collected in the report instead of stopping the load,
+# pass an IngestReport to look at them afterwards. Without one the number of bad rows is printed to stderr.
+# The packages go into a HashTable unless another store is given, for example a columnar PackageStore
 # Time Complexity: O(n) where n is the number of packages
 # Space Complexity: O(n) where n is the number of packages
-def load_page_data():
-    packages = HashTable()
-    with open('data/packages.csv') as file:
-        reader = csv.reader(file)
-        next(reader)  # skip header row
-        for row in reader:
-            try:
-                package = Package(int(row[0]), row[1], row[2], int(row[4]), row[5], int(row[6]),
-                                  row[7])  # todo: classify flags
-                packages.append(package.id, package)
-            except ValueError as e:
-                print(f"Problem loading the package with id: {row[0]} into the hash table.\n {e}")
+def load_page_data(addresses=None, report=None, path='data/packages.csv', store=None):
+    packages = HashTable() if store is None else store
+    ingest = ingest_packages(path, packages, addresses, report=report)
+    if report is None:
+        report_bad_rows(path, ingest)
     return packages
 
-# reads data from distances.csv and loads into a list of addresses and a list of distances.
-# distance is a multidimensional list where the first index is the address and the second index
-# is the other address we want the distance too.
-# Time Complexity: O(n^2) where n is the number of addresses
+# Hand the ingest report of a package file to the caller's report, or print how many rows were bad to stderr
+# when the caller did not ask for one, so bad rows are never dropped without a word
+# Time Complexity: O(E) where E is the number of errors kept in the report
+# Space Complexity: O(1)
+def report_bad_rows(path, ingest, report=None):
+    if report is not None:
+        report.merge(ingest)
+    elif ingest.error_count:
+        print(f"{path}: skipped {ingest.error_count} bad package rows of {ingest.rows}", file=sys.stderr)
+
+# reads data from distances.csv and loads into an address registry and a distance matrix.
+# the registry gives every address an integer id, which is also its row and column in the matrix.
+# The parsed matrix is cached in data/distances.bin, later runs memory-map it.
+# Time Complexity: O(n^2) where n is the number of addresses, O(n) once the cache exists
 # Space Complexity: O(n^2) where n is the number of addresses
-def load_distance_data():
-    addresses = []
-    address_indices = {}
-    distances = []
-    with open('data/distances.csv') as file:
-        reader = csv.reader(file)
-        next(reader)  # skip header row
-        for index, row in enumerate(reader):
-            row[0] = row[0].split('\n')[1].strip()
-            addresses.append(row[0])
-            address_indices[row[0]] = index
-            distances.append([float(dist) for dist in row[2:]])
-
-    return addresses, distances, address_indices
+def load_distance_data(path='data/distances.csv'):
+    distances = DistanceMatrix.load(path)
+    addresses = AddressRegistry(distances.addresses)
+    return addresses, distances
+
+# Loads the addresses, distances and packages from the world snapshot in data/world.bin
+# The snapshot is only used while both CSVs have the hash it was written for, otherwise the CSVs
+# are parsed and the snapshot is written again. The packages come back in a columnar PackageStore.
+# The snapshot keeps the ingest report of the package CSV, the bad rows are reported like load_page_data does.
+# Time Complexity: O(N + A) to hash the CSVs and copy the package columns, O(N + A^2 log A) when they are parsed
+# Space Complexity: O(N + A^2) where N is the number of packages and A is the number of addresses
+def load_world(snapshot_path='data/world.bin', distances_path='data/distances.csv',
+               packages_path='data/packages.csv', report=None):
+    source_hash = WorldSnapshot.hashSources(distances_path, packages_path)
+    try:
+        world = WorldSnapshot.open(snapshot_path)
+        if world.source_hash == source_hash:
+            report_bad_rows(packages_path, world.report, report)
+            return world.addresses, world.distances, world.packages
+    except (OSError, ValueError, KeyError):
+        pass  # missing or unreadable snapshot, rebuild it
+
+    addresses, distances = load_distance_data(distances_path)
+    ingest = IngestReport()
+    packages = load_page_data(addresses, ingest, packages_path, PackageStore())
+    report_bad_rows(packages_path, ingest, report)
+    try:
+        WorldSnapshot(addresses, distances, packages, source_hash, ingest).write(snapshot_path)
+    except OSError:
+        pass  # a read-only data directory only costs us the snapshot
+    return addresses, distances, packages
+
+# The shortest drive between every two addresses, which can go through other addresses when that is shorter
+# than the direct mileage in the CSV. Computed once per distance CSV and cached in data/distances.paths.bin.
+# Time Complexity: O(1) when the cache is valid, O(A^3) to compute where A is the number of addresses
+# Space Complexity: O(A^2) where A is the number of addresses
+def load_shortest_paths(distances, distances_path='data/distances.csv'):
+    return ShortestPaths.load(distances, distances_path)
 
 # Our main function for delivering packages
+# The load planner builds the truck loads from the package notes and deadlines, a plan can also be
+# passed in as one list of waves (lists of package ids) per truck.
+# Every truck runs its wave, and the next wave only starts once all trucks are back at the hub.
+# With deadline_aware the stops of every wave are ordered around the package deadlines instead of distance alone,
+# with optimize the route of every wave is shortened with 2-opt and Or-opt moves before the truck leaves.
+# With shortest_paths the trucks are routed on the shortest drives between addresses instead of the direct
+# mileages, dispatch.fullRoute() then lists the addresses a truck drives through between its stops.
 # Time Complexity: O(N^2+A^2) where N is the number of packages and A is the number of Addresses
 # If N >> A, then the time complexity is O(N^2)
 # We could also move load_page_data() and load_distance_data() outside of this function to reduce the time complexity
 # Due to use avoid loops in this function, we condense the time complexity to O(n^2) as it is the most expensive
 # Space Complexity: O(A^2) A is the number of addresses.
-def deliver(end_time=None):
-    # Load in the packages
-    packages = load_page_data() # Time Complexity: O(n) where n is the number of packages
-    # Load in the distances
-    addresses, distances, address_indices = load_distance_data() # Time Complexity: O(n) where n is the number of addresses
-
-    HUB = addresses[0]  # the hub is the first address in the list
-
-    truck1_package_logs = [
-        [13, 14, 15, 16, 19, 20, 39, 21, 34, 7, 29, 27, 35, 37, 30, 8],
-        [24, 22, 11, 23, 12]
-    ]
+def deliver(end_time=None, plan=None, optimize=False, deadline_aware=False, shortest_paths=False):
+    # Load in the distances and packages, from the snapshot when the CSVs have not changed
+    with instrumentation.phase('load'):
+        addresses, distances, packages = load_world() # Time Complexity: O(n) where n is the number of packages
+        paths = load_shortest_paths(distances) if shortest_paths else None
 
-    truck2_package_logs = [
-        [25, 26, 6, 28, 31, 32, 1, 4, 40, 17, 36, 18],
-        [10, 5, 38, 3, 9, 2, 33]
-    ]
-
-    # if end_time is before 9:05 am, then we avoid loading truck 2 as it will not be used
-    load_truck2 = True if end_time == None or datetime.datetime.combine(datetime.date.today(), end_time) >= \
-                          datetime.datetime.combine(datetime.date.today(),
-                                                    datetime.datetime.strptime('9:05 am', '%I:%M %p').time()) else False
+    HUB = 0  # the hub is the first address in the list
 
     # Create our trucks and dispatch
     truck1 = Truck(1, current_location=HUB)
     truck2 = Truck(2, current_location=HUB, start_time='9:05')
-    dispatch = Dispatch(HUB, packages, addresses, address_indices, distances)
+    trucks = [truck1, truck2]
+    dispatch = Dispatch(HUB, packages, addresses, distances, paths)
+    deliver_with(dispatch, trucks, end_time, plan, optimize, deadline_aware)
+    return (dispatch, truck1, truck2)
+
+# Runs the day for a dispatch and trucks that are already set up, used by deliver() and the scenario runner
+# A planner can be passed in to build the loads another way, by default the packages of the dispatch are planned
+# Time Complexity: O(N^2+A^2) where N is the number of packages and A is the number of Addresses
+# Space Complexity: O(A^2) A is the number of addresses.
+def deliver_with(dispatch, trucks, end_time=None, plan=None, optimize=False, deadline_aware=False, planner=None):
+    distances = dispatch.distances
+    # Build the truck loads
+    with instrumentation.phase('assign'):
+        if planner is None:
+            planner = LoadPlanner(dispatch.packages, trucks, distances, dispatch.hub,
+                                  corrected=dispatch.correctedAddressIds()) # Time Complexity: O(W * (N + A)) where W is the number of waves
+        if plan is None:
+            plan = planner.plan()
+    optimizer = RouteOptimizer(distances) if optimize else None
+    router = DeadlineRouter(distances) if deadline_aware else None
+    # trucks leaving at the start of the day are loaded before it starts so their packages show as en route at any time
+    day_start = min(truck.minutes for truck in trucks)
+    # Wrong addresses are corrected at the correction time, whatever wave the trucks are on then
+    # The correction is applied once the day has run up to it, so it is recorded at its own time
+    correction = clock.minutes_of(planner.correction_time)
+    if end_time is not None and clock.is_after(correction, clock.minutes_of(end_time)):
+        correction = None
+
+    def correct_by(minutes):
+        nonlocal correction
+        if correction is not None and not clock.is_after(correction, minutes):
+            dispatch.updateAddress(correction) # Time Complexity: O(M) where M is the number of wrong addresses
+            correction = None
 
-    # Load the trucks with the packages
-    dispatch.loadTruckWithPackageList(truck1, truck1_package_logs[0]) # Time Complexity: O(n) where n is the number of packages
-    if load_truck2:
-        dispatch.loadTruckWithPackageList(truck2, truck2_package_logs[0])   # Time Complexity: O(n) where n is the number of packages
+    for wave_index in range(max(len(waves) for waves in plan)):
+        if wave_index > 0:
+            correct_by(max(truck.minutes for truck in trucks))
+            # The next wave only starts once all trucks are back at the hub
+            dispatch.timeline.holdUntil(max(truck.minutes for truck in trucks))
 
-    # Deliver the packages
-    success1 = dispatch.truckDeliverPackages(truck1, end_time)  # Time Complexity: O(n^2) where n is the number of addresses and k is the number of packages
-    success2 = dispatch.truckDeliverPackages(truck2, end_time)  # Time Complexity: O(n^2) where n is the number of addresses and k is the number of packages
+        # Load the trucks with the packages
+        with instrumentation.phase('assign'):
+            for truck, waves in zip(trucks, plan):
+                wave = waves[wave_index] if wave_index < len(waves) else []
+                if wave_index == 0 and truck.minutes == day_start:
+                    dispatch.loadTruckWithPackageList(truck, wave, at_time=0.0) # Time Complexity: O(n) where n is the number of packages
+                    continue
+                # the truck waits at the hub until all of its packages are ready
+                truck.waitUntil(planner.waveReadyTime(wave))
+                correct_by(truck.minutes)
+                # a truck leaving after the end time is never loaded
+                if end_time is None or not clock.is_after(truck.minutes, clock.minutes_of(end_time)):
+                    dispatch.loadTruckWithPackageList(truck, wave) # Time Complexity: O(n) where n is the number of packages
 
-    # This is our logic check if we have hit the end time request by the user and need to return the program early
-    if not success1 or not success2:
-        return (dispatch, truck1, truck2)
+        # Deliver the packages
+        # Time Complexity: O(n^2) where n is the number of addresses and k is the number of packages
+        results = [dispatch.truckDeliverPackages(truck, end_time, optimizer, router) for truck in trucks]
 
-    # Load the second set of packages and update the address of package 9
-    dispatch.loadTruckWithPackageList(truck1, truck1_package_logs[1]) # Time Complexity: O(n) where n is the number of packages
-    dispatch.updateAddress() # Time Complexity: O(1)
-    dispatch.loadTruckWithPackageList(truck2, truck2_package_logs[1]) # Time Complexity: O(n) where n is the number of packages
+        # This is our logic check if we have hit the end time request by the user and need to return the program early
+        if not all(results):
+            if end_time is not None:
+                correct_by(clock.minutes_of(end_time))
+            break
+    else:
+        correct_by(max(truck.minutes for truck in trucks))
 
-    # Deliver the last packages
-    dispatch.truckDeliverPackages(truck1, end_time) # Time Complexity: O(n^2) where n is the number of addresses and k is the number of packages
-    dispatch.truckDeliverPackages(truck2, end_time) # Time Complexity: O(n^2) where n is the number of addresses and k is the number of packages
+    return dispatch
 
+# Results of deliver() for the end times that were asked for, dropped when the CSVs change
+result_cache = ResultCache(deliver)
+
+# deliver() with memoized results, for answering the same cutoff times again and again
+# The result is shared with other callers and must not be changed
+# Time Complexity: O(1) when the result is cached and the CSVs are unchanged, deliver() when it is not
+# Space Complexity: O(1) when the result is cached, deliver() when it is not
+def deliver_cached(end_time=None, plan=None, optimize=False, deadline_aware=False, shortest_paths=False):
+    return result_cache.get(end_time, plan, optimize=optimize, deadline_aware=deadline_aware,
+                            shortest_paths=shortest_paths)
+
+# deliver() with the instrumentation turned on, returns the result and the report of what the run did:
+# hash table lookups and chain walks, distance lookups, stops per truck and the time of every phase.
+# With profile the report also lists the most expensive functions of the run.
+# Time Complexity: O(deliver())
+# Space Complexity: O(deliver())
+def deliver_instrumented(profile=False, **options):
+    with instrumentation.enabled(profile) as probe:
+        result = deliver(**options)
+    return result, probe.report()
+
+# Write the package report of the day to a file, or to stdout without a path, as a table, CSV or JSON lines
+# at_time reports every package as it was at that time instead of at the end of the day
+# Time Complexity: O(N + E) where N is the number of packages and E the number of timeline events, plus deliver()
+# when the day is not cached
+# Space Complexity: O(chunk) for the report, the packages are streamed
+def export_report(path=None, report_format=ReportFormat.CSV, at_time=None):
+    dispatch, _, _ = deliver_cached()
+    packages = dispatch.packages if at_time is None else dispatch.timeline.eachPackageAt(clock.minutes_of(at_time))
+    if path is None:
+        return ReportWriter(sys.stdout, report_format).write(packages)
+    with open(path, 'w', newline='') as file:
+        return ReportWriter(file, report_format).write(packages)
+
+# Deliver the packages with the discrete-event simulation instead of the wave by wave loop above
+# Trucks do not wait for each other: every truck leaves with its next wave as soon as it is back at the hub,
+# has a driver and the packages of the wave are ready. drivers is a list of shift start times, by default
+# every truck has a driver from the start of the day. changes is a list of (time, PackageChange) that come in
+# during the day, each one only re-plans the routes and waves it affects.
+# Time Complexity: O(E log E) where E is the number of events, plus route planning for every wave
+# Space Complexity: O(A^2 + N) where A is the number of addresses and N is the number of packages
+def simulate(end_time=None, plan=None, optimize=False, deadline_aware=False, drivers=None, changes=(),
+             shortest_paths=False):
+    addresses, distances, packages = load_world()
+    paths = load_shortest_paths(distances) if shortest_paths else None
+
+    HUB = 0  # the hub is the first address in the list
+
+    truck1 = Truck(1, current_location=HUB)
+    truck2 = Truck(2, current_location=HUB, start_time='9:05')
+    trucks = [truck1, truck2]
+    dispatch = Dispatch(HUB, packages, addresses, distances, paths)
+    distances = dispatch.distances
+
+    planner = LoadPlanner(packages, trucks, distances, HUB, corrected=dispatch.correctedAddressIds())
+    if plan is None:
+        plan = planner.plan()
+    optimizer = RouteOptimizer(distances) if optimize else None
+    router = DeadlineRouter(distances) if deadline_aware else None
+    simulation = Simulation(dispatch, trucks, plan, planner, drivers, optimizer, router)
+    for time, change in changes:
+        simulation.change(change, time)
+    simulation.run(end_time)
     return (dispatch, truck1, truck2)
 
 
 # Main function of the software and loop for the UI
+# The day is simulated once, status queries for a given time are answered from the recorded timeline
 def main():
-    dispatch, truck1, truck2 = deliver()
+    dispatch, truck1, truck2 = deliver_cached()
 
     # UI
     while True:
@@ -123,8 +268,7 @@ def main():
         option = input("Please enter your selection: (1-4): ")
         match option:
             case '1':
-                print(Package.printHeader())
-                print(dispatch.packages)
+                ReportWriter(sys.stdout).write(dispatch.packages)
                 distance = truck1.distance + truck2.distance
                 print(f"Total mileage: {distance:.1f}")
             case '2':
@@ -132,19 +276,16 @@ def main():
                 time = input("Please enter the time: (HH:MM AM/PM): ")
                 try:
                     time_obj = datetime.datetime.strptime(time, "%I:%M %p")
-                    _dispatch, _, _ = deliver(end_time=time_obj.time())
-                    package = _dispatch.packages.get(int(package_id))
+                    package = dispatch.timeline.packageAt(int(package_id), clock.minutes_of(time_obj))
                     print(Package.printHeader())
                     print(package)
-                except ValueError:
+                except (ValueError, KeyError):
                     print("Invalid package id or time. Please try again.")
             case '3':
                 time = input("Please enter the time: (HH:MM AM/PM): ")
                 try:
                     time_obj = datetime.datetime.strptime(time, "%I:%M %p")
-                    _dispatch, _, _ = deliver(end_time=time_obj.time())
-                    print(Package.printHeader())
-                    print(_dispatch.packages)
+                    ReportWriter(sys.stdout).write(dispatch.timeline.eachPackageAt(clock.minutes_of(time_obj)))
                 except ValueError:
                     print("Invalid time. Please try again.")
             case '4':
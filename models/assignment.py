@@ -0,0 +1,461 @@
+import datetime
+import time
+
+from models import clock
+from models.flag import Flag
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, the planner falls back to plain lists
+    numpy = None
+
+
+# Packages that have to travel together, either because a note says so or because it is a single package
+# The group takes the strictest constraints of its packages
+# address_of maps every package id to the address id it is delivered to
+class PackageGroup:
+    def __init__(self, packages, ready_time, address_of):
+        self.package_ids = [package.id for package in packages]
+        self.address_ids = list(dict.fromkeys(address_of[package.id] for package in packages))
+        self.size = len(packages)
+        self.ready_time = ready_time
+        # (address id, deadline in minutes) of every package with a deadline
+        self.deadlines = [(address_of[package.id], clock.minutes_of(package.deadline_as_time))
+                          for package in packages if package.deadline_as_time is not None]
+        deadlines = [package.deadline_as_time.time() for package in packages if package.deadline_as_time is not None]
+        self.deadline = min(deadlines) if deadlines else None
+        trucks = {Flag.onlyOnTruck(package.flag) for package in packages} - {None}
+        if len(trucks) > 1:
+            raise ValueError(f"Packages {self.package_ids} must travel together but are limited to trucks {trucks}")
+        self.truck = trucks.pop() if trucks else None
+
+
+# Builds truck loads from the package table instead of hand written load lists
+# Every truck makes one or more trips (waves). In the first wave a truck can only take packages that
+# are at the hub when it leaves; in later waves the truck waits at the hub until its packages are ready.
+# Each wave is filled in three steps:
+#   1. packages with a deadline, earliest deadline first, up to the truck capacity
+#   2. the package groups closest to the stops already in the wave, starting from the hub,
+#      so each truck covers one area of the city. Packages are spread evenly over the fewest
+#      rounds of waves that can carry them, so this step stops at that share of the packages,
+#      except for packages going to a stop the wave already makes which only cost truck space
+#   3. more waves are added until every package has a truck
+# The waves are then improved by moving package groups to other waves, or swapping two groups, whenever that
+# shortens the routes without making more packages late, until no move helps or the time budget runs out.
+# Routes are estimated the way the greedy router drives them and every wave leaves once its truck is back
+# and its packages are ready, so the deadlines are checked against the times the trucks really get there.
+# Constraints come from the package notes: truck restrictions, packages that must be delivered
+# together, packages delayed until a given time and wrong addresses that can only leave once corrected.
+# corrected maps the id of a package with a wrong address to the address id it goes to once corrected,
+# so the loads are planned for where the package is really delivered.
+class LoadPlanner:
+    _EPSILON = 1e-9
+    # waves stopping at this many of the closest addresses of a group are tried as new waves for it
+    _NEARBY_ADDRESSES = 8
+
+    # Time Complexity: O(N) where N is the number of packages
+    # Space Complexity: O(N) where N is the number of packages
+    def __init__(self, packages, trucks, distances, hub=0, correction_time=datetime.time(10, 20), corrected=None,
+                 time_budget=0.25):
+        self.packages = list(packages)
+        self.trucks = trucks
+        self.distances = distances
+        self.hub = hub
+        self.correction_time = correction_time
+        self.corrected = {} if corrected is None else corrected
+        self.time_budget = time_budget
+        self.moves = 0
+        self.groups = self._buildGroups()
+        self._ready_minutes = [clock.minutes_of(group.ready_time) for group in self.groups]
+
+    # When a package can leave the hub
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def readyTime(self, package):
+        if Flag.isWrongAddress(package.flag):
+            return self.correction_time
+        return Flag.delayedUntil(package.flag) or datetime.time.min
+
+    # Latest ready time of a list of package ids, the time a truck has to wait for before leaving with them
+    # Time Complexity: O(N) where N is the number of packages in the list
+    # Space Complexity: O(1)
+    def waveReadyTime(self, package_ids):
+        ready_times = [self._ready[package_id] for package_id in package_ids]
+        return max(ready_times) if ready_times else datetime.time.min
+
+    # Join packages that must be delivered together with a union-find over the package ids
+    # Time Complexity: O(N * a(N)) where N is the number of packages
+    # Space Complexity: O(N) where N is the number of packages
+    def _buildGroups(self):
+        by_id = {package.id: package for package in self.packages}
+        self._ready = {package.id: self.readyTime(package) for package in self.packages}
+        address_of = {package.id: self.corrected.get(package.id, package.address_id) for package in self.packages}
+        parent = {package_id: package_id for package_id in by_id}
+
+        def find(package_id):
+            while parent[package_id] != package_id:
+                parent[package_id] = parent[parent[package_id]]
+                package_id = parent[package_id]
+            return package_id
+
+        for package in self.packages:
+            for other_id in Flag.deliverWith(package.flag):
+                if other_id in parent:
+                    parent[find(other_id)] = find(package.id)
+
+        members = {}
+        for package in self.packages:
+            members.setdefault(find(package.id), []).append(package)
+        groups = []
+        for group_packages in members.values():
+            ready_time = max(self._ready[package.id] for package in group_packages)
+            groups.append(PackageGroup(group_packages, ready_time, address_of))
+
+        truck_ids = {truck.id: truck for truck in self.trucks}
+        for group in groups:
+            capacity = truck_ids[group.truck].package_capacity if group.truck in truck_ids else \
+                max(truck.package_capacity for truck in self.trucks)
+            if group.truck is not None and group.truck not in truck_ids:
+                raise ValueError(f"Packages {group.package_ids} need truck {group.truck} which is not in the fleet")
+            if group.size > capacity:
+                raise ValueError(f"Packages {group.package_ids} must travel together but do not fit on one truck")
+        return groups
+
+    # Plan every wave for every truck
+    # Returns one list of waves per truck, in the order of self.trucks. Waves line up across trucks,
+    # wave i of every truck is filled in the same round. A truck with nothing to do in a wave gets an empty list.
+    # Time Complexity: O(W * (G + A)) to build the waves where W is the number of waves, G the number of groups
+    # and A the number of addresses, then bounded by the time budget to improve them
+    # Space Complexity: O(N + A) where N is the number of packages and A is the number of addresses
+    def plan(self):
+        waves = self._buildPlan()
+        self._improvePlan(waves)
+        # waves emptied by the moves at the end of every truck are not driven at all
+        for truck_waves in waves:
+            while len(truck_waves) > 1 and not truck_waves[-1]:
+                truck_waves.pop()
+        return [[[package_id for index in wave for package_id in self.groups[index].package_ids] for wave in truck_waves]
+                for truck_waves in waves]
+
+    # The waves of every truck as lists of group indices
+    # Time Complexity: O(W * (G + A)) where W is the number of waves, G the number of groups and A the number of addresses
+    # Space Complexity: O(N + A) where N is the number of packages and A is the number of addresses
+    def _buildPlan(self):
+        self._unplaced = set(range(len(self.groups)))
+        self._by_address = {}
+        for index, group in enumerate(self.groups):
+            for address_id in group.address_ids:
+                self._by_address.setdefault(address_id, []).append(index)
+        # the addresses that still have groups to place, a mask over the address ids when numpy is installed
+        if self.distances.array is not None:
+            self._open = numpy.zeros(len(self.distances), dtype=bool)
+            self._open[list(self._by_address)] = True
+        else:
+            self._open = set(self._by_address)
+        self._deadline_order = sorted((index for index, group in enumerate(self.groups) if group.deadline is not None),
+                                      key=lambda index: (self.groups[index].deadline, self.groups[index].ready_time))
+
+        # trucks leave in order of their start time, ties keep the fleet order
+        order = sorted(range(len(self.trucks)), key=lambda index: self.trucks[index].minutes)
+        # the fewest rounds of waves that can carry every package, and the share of each wave
+        package_count = sum(group.size for group in self.groups)
+        round_capacity = sum(truck.package_capacity for truck in self.trucks)
+        rounds = max(1, -(-package_count // round_capacity))
+        self._share = -(-package_count // (rounds * len(self.trucks)))
+        plan = [[] for _ in self.trucks]
+        wave_index = 0
+        while self._unplaced:
+            placed = False
+            for truck_index in order:
+                truck = self.trucks[truck_index]
+                departure = truck.minutes if wave_index == 0 else None
+                wave = self._fillWave(truck, departure)
+                plan[truck_index].append(wave)
+                placed = placed or len(wave) > 0
+            if not placed and wave_index > 0:
+                raise ValueError(f"Could not place packages {self._unplacedIds()}")
+            wave_index += 1
+        return plan
+
+    def _unplacedIds(self):
+        return sorted(package_id for index in self._unplaced for package_id in self.groups[index].package_ids)
+
+    # A group fits the wave when it is not placed yet, can go on this truck, is ready when the truck
+    # leaves (departure in minutes, None means the truck waits for it) and fits in the space left
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def _fits(self, index, truck, departure, space):
+        group = self.groups[index]
+        return index in self._unplaced and (group.truck is None or group.truck == truck.id) and \
+            (departure is None or not clock.is_after(self._ready_minutes[index], departure)) and group.size <= space
+
+    # The group indices of one wave
+    # Time Complexity: O(G + P * A) where G is the number of deadline groups, P the number of picks
+    # and A the number of addresses (vectorized when numpy is installed)
+    # Space Complexity: O(A) where A is the number of addresses
+    def _fillWave(self, truck, departure):
+        wave = []
+        space = truck.package_capacity
+        # the addresses this wave can still pick, every address with groups left except the ones it passed on
+        open_now = self._open.copy()
+        closest = self._distancesFrom(self.hub, open_now)
+        started = False
+
+        def take(index):
+            nonlocal space, closest, started
+            group = self.groups[index]
+            wave.append(index)
+            space -= group.size
+            self._unplaced.discard(index)
+            if not started:
+                # the first stop replaces the hub as the start of the area the wave covers
+                closest = self._distancesFrom(group.address_ids[0], open_now)
+                started = True
+            for address_id in group.address_ids:
+                closest = self._relax(closest, address_id, open_now)
+
+        # deadlines first
+        for index in self._deadline_order:
+            if space == 0:
+                break
+            if self._fits(index, truck, departure, space):
+                take(index)
+        self._deadline_order = [index for index in self._deadline_order if index in self._unplaced]
+
+        # then the closest groups to the stops we already have
+        while space > 0:
+            address_id = self._closestOpen(closest, open_now)
+            if address_id is None:
+                break
+            limit = space
+            if not started or closest[address_id] != 0.0:
+                # a new stop, only fill up to the share of this wave
+                limit = min(space, self._share - (truck.package_capacity - space))
+                if limit <= 0:
+                    break
+            for index in self._by_address[address_id]:
+                if self._fits(index, truck, departure, limit):
+                    limit -= self.groups[index].size
+                    take(index)
+            # nothing else at this address can go on this wave
+            self._by_address[address_id] = [index for index in self._by_address[address_id] if index in self._unplaced]
+            if not self._by_address[address_id]:
+                del self._by_address[address_id]
+                self._close(self._open, address_id)
+            self._close(open_now, address_id)
+            if self.distances.array is not None:
+                closest[address_id] = numpy.inf
+        return wave
+
+    # Distance from one address to every address, inf for the addresses that are not open with numpy
+    def _distancesFrom(self, address_id, open_now):
+        if self.distances.array is not None:
+            return numpy.where(open_now, self.distances.array[address_id], numpy.inf)
+        return list(self.distances[address_id])
+
+    # Distance to the closest stop of the wave, after adding a new stop
+    def _relax(self, closest, address_id, open_now):
+        if self.distances.array is not None:
+            return numpy.minimum(closest, self.distances.array[address_id], out=closest, where=open_now)
+        row = self.distances[address_id]
+        return [min(distance, row[index]) for index, distance in enumerate(closest)]
+
+    # Take an address out of a set or mask of open addresses
+    def _close(self, open_addresses, address_id):
+        if self.distances.array is not None:
+            open_addresses[address_id] = False
+        else:
+            open_addresses.discard(address_id)
+
+    # The closest open address, None when every address is closed
+    # With numpy the closed addresses are inf in closest so this is a single argmin
+    # Time Complexity: O(A) where A is the number of addresses, in numpy, O(a) for the a open addresses without it
+    # Space Complexity: O(1)
+    def _closestOpen(self, closest, open_now):
+        if self.distances.array is not None:
+            address_id = int(closest.argmin())
+            if open_now[address_id]:
+                return address_id
+            # only unreachable addresses are left
+            remaining = numpy.flatnonzero(open_now)
+            return int(remaining[0]) if len(remaining) else None
+        if not open_now:
+            return None
+        return min(open_now, key=lambda address_id: (closest[address_id], address_id))
+
+    # Improve the waves of a plan in place by moving a group to another wave or swapping two groups
+    # A move is kept when the estimated routes get shorter and no more packages are late. Every group is
+    # tried against the waves stopping close to it, round after round until a round finds nothing to improve
+    # or the time budget runs out.
+    # Time Complexity: O(G * k * s * S^2) per round where G is the number of groups, k the number of waves close
+    # to a group, s the number of groups of a wave and S the number of stops of a wave, bounded by the time budget
+    # Space Complexity: O(W * S) where W is the number of waves
+    def _improvePlan(self, plan):
+        deadline = time.perf_counter() + self.time_budget
+        self._waves = plan
+        self._routes = [[self._waveRoute(wave) for wave in waves] for waves in plan]
+        self._late = [self._lateOnTruck(truck_index, waves, self._routes[truck_index])
+                      for truck_index, waves in enumerate(plan)]
+        # group index -> (truck index, wave index) of the wave it is in
+        self._where = {}
+        # address id -> the (truck index, wave index) of every wave stopping there, in the order they were added
+        self._stopping = {}
+        for truck_index, waves in enumerate(plan):
+            for wave_index, wave in enumerate(waves):
+                self._placeWave((truck_index, wave_index), wave, self._routes[truck_index][wave_index])
+        improved = True
+        while improved:
+            improved = False
+            for index in range(len(self.groups)):
+                if time.perf_counter() > deadline:
+                    return
+                improved = self._improveGroup(index) or improved
+
+    # Try to move the stop of a group to each wave stopping close to it, or to swap it with a stop of that wave
+    # The stop of a group is the group with the other groups of its wave that only go to its addresses, moving
+    # them together takes the stop out of the wave. The group is also tried on its own when that is more.
+    # Returns True when a move was made
+    # Time Complexity: O(k * s * S^2) where k is the number of waves close to the group, s the number of groups
+    # of a wave and S the number of stops of a wave
+    # Space Complexity: O(s + S)
+    def _improveGroup(self, index):
+        source = self._where[index]
+        stop = self._stopOf(index, self._waves[source[0]][source[1]])
+        for target in self._wavesNear(self.groups[index], source):
+            for moving in ([stop, [index]] if len(stop) > 1 else [stop]):
+                if self._tryExchange(source, moving, target, []):
+                    return True
+            target_wave = self._waves[target[0]][target[1]]
+            tried = []
+            for other in target_wave:
+                other_stop = self._stopOf(other, target_wave)
+                if other_stop not in tried:
+                    tried.append(other_stop)
+                    if self._tryExchange(source, stop, target, other_stop):
+                        return True
+        return False
+
+    # The groups of a wave that only go to addresses of the given group, the group included
+    # Time Complexity: O(s) where s is the number of groups of the wave
+    # Space Complexity: O(s)
+    def _stopOf(self, index, wave):
+        addresses = set(self.groups[index].address_ids)
+        return [member for member in wave if addresses.issuperset(self.groups[member].address_ids)]
+
+    # Move the groups out from the source wave to the target wave and the groups back from the target wave to
+    # the source wave, when the trucks may carry them and the move pays off, see _tryMove
+    # Time Complexity: O(s + S^2 + W * s) where s is the number of groups of a wave, S the number of stops of a wave
+    # and W the number of waves of a truck
+    # Space Complexity: O(s + S)
+    def _tryExchange(self, source, out, target, back):
+        source_wave, target_wave = self._waves[source[0]][source[1]], self._waves[target[0]][target[1]]
+        size_change = self._load(out) - self._load(back)
+        if not all(self._allowed(index, target, self._load(target_wave) + size_change) for index in out) or \
+                not all(self._allowed(index, source, self._load(source_wave) - size_change) for index in back):
+            return False
+        return self._tryMove({source: [member for member in source_wave if member not in out] + back,
+                              target: [member for member in target_wave if member not in back] + out})
+
+    # The waves other than source that stop at one of the addresses closest to the addresses of a group
+    # Time Complexity: O(a * n) where a is the number of addresses of the group and n the number of waves
+    # stopping at the addresses close to them
+    # Space Complexity: O(n)
+    def _wavesNear(self, group, source):
+        neighbours = self.distances.neighbours()
+        places = {}
+        for address_id in group.address_ids:
+            for nearby in [address_id] + neighbours.closest(address_id, self._NEARBY_ADDRESSES):
+                places.update(self._stopping.get(nearby, {}))
+        places.pop(source, None)
+        return list(places)
+
+    # A group can go in a wave when the truck may carry it, it is at the hub when a first wave leaves
+    # and the wave stays within the capacity of the truck with load packages
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def _allowed(self, index, place, load):
+        group = self.groups[index]
+        truck = self.trucks[place[0]]
+        return (group.truck is None or group.truck == truck.id) and load <= truck.package_capacity and \
+            (place[1] > 0 or not clock.is_after(self._ready_minutes[index], truck.minutes))
+
+    def _load(self, wave):
+        return sum(self.groups[index].size for index in wave)
+
+    # Replace waves with the given ones when their routes are shorter and no more packages end up late
+    # changes maps (truck index, wave index) to the new groups of the wave
+    # Time Complexity: O(c * S^2 + T * W * S) where c is the number of changed waves, S the number of stops of a
+    # wave, T the number of trucks of the changed waves and W the number of waves of a truck
+    # Space Complexity: O(c * S)
+    def _tryMove(self, changes):
+        routes = {place: self._waveRoute(wave) for place, wave in changes.items()}
+        gain = sum(self._routes[truck_index][wave_index][1] - routes[truck_index, wave_index][1]
+                   for truck_index, wave_index in changes)
+        if gain <= self._EPSILON:
+            return False
+        late = {}
+        for truck_index in {truck_index for truck_index, _ in changes}:
+            waves = [changes.get((truck_index, wave_index), wave)
+                     for wave_index, wave in enumerate(self._waves[truck_index])]
+            truck_routes = [routes.get((truck_index, wave_index), route)
+                            for wave_index, route in enumerate(self._routes[truck_index])]
+            late[truck_index] = self._lateOnTruck(truck_index, waves, truck_routes)
+        if sum(late.values()) > sum(self._late[truck_index] for truck_index in late):
+            return False
+        for (truck_index, wave_index), wave in changes.items():
+            for address_id in self._routes[truck_index][wave_index][0]:
+                del self._stopping[address_id][truck_index, wave_index]
+            self._placeWave((truck_index, wave_index), wave, routes[truck_index, wave_index])
+        for truck_index, count in late.items():
+            self._late[truck_index] = count
+        self.moves += 1
+        return True
+
+    def _placeWave(self, place, wave, route):
+        self._waves[place[0]][place[1]] = wave
+        self._routes[place[0]][place[1]] = route
+        for index in wave:
+            self._where[index] = place
+        for address_id in route[0]:
+            self._stopping.setdefault(address_id, {})[place] = None
+
+    # The miles from the hub to every stop of a wave and the miles of the whole trip back to the hub,
+    # driven the way the greedy router drives it: always to the closest stop left, ties to the stop loaded first
+    # Time Complexity: O(S^2) where S is the number of stops of the wave
+    # Space Complexity: O(S)
+    def _waveRoute(self, wave):
+        pending = {}
+        for index in wave:
+            for address_id in self.groups[index].address_ids:
+                pending.setdefault(address_id, len(pending))
+        pending.pop(self.hub, None)
+        arrivals = {}
+        location, miles = self.hub, 0.0
+        while pending:
+            row = self.distances[location]
+            stop = min(pending, key=lambda address_id: (row[address_id], pending[address_id]))
+            miles += row[stop]
+            arrivals[stop] = miles
+            del pending[stop]
+            location = stop
+        return arrivals, miles + self.distances.distance(location, self.hub)
+
+    # How many packages of a truck would miss their deadline, every wave leaves once the truck is back and
+    # the packages of the wave are ready, and the truck drives the routes given for the waves
+    # Time Complexity: O(W * s) where W is the number of waves and s the number of packages of a wave
+    # Space Complexity: O(1)
+    def _lateOnTruck(self, truck_index, waves, routes):
+        truck = self.trucks[truck_index]
+        minutes_per_mile = 60 / truck.truck_speed
+        minutes = truck.minutes
+        late = 0
+        for wave, (arrivals, miles) in zip(waves, routes):
+            if not wave:
+                continue
+            departure = max(minutes, max(self._ready_minutes[index] for index in wave))
+            for index in wave:
+                for address_id, deadline in self.groups[index].deadlines:
+                    if clock.is_after(departure + arrivals.get(address_id, 0.0) * minutes_per_mile, deadline):
+                        late += 1
+            minutes = departure + miles * minutes_per_mile
+        return late
@@ -0,0 +1,45 @@
+import datetime
+
+# The simulation keeps time as a number of minutes since midnight, a float.
+# Driving a leg is one addition and comparing two times is one float compare;
+# datetime and time objects are only built where a time is shown or recorded.
+# A large fleet can run past midnight, the minutes then simply go past a day. Times stay plain numbers
+# so they keep comparing and sorting right, only the labels shown to people carry the day.
+
+# Two times closer than this are the same time, a little under the microsecond datetime keeps
+EPSILON = 1e-8
+MINUTES_PER_DAY = 24 * 60
+
+
+# Days after the first day of a number of minutes since midnight of the first day
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def days_of(minutes):
+    return int(minutes // MINUTES_PER_DAY)
+
+
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def minutes_of(time):
+    return time.hour * 60 + time.minute + (time.second + time.microsecond / 1e6) / 60
+
+
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def datetime_of(minutes, day=None):
+    day = datetime.date.today() if day is None else day
+    return datetime.datetime.combine(day, datetime.time.min) + datetime.timedelta(minutes=minutes)
+
+
+# The time of day of a number of minutes since midnight, on whatever day it falls
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def time_of(minutes):
+    return datetime_of(minutes % MINUTES_PER_DAY).time()
+
+
+# True when minutes is later than limit, ignoring float rounding
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def is_after(minutes, limit):
+    return minutes - limit > EPSILON
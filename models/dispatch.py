@@ -1,65 +1,175 @@
-import datetime
+import itertools
 
+from algorithms import instrumentation
+from models import clock
 from models.status import Status
 from models.flag import Flag
+from models.timeline import Timeline, EventType
 
+try:
+    import numpy
+except ImportError:  # numpy is optional, arrival schedules are added up in a loop without it
+    numpy = None
 
+# The corrected address of every package that was sent out with a wrong address, as (address, city, zip)
+# The sample manifest has one, package 9, whose address is only known at 10:20 AM
+ADDRESS_CORRECTIONS = {
+    9: ('410 S State St', 'Salt Lake City', '84111'),
+}
+
+
+# The routing core only works with integer address ids from the address registry,
+# address strings are only used for display and for correcting a package address
+# paths is an optional ShortestPaths, the trucks are then routed on its shortest distances
+# corrections maps package ids to their corrected (address, city, zip), see updateAddress
 class Dispatch:
-    def __init__(self, location, packages, addresses, address_indices, distances):
+    def __init__(self, location, packages, addresses, distances, paths=None, corrections=None):
         self.hub = location
         self.packages = packages
         self.addresses = addresses
-        self.address_indices = address_indices
-        self.distances = distances
+        self.paths = paths
+        self.corrections = ADDRESS_CORRECTIONS if corrections is None else corrections
+        self.distances = distances if paths is None else paths.distances
+        # secondary indexes for the package queries we run, so lookup() does not scan every package
+        for attribute in ('flag', 'status', 'truck', 'deadline', 'zip'):
+            self.packages.addIndex(attribute)
+        # every change made during the run is recorded so we can answer status queries later
+        self.timeline = Timeline(packages)
+        # (truck id, miles before, miles after) for every route the optimizer worked on
+        self.route_reports = []
 
     # Time Complexity: O(1)
     # Space Complexity: O(1)
     def distanceBetween(self, address1, address2):
-        address1_index = self.address_indices[address1]
-        address2_index = self.address_indices[address2]
-        return self.distances[address1_index][address2_index]
+        return self.distances.distance(address1, address2)
 
+    # The stops a truck still has to visit, mapped to the position of their first package in the load
     # Time Complexity: O(N) where N is the number of packages in given truck
+    # Space Complexity: O(A) where A is the number of addresses the truck visits
+    def pendingStops(self, forTruck):
+        pending = {}
+        for position, package_id in enumerate(forTruck.packages):
+            pending.setdefault(self.packages.get(package_id).address_id, position)
+        return pending
+
+    # Finds the closest stop with packages left on the truck, skipping stops 0.0 miles away.
+    # Ties go to the stop loaded first. The sorted neighbour index of the distance matrix
+    # means we only look at stops closer than the answer instead of every package on the truck.
+    # pending can be kept up to date by the caller so it is not rebuilt for every stop
+    # Time Complexity: O(k) where k is the number of addresses closer than the answer, O(N) to build pending
     # Space Complexity: O(1)
-    def minDistanceFrom(self, address, forTruck):
-        min_distance = float('inf')
-        min_address = None
-        for package_id in forTruck.packages:
-            package = self.packages.get(package_id)
-            distance = self.distanceBetween(address, package.address)
-            if distance != 0.0 and distance < min_distance:
-                min_distance = distance
-                min_address = package.address
-        return min_address, min_distance
-
-    # Our function for updating package #9 once the clock hits 10:20 AM
-    # We use the lookup function to find the package with the flag WRONG_ADDRESS
-    # This creates a large time and space complexity in the worst case.
-    # However, we know in our case this would only return 1 package.
-    # But to make this more "adaptable and scalable" I used the more complex lookup function
-    # Time Complexity: O(N^k) where N is the number of addresses and K is the number of packages
-    # Space Complexity: O(N) where N is the number of packages
-    def updateAddress(self):
-        packages = self.packages.lookup(flag=Flag.WRONG_ADDRESS)
-        if package := packages[0]:
-            package.address = '410 S State St'
-            package.city = 'Salt Lake City'
-            package.zip = '84111'
-            package.status = Status.HUB
-            self.packages[package.id] = package
+    def minDistanceFrom(self, address, forTruck, pending=None):
+        if pending is None:
+            pending = self.pendingStops(forTruck)
+            pending.pop(address, None)
+        return self.distances.neighbours().nearest(address, pending)
+
+    # Every address a truck drives through from start over the stops, for a driver manifest
+    # Without shortest paths the trucks drive every leg directly and this is just the stops
+    # Time Complexity: O(p) where p is the number of addresses driven through
+    # Space Complexity: O(p)
+    def fullRoute(self, start, stops):
+        route = [start] + list(stops)
+        return route if self.paths is None else self.paths.expand(route)
+
+    # Every address a truck drove through from the start of the day up to the given time, for a driver manifest
+    # at_time is in minutes since midnight, None lists the whole day however long it ran
+    # With shortest paths the addresses between the stops are listed too
+    # Time Complexity: O(M + p) where M is the number of moves of the truck and p the number of addresses listed
+    # Space Complexity: O(M + p)
+    def manifest(self, truck_id, at_time=None):
+        return self.fullRoute(self.hub, self.timeline.truckStops(truck_id, at_time))
+
+    # Status of many packages at many times, for example every 15 minutes for a dashboard
+    # Rows are (time, status of each package) and are streamed from a single sweep over the timeline
+    # Time Complexity: O(E + Q * K) where E is the number of events, Q the number of times and K the number of packages
+    # Space Complexity: O(K) where K is the number of packages
+    def statusMatrix(self, times, package_ids=None):
+        return self.timeline.statusMatrix(times, package_ids)
+
+    # Our function for correcting the wrong addresses once the clock hits 10:20 AM
+    # We use the lookup function to find the packages with the flag WRONG_ADDRESS
+    # The flag attribute is indexed so the lookup only touches the matching packages.
+    # Every package with a known correction gets its corrected address, the others keep theirs.
+    # at_time is when the correction is recorded in the timeline, in minutes since midnight,
+    # it defaults to the current hold time
+    # Time Complexity: O(M) where M is the number of packages with the flag
+    # Space Complexity: O(M) where M is the number of packages with the flag
+    def updateAddress(self, at_time=0.0):
+        for package in self.packages.lookup(flag=Flag.WRONG_ADDRESS):
+            correction = self.corrections.get(package.id)
+            if correction is not None:
+                self.correctPackage(package, at_time)
+
+    # The address id every package with a known correction is delivered to once it is corrected,
+    # so the loads can be planned before the corrections come in. Corrections to addresses that are not
+    # in the distance table are left out.
+    # Time Complexity: O(C) where C is the number of corrections
+    # Space Complexity: O(C)
+    def correctedAddressIds(self):
+        return {package_id: self.addresses.idOf(address) for package_id, (address, _, _) in self.corrections.items()
+                if address in self.addresses}
+
+    # Give one package with a wrong address its corrected address
+    # Time Complexity: O(a) where a is the number of indexes on the packages
+    # Space Complexity: O(1)
+    def correctPackage(self, package, at_time=0.0):
+        address, city, zip = self.corrections[package.id]
+        self.addressIdOf(address)
+        package.status = Status.HUB
+        self.correctAddress(package, address, city, zip, at_time)
+
+    # The id of an address a package can be sent to
+    # Raises ValueError for an address that is not in the distance table
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def addressIdOf(self, address):
+        if address not in self.addresses:
+            raise ValueError(f"Address {address!r} is not in the distance table")
+        return self.addresses.idOf(address)
+
+    # Give a package a new address, the address has to be in the distance table
+    # The address is checked before the package is touched, a bad address leaves the package as it was
+    # Time Complexity: O(a) where a is the number of indexes on the packages
+    # Space Complexity: O(1)
+    def correctAddress(self, package, address, city=None, zip=None, at_time=0.0):
+        address_id = self.addressIdOf(address)
+        package.address = address
+        package.address_id = address_id
+        if city is not None:
+            package.city = city
+        if zip is not None:
+            package.zip = zip
+        self.packages[package.id] = package
+        self.timeline.recordPackage(at_time, EventType.ADDRESS_CORRECTED, package)
+
+    # Take a package out of the delivery, off the truck when it is loaded
+    # Time Complexity: O(N) where N is the number of packages in given truck
+    # Space Complexity: O(1)
+    def cancelPackage(self, package, forTruck=None, at_time=0.0):
+        if forTruck is not None and package.id in forTruck.packages:
+            forTruck.packages.remove(package.id)
+        package.status = Status.CANCELLED
+        self.packages[package.id] = package
+        self.timeline.recordPackage(at_time, EventType.CANCELLED, package, package.truck)
 
     # Our function for loading packages onto our tucks and updating their status
+    # at_time is when the load is recorded in the timeline, in minutes since midnight, it defaults to the truck's clock
     # Time Complexity: O(N) where N is the number of packages in given truck
     # Space Complexity: O(1)
-    def loadTruckWithPackageList(self, forTruck, package_list):
+    def loadTruckWithPackageList(self, forTruck, package_list, at_time=None):
         if len(package_list) > forTruck.package_capacity:
             raise Exception('Too many packages for truck')
 
+        if at_time is None:
+            at_time = forTruck.minutes
         for package_id in package_list:
             package = self.packages[package_id]
             forTruck.loadPackage(package.id)
             package.status = Status.ENROUTE
+            package.truck = forTruck.id
             self.packages[package.id] = package
+            self.timeline.recordPackage(at_time, EventType.LOADED, package, forTruck.id)
 
     # Our function for delivering packages at our current location
     # We build out our remaining packages to replace packages, due to an issue where
@@ -71,36 +181,152 @@ class Dispatch:
         remaining_packages = []
         for package_id in forTruck.packages:
             package = self.packages[package_id]
-            if package.address == forTruck.current_location:
+            if package.address_id == forTruck.current_location:
                 package.status = Status.DELIVERED
-                package.delivery_time = forTruck.time.time()
+                package.delivery_time = forTruck.minutes
                 self.packages[package.id] = package
+                self.timeline.recordPackage(package.delivery_time, EventType.DELIVERED, package, forTruck.id)
             else:
                 remaining_packages.append(package_id)
         forTruck.packages = remaining_packages
 
+    # The order the greedy algorithm visits the stops of a truck in, without moving the truck
+    # From the current location we always go to the closest stop that still has packages
+    # Time Complexity: O(N + A * k) where N is the number of packages in given truck, A the number of stops
+    # and k the number of addresses skipped in the neighbour index per stop
+    # Space Complexity: O(A) where A is the number of addresses the truck visits
+    def planRoute(self, forTruck):
+        pending = self.pendingStops(forTruck) # Time Complexity: O(N) where N is the number of packages in given truck
+        location = forTruck.current_location
+        pending.pop(location, None)
+        stops = []
+        while pending:
+            next_address, distance = self.minDistanceFrom(location, forTruck, pending)
+            if distance == float('inf'): break
+            stops.append(next_address)
+            pending.pop(next_address)
+            location = next_address
+        return stops
+
+    # The stop order of a truck built around the package deadlines instead of distance alone
+    # Time Complexity: O(N + A^3) where N is the number of packages in given truck and A the number of stops
+    # Space Complexity: O(A^2) where A is the number of stops
+    def planDeadlineRoute(self, forTruck, router):
+        stops = []
+        latest = {}
+        for package_id in forTruck.packages:
+            package = self.packages.get(package_id)
+            if package.address_id == forTruck.current_location:
+                continue
+            stops.append(package.address_id)
+            if package.deadline_as_time is not None:
+                minutes = clock.minutes_of(package.deadline_as_time)
+                latest[package.address_id] = min(latest.get(package.address_id, minutes), minutes)
+        return router.route(forTruck.current_location, forTruck.minutes, stops, latest, self.hub,
+                            forTruck.truck_speed)
+
+    # Run the optimizer over the greedy stops of a truck, the route starts at the truck and ends at the hub
+    # The mileage before and after is kept in route_reports. If the shorter route would make more packages
+    # late than the greedy one we keep the greedy route.
+    # Time Complexity: bounded by the optimizer time budget, plus O(N) to check deadlines
+    # Space Complexity: O(A^2) where A is the number of stops
+    def improveRoute(self, forTruck, stops, optimizer):
+        route = [forTruck.current_location] + stops + [self.hub]
+        improved = optimizer.improve(route)
+        before = optimizer.routeLength(route)
+        after = optimizer.routeLength(improved)
+        if after < before and self.countLate(forTruck, improved[1:-1]) <= self.countLate(forTruck, stops):
+            stops = improved[1:-1]
+        else:
+            after = before
+        self.route_reports.append((forTruck.id, before, after))
+        return stops
+
+    # How many packages on the truck would miss their deadline if it drove the stops in this order
+    # Time Complexity: O(N + A) where N is the number of packages in given truck and A the number of stops
+    # Space Complexity: O(A) where A is the number of stops
+    def countLate(self, forTruck, stops):
+        deadlines = {}
+        for package_id in forTruck.packages:
+            package = self.packages.get(package_id)
+            if package.deadline_as_time is not None:
+                deadlines.setdefault(package.address_id, []).append(clock.minutes_of(package.deadline_as_time))
+        late = 0
+        for stop, arrival in zip(stops, self.arrivalSchedule(forTruck, stops)):
+            late += sum(1 for deadline in deadlines.get(stop, ()) if clock.is_after(arrival, deadline))
+        return late
+
+    # The minute the truck arrives at every stop if it leaves now and drives them in order
+    # The legs are looked up and added up in one cumulative sum over the route when numpy is installed
+    # Time Complexity: O(A) where A is the number of stops
+    # Space Complexity: O(A) where A is the number of stops
+    def arrivalSchedule(self, forTruck, stops):
+        if not stops:
+            return []
+        minutes_per_mile = 60 / forTruck.truck_speed
+        legs = self.distances.legs([forTruck.current_location] + list(stops))
+        if self.distances.array is not None:
+            return (forTruck.minutes + numpy.cumsum(legs) * minutes_per_mile).tolist()
+        return [forTruck.minutes + miles * minutes_per_mile for miles in itertools.accumulate(legs)]
+
     # Our main function for deliver packages and stopping if the user as requested a stop time
-    # We loop until all packages are delivered from the truck
     # We deliver all packages at our current address
-    # If we still have packages we use a greedy algorithm to find the closest address and travel there
+    # The stops come from the greedy algorithm, which always travels to the closest address with packages,
+    # or from a DeadlineRouter when one is given, and can be improved by a RouteOptimizer before the truck leaves
     # Once we have delivered all packages we return to the hub
     # Time Complexity: O(n^2) where N is the number of packages
-    # Space Complexity: O(1)
-    def truckDeliverPackages(self, forTruck, end_time=None):
-        while len(forTruck.packages) > 0: # Time Complexity: O(N) where N is the number of addresses we visit as we deliver packages by address not by package
+    # Space Complexity: O(A) where A is the number of addresses the truck visits
+    def truckDeliverPackages(self, forTruck, end_time=None, optimizer=None, router=None):
+        with instrumentation.phase('route'):
+            stops = self.planStops(forTruck, optimizer, router)
+        return self.truckDriveRoute(forTruck, stops, end_time)
+
+    # The stops for the packages on a truck, greedy unless a DeadlineRouter is given,
+    # then improved by the RouteOptimizer when one is given
+    # Time Complexity: O(A^2) where A is the number of stops, bounded by the optimizer time budget
+    # Space Complexity: O(A^2) where A is the number of stops
+    def planStops(self, forTruck, optimizer=None, router=None):
+        stops = self.planRoute(forTruck) if router is None else self.planDeadlineRoute(forTruck, router)
+        if optimizer is not None:
+            stops = self.improveRoute(forTruck, stops, optimizer)
+        return stops
+
+    # Drive the truck through the stops in order, delivering the packages at every stop
+    # The arrival time at every stop comes from the arrival schedule of the route, the clock is kept in minutes
+    # Time Complexity: O(A * N) where A is the number of stops and N is the number of packages in given truck
+    # Space Complexity: O(A) where A is the number of stops
+    def truckDriveRoute(self, forTruck, stops, end_time=None):
+        end_minutes = None if end_time is None else clock.minutes_of(end_time)
+        with instrumentation.phase('route'):
             # deliver packages for this address
             self.truckDeliverAllPackagesAtCurrentLocation(forTruck) # Time Complexity: O(N) where N is the number of packages in given truck
-
-            if len(forTruck.packages) == 0: break
-            # find the next address and travel there
-            next_address, distance = self.minDistanceFrom(forTruck.current_location, forTruck)
-            if distance == float('inf'): break
-            # drive the truck to the next address
-            forTruck.drive(distance, next_address) # Time Complexity: O(1)
-            # if the truck has passed the end time, stop
-            if end_time is not None and forTruck.time.time() > end_time: break
+            for stop, arrival in zip(stops, self.arrivalSchedule(forTruck, stops)):
+                if len(forTruck.packages) == 0: break
+                # drive the truck to the next address
+                forTruck.arrive(self.distanceBetween(forTruck.current_location, stop), stop, arrival) # Time Complexity: O(1)
+                self.timeline.recordTruck(forTruck.minutes, forTruck)
+                # if the truck has passed the end time, stop
+                if end_minutes is not None and clock.is_after(forTruck.minutes, end_minutes): break
+                self.truckDeliverAllPackagesAtCurrentLocation(forTruck) # Time Complexity: O(N) where N is the number of packages in given truck
         # send the truck home
-        to_hub = self.distanceBetween(forTruck.current_location, self.hub) # O(1)
-        forTruck.drive(to_hub, self.hub)
+        with instrumentation.phase('return to hub'):
+            to_hub = self.distanceBetween(forTruck.current_location, self.hub) # O(1)
+            forTruck.drive(to_hub, self.hub)
+            self.timeline.recordTruck(forTruck.minutes, forTruck)
+
+        return False if end_minutes is not None and clock.is_after(forTruck.minutes, end_minutes) else True
+
+
+# Counts a stop for the truck every time it delivers at least one package at an address
+def _countingStops(original, probe):
+    def deliver(self, forTruck):
+        before = len(forTruck.packages)
+        original(self, forTruck)
+        if len(forTruck.packages) < before:
+            probe.count(f'truck {forTruck.id} stops')
+    return deliver
+
 
-        return False if end_time is not None and forTruck.time.time() > end_time else True
+instrumentation.hook(Dispatch, 'distanceBetween', instrumentation.counting('dispatch.distanceBetween'))
+instrumentation.hook(Dispatch, 'minDistanceFrom', instrumentation.counting('dispatch.minDistanceFrom'))
+instrumentation.hook(Dispatch, 'truckDeliverAllPackagesAtCurrentLocation', _countingStops)
@@ -1,3 +1,7 @@
+import datetime
+import re
+
+
 class Flag:
     ONLY_TRUCK_2 = "Can only be on truck 2"
     DELIVER_WITH_OTHER_PACKAGES = "Must be delivered with 13, 15, 19"
@@ -5,6 +9,35 @@ class Flag:
     WRONG_ADDRESS = "Wrong address listed"
     FLAGS = [ONLY_TRUCK_2, DELIVER_WITH_OTHER_PACKAGES, DELAYED, WRONG_ADDRESS]
 
+    # The special notes follow the same wording with different numbers, so we classify them by pattern
+    _ONLY_TRUCK = re.compile(r'only be on truck (\d+)', re.IGNORECASE)
+    _DELIVER_WITH = re.compile(r'must be delivered with ([\d,\s]+)', re.IGNORECASE)
+    _DELAYED_UNTIL = re.compile(r'delayed.*?(\d{1,2}:\d{2}\s*[ap]m)', re.IGNORECASE)
+
     def __init__(self, key, description=""):
         self.key = key
         self.description = description
+
+    # The id of the only truck the package can go on, or None
+    @staticmethod
+    def onlyOnTruck(flag):
+        match = Flag._ONLY_TRUCK.search(flag or '')
+        return int(match.group(1)) if match else None
+
+    # The ids of the packages this package must be delivered with
+    @staticmethod
+    def deliverWith(flag):
+        match = Flag._DELIVER_WITH.search(flag or '')
+        return [int(package_id) for package_id in re.findall(r'\d+', match.group(1))] if match else []
+
+    # The time a delayed package arrives at the hub, or None
+    @staticmethod
+    def delayedUntil(flag):
+        match = Flag._DELAYED_UNTIL.search(flag or '')
+        if match is None:
+            return None
+        return datetime.datetime.strptime(match.group(1).replace(' ', '').upper(), '%I:%M%p').time()
+
+    @staticmethod
+    def isWrongAddress(flag):
+        return (flag or '').lower().startswith(Flag.WRONG_ADDRESS.lower())
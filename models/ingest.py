@@ -0,0 +1,110 @@
+import csv
+import itertools
+
+from models.package import Package
+
+
+# Bad rows found while reading a package file
+# Only the first max_errors rows are kept with their message, the rest are only counted,
+# so a file full of bad rows does not grow the report without bound
+class IngestReport:
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.loaded = 0
+        self.error_count = 0
+        self.errors = []
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def addError(self, line_number, row, error):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            package_id = row[0] if row else ''
+            self.errors.append((line_number, package_id, str(error)))
+
+    # Add the rows and errors of another report to this one
+    # Time Complexity: O(E) where E is the number of errors kept by the other report
+    # Space Complexity: O(1)
+    def merge(self, other):
+        self.rows += other.rows
+        self.loaded += other.loaded
+        self.error_count += other.error_count
+        self.errors.extend(other.errors[:self.max_errors - len(self.errors)])
+
+    # The report as plain data for a snapshot file
+    def dump(self):
+        return {'rows': self.rows, 'loaded': self.loaded, 'error count': self.error_count, 'errors': self.errors}
+
+    # Build a report back from dump()
+    @classmethod
+    def restore(cls, data):
+        report = cls()
+        report.rows = data['rows']
+        report.loaded = data['loaded']
+        report.error_count = data['error count']
+        report.errors = [tuple(error) for error in data['errors']]
+        return report
+
+    def __str__(self):
+        lines = [f"Loaded {self.loaded} of {self.rows} packages, {self.error_count} bad rows"]
+        for line_number, package_id, message in self.errors:
+            lines.append(f"  line {line_number}: package id {package_id!r}: {message}")
+        if self.error_count > len(self.errors):
+            lines.append(f"  ... {self.error_count - len(self.errors)} more")
+        return '\n'.join(lines)
+
+
+# Streaming package ingest
+# The file is read as a pipeline of generators: rows are read in chunks, every chunk is turned into
+# packages and the packages are added to the store as they come, so only one chunk is in memory
+# besides the store itself. Deadlines are parsed once per distinct value by Package.parseDeadline.
+
+# Rows of a package csv in lists of at most chunk_size (line number, row) pairs, the header row is skipped
+# Time Complexity: O(R) where R is the number of rows
+# Space Complexity: O(C) where C is the chunk size
+def read_chunks(path, chunk_size=4096):
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        next(reader, None)  # skip header row
+        rows = ((reader.line_num, row) for row in reader)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+# (line number, package) for every row of every chunk, bad rows go to the report instead of stopping the ingest
+# when an address registry is given every package also gets the integer id of its address
+# Time Complexity: O(R) where R is the number of rows
+# Space Complexity: O(1)
+def parse_packages(chunks, report, addresses=None):
+    for chunk in chunks:
+        for line_number, row in chunk:
+            report.rows += 1
+            try:
+                package = Package(int(row[0]), row[1], row[2], int(row[4]), row[5], int(row[6]), row[7])
+                if addresses is not None:
+                    package.address_id = addresses.idOf(package.address)
+            except (ValueError, KeyError, IndexError) as e:
+                report.addError(line_number, row, e)
+                continue
+            yield line_number, package
+
+
+# Add every good package of a package csv to the store and return the report
+# Packages with an id that is already in the store are reported as bad rows
+# Time Complexity: O(R) where R is the number of rows
+# Space Complexity: O(C) where C is the chunk size, plus the store
+def ingest_packages(path, store, addresses=None, chunk_size=4096, report=None):
+    report = IngestReport() if report is None else report
+    for line_number, package in parse_packages(read_chunks(path, chunk_size), report, addresses):
+        try:
+            store.get(package.id)
+        except KeyError:
+            store.append(package.id, package)
+            report.loaded += 1
+            continue
+        report.addError(line_number, [str(package.id)], f"duplicate package id {package.id}")
+    return report
@@ -1,38 +1,58 @@
 import datetime
 
+from models import clock, report
 from models.flag import Flag
 from models.status import Status
 
 
 class Package:
+    # Fixed attributes instead of a per instance __dict__, saves memory with many packages
+    __slots__ = ('id', 'address', 'address_id', 'city', 'zip', 'deadline', 'deadline_as_time', 'weight', 'flag',
+                 'truck', 'status', 'delivery_time')
+
+    # There are only a handful of distinct deadlines, each one is parsed once and shared by every package
+    _deadlines = {}
+
     def __init__(self, id, address, city, zip, deadline, weight, flag):
         self.id = id
         self.address = address
+        # integer id of the address, set when the package is loaded against an address registry
+        self.address_id = None
         self.city = city
         self.zip = zip
         self.deadline = deadline
         # Helper value so we don't have to keep converting deadline to datetime
-        if deadline != 'EOD':
-            self.deadline_as_time = datetime.datetime.combine(datetime.date.today(),
-                                                              datetime.datetime.strptime(deadline, '%I:%M %p').time())
-        else:
-            self.deadline_as_time = None
+        self.deadline_as_time = Package.parseDeadline(deadline)
         self.weight = weight
         self.flag = flag
         self.truck = None
         self.status = Status.HUB if flag != Flag.DELAYED or flag != Flag.WRONG_ADDRESS else Status.DELAYED
+        # minutes since midnight of the first day, None until the package is delivered
         self.delivery_time = None
 
+    # The deadline as a datetime today, None for end of day
+    # Raises ValueError for a deadline that is not a time
+    # Time Complexity: O(1), the deadline is only parsed the first time it is seen
+    # Space Complexity: O(D) where D is the number of distinct deadlines
+    @staticmethod
+    def parseDeadline(deadline):
+        if deadline == 'EOD':
+            return None
+        parsed = Package._deadlines.get(deadline)
+        if parsed is None:
+            parsed = datetime.datetime.combine(datetime.date.today(),
+                                               datetime.datetime.strptime(deadline, '%I:%M %p').time())
+            Package._deadlines[deadline] = parsed
+        return parsed
+
     # Our function for printing the required information for a package
     def __str__(self):
-        dt = self.delivery_time.strftime("%I:%M %p") if self.delivery_time else "N/A"
+        dt = report.clock_label(self.delivery_time) if self.delivery_time is not None else "N/A"
 
         if self.delivery_time is None:
             on_time = "N/A"
-        elif self.deadline == 'EOD' or \
-                datetime.datetime.combine(datetime.date.today(),
-                                          datetime.datetime.strptime(self.deadline,'%I:%M %p').time()
-                                          ) >= datetime.datetime.combine(datetime.date.today(), self.delivery_time):
+        elif self.deadline_as_time is None or not clock.is_after(self.delivery_time,
+                                                                  clock.minutes_of(self.deadline_as_time)):
             on_time = "YES"
         else:
             on_time = "NO"
@@ -0,0 +1,421 @@
+import array
+import datetime
+import operator
+
+from algorithms import instrumentation
+from models.package import Package
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, lookups scan the columns in plain python without it
+    numpy = None
+
+
+# A column of small integers, None is stored as -1
+class _IntColumn:
+    def __init__(self, typecode='i'):
+        self.values = array.array(typecode)
+
+    def append(self, value):
+        self.values.append(-1 if value is None else value)
+
+    def get(self, row):
+        value = self.values[row]
+        return None if value == -1 else value
+
+    def set(self, row, value):
+        self.values[row] = -1 if value is None else value
+
+    # The value as it is stored in the array, None if it can not be stored
+    def encode(self, value):
+        return -1 if value is None else value if isinstance(value, int) else None
+
+
+# A column with few distinct values (cities, flags, statuses), every distinct value is kept once
+# and the rows only hold its integer code
+class _CodeColumn(_IntColumn):
+    def __init__(self):
+        super().__init__()
+        self.distinct = []
+        self.codes = {}
+
+    def _code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.distinct)
+            self.distinct.append(value)
+        return code
+
+    def append(self, value):
+        self.values.append(self._code(value))
+
+    def get(self, row):
+        return self.distinct[self.values[row]]
+
+    def set(self, row, value):
+        self.values[row] = self._code(value)
+
+    def encode(self, value):
+        return self.codes.get(value)
+
+
+# Delivery time in minutes since midnight of the first day, stored as a double
+class _MinutesColumn(_IntColumn):
+    def __init__(self):
+        super().__init__('d')
+
+    def encode(self, value):
+        return -1 if value is None else float(value) if isinstance(value, (int, float)) else None
+
+
+# Row of every package id
+# Package ids are small numbers, so the rows are kept in an array indexed by the id (-1 for no row)
+# which costs 4 bytes per id instead of a dictionary entry and two int objects. Once the ids are too
+# far apart for that (or negative) the index moves over to a dictionary.
+class _RowIndex:
+    _SPARSE = 4
+
+    def __init__(self):
+        self._by_id = array.array('i')
+        self._by_key = None
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    # None for a key that is not in the index, whatever its type
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def get(self, key):
+        if self._by_key is not None:
+            return self._by_key.get(key)
+        try:
+            key = operator.index(key)
+        except TypeError:
+            return None
+        if 0 <= key < len(self._by_id):
+            row = self._by_id[key]
+            return None if row == -1 else row
+        return None
+
+    # Time Complexity: O(1) amortized
+    # Space Complexity: O(1)
+    def set(self, key, row):
+        if self._by_key is None and not 0 <= key < self._SPARSE * (self._count + 1024):
+            self._by_key = {index: value for index, value in enumerate(self._by_id) if value != -1}
+        if self._by_key is not None:
+            self._by_key[key] = row
+        else:
+            if key >= len(self._by_id):
+                self._by_id.extend([-1] * (key + 1 - len(self._by_id)))
+            self._by_id[key] = row
+        self._count += 1
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def remove(self, key):
+        if self.get(key) is None:
+            raise KeyError(key)
+        if self._by_key is not None:
+            del self._by_key[key]
+        else:
+            self._by_id[key] = -1
+        self._count -= 1
+
+    # The id array, None once the index has moved to a dictionary
+    def array(self):
+        return self._by_id if self._by_key is None else None
+
+    # An index over the given ids, by_id is the array from array() when there is one
+    # Time Complexity: O(1) with by_id, O(n) where n is the number of ids without it
+    # Space Complexity: O(n) where n is the number of ids
+    @classmethod
+    def restore(cls, ids, by_id=None):
+        index = cls()
+        if by_id is not None:
+            index._by_id = by_id
+            index._count = len(ids)
+            return index
+        for row, key in enumerate(ids):
+            index.set(key, row)
+        return index
+
+
+# Reads and writes one attribute of a row view straight from its column
+class _Field:
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        return view._store._columns[self.name].get(view._row)
+
+    def __set__(self, view, value):
+        view._store._columns[self.name].set(view._row, value)
+        if self.name == 'deadline':
+            view._store._columns['deadline_minutes'].set(view._row, PackageStore._deadlineMinutes(value))
+
+
+# A lightweight view of one row of a PackageStore that behaves like a Package
+# Reading or changing an attribute goes straight to the column, so the view only holds the store and the row.
+# Copying a view gives a real Package with the values of the row at that moment.
+class PackageView:
+    __slots__ = ('_store', '_row')
+
+    address = _Field('address')
+    address_id = _Field('address_id')
+    city = _Field('city')
+    zip = _Field('zip')
+    deadline = _Field('deadline')
+    weight = _Field('weight')
+    flag = _Field('flag')
+    truck = _Field('truck')
+    status = _Field('status')
+    delivery_time = _Field('delivery_time')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def id(self):
+        return self._store._ids[self._row]
+
+    @property
+    def deadline_as_time(self):
+        minutes = self._store._columns['deadline_minutes'].get(self._row)
+        if minutes is None:
+            return None
+        return datetime.datetime.combine(datetime.date.today(), datetime.time(minutes // 60, minutes % 60))
+
+    def __copy__(self):
+        package = Package.__new__(Package)
+        for name in Package.__slots__:
+            setattr(package, name, getattr(self, name))
+        return package
+
+    __str__ = Package.__str__
+    printHeader = staticmethod(Package.printHeader)
+
+
+# Columnar package store
+# Every package attribute is a column in a packed array of integers instead of an object per package:
+# ids, address ids, weights, trucks, deadline minutes and delivery minutes are stored directly, and
+# attributes with few distinct values (addresses, cities, zips, deadlines, flags, statuses) are stored
+# as a code into a list of their distinct values. A row costs a few bytes per attribute.
+# The store has the same interface as the HashTable (append, get, [], lookup, addIndex, iteration),
+# and hands out PackageView objects, so Dispatch, the planner and the timeline run on it unchanged.
+# Lookups compare the packed columns directly, with numpy when it is installed, so no secondary index is kept.
+class PackageStore:
+    _COLUMNS = {
+        'address': _CodeColumn,
+        'address_id': _IntColumn,
+        'city': _CodeColumn,
+        'zip': _CodeColumn,
+        'deadline': _CodeColumn,
+        'deadline_minutes': _IntColumn,
+        'weight': _IntColumn,
+        'flag': _CodeColumn,
+        'truck': _IntColumn,
+        'status': _CodeColumn,
+        'delivery_time': _MinutesColumn,
+    }
+
+    def __init__(self):
+        self._id_column = _IntColumn('q')
+        self._ids = self._id_column.values
+        self._rows = _RowIndex()
+        self._columns = {name: column() for name, column in self._COLUMNS.items()}
+        self._indexes = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    # Time Complexity: O(n) where n is the number of packages
+    # Space Complexity: O(1)
+    def __iter__(self):
+        for _, package in self._items():
+            yield package
+
+    # Rows in the order they were added, skipping removed ones
+    def _items(self):
+        for row, key in enumerate(self._ids):
+            if self._rows.get(key) == row:
+                yield key, PackageView(self, row)
+
+    # Time Complexity: O(n) where n is the number of packages
+    # Space Complexity: O(n) where n is the number of packages
+    def __str__(self):
+        return ''.join(f'{package}\n' for package in self)
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, data):
+        self.update(key, data)
+
+    def __delitem__(self, key):
+        self.remove(key)
+
+    # Deadline minutes since midnight, None for end of day or a deadline that is not a time
+    @staticmethod
+    def _deadlineMinutes(deadline):
+        try:
+            deadline_as_time = Package.parseDeadline(deadline)
+        except (ValueError, TypeError):
+            return None
+        return None if deadline_as_time is None else deadline_as_time.hour * 60 + deadline_as_time.minute
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def get(self, key):
+        row = self._rows.get(key)
+        if row is None:
+            raise KeyError(key)
+        return PackageView(self, row)
+
+    # Add a package, any object with the attributes of a Package
+    # Time Complexity: O(1) amortized
+    # Space Complexity: O(1)
+    def append(self, key, data):
+        if key in self._rows:
+            raise KeyError(f"Package {key} is already in the store")
+        self._rows.set(key, len(self._ids))
+        self._ids.append(key)
+        for name, column in self._columns.items():
+            if name == 'deadline_minutes':
+                column.append(self._deadlineMinutes(data.deadline))
+            else:
+                column.append(getattr(data, name))
+
+    # Write the attributes of data into the row of key, a view of that row is already up to date
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def update(self, key, data):
+        row = self.get(key)._row
+        if isinstance(data, PackageView) and data._store is self and data._row == row:
+            return
+        view = PackageView(self, row)
+        for name in self._COLUMNS:
+            if name != 'deadline_minutes':
+                setattr(view, name, getattr(data, name))
+
+    # The row stays in the columns but can not be reached anymore
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def remove(self, key):
+        self._rows.remove(key)
+
+    # The store as plain data for a snapshot file
+    # meta describes the store (the distinct values of every coded column and the indexes) and blocks
+    # is a list of (name, array) with every column. Removed rows are left out.
+    # Time Complexity: O(1), O(n) where n is the number of packages when rows were removed
+    # Space Complexity: O(1), O(n) when rows were removed
+    def dump(self):
+        store = self if len(self) == len(self._ids) else self.copy()
+        meta = {
+            'indexes': store._indexes,
+            'distinct': {name: column.distinct for name, column in store._columns.items()
+                         if isinstance(column, _CodeColumn)},
+        }
+        blocks = [('ids', store._ids)]
+        if store._rows.array() is not None:
+            blocks.append(('rows', store._rows.array()))
+        blocks.extend((f'column {name}', column.values) for name, column in store._columns.items())
+        return meta, blocks
+
+    # Build a store back from dump(), blocks maps every block name to a buffer with its values
+    # The buffers are copied so the store can change, they can point into a read-only memory map
+    # Time Complexity: O(n) where n is the number of packages, copying the columns
+    # Space Complexity: O(n) where n is the number of packages
+    @classmethod
+    def restore(cls, meta, blocks):
+        store = cls()
+
+        def copied(block, typecode):
+            values = array.array(typecode)
+            values.frombytes(memoryview(blocks[block]).cast('B'))
+            return values
+
+        store._id_column.values = store._ids = copied('ids', 'q')
+        store._rows = _RowIndex.restore(store._ids, copied('rows', 'i') if 'rows' in blocks else None)
+        for name, column in store._columns.items():
+            column.values = copied(f'column {name}', column.values.typecode)
+            if isinstance(column, _CodeColumn):
+                column.distinct = list(meta['distinct'][name])
+                column.codes = {value: code for code, value in enumerate(column.distinct)}
+        store._indexes = list(meta['indexes'])
+        return store
+
+    # A store with the same packages that changes independently, removed rows are left out
+    # Without removed rows the columns are copied as whole arrays instead of row by row
+    # Time Complexity: O(n) where n is the number of packages
+    # Space Complexity: O(n) where n is the number of packages
+    def copy(self):
+        new_store = PackageStore()
+        if len(self) == len(self._ids):
+            new_store._id_column.values = new_store._ids = array.array('q', self._ids)
+            by_id = self._rows.array()
+            new_store._rows = _RowIndex.restore(new_store._ids, None if by_id is None else array.array('i', by_id))
+            for name, column in self._columns.items():
+                new_column = new_store._columns[name]
+                new_column.values = array.array(column.values.typecode, column.values)
+                if isinstance(column, _CodeColumn):
+                    new_column.distinct = list(column.distinct)
+                    new_column.codes = dict(column.codes)
+        else:
+            for key, package in self._items():
+                new_store.append(key, package)
+        for attribute in self._indexes:
+            new_store.addIndex(attribute)
+        return new_store
+
+    # Every attribute is already a packed column, kept for the HashTable interface
+    def addIndex(self, attribute):
+        if attribute not in self._indexes:
+            self._indexes.append(attribute)
+
+    def reindex(self, key):
+        if key not in self._rows:
+            raise KeyError(key)
+
+    # Every keyword has to match, the packages are returned in the order they were added
+    # Time Complexity: O(n * k) where n is the number of packages and k is the number of kwargs,
+    # a vectorized compare per column when numpy is installed
+    # Space Complexity: O(n) where n is the number of packages
+    def lookup(self, **kwargs):
+        size = len(self._ids)
+        if numpy is not None:
+            mask = numpy.ones(size, dtype=bool)
+            for key, value in kwargs.items():
+                column, encoded = self._lookupColumn(key, value)
+                if encoded is None:
+                    return []
+                mask &= numpy.frombuffer(column.values, dtype=column.values.typecode, count=size) == encoded
+            rows = (int(row) for row in numpy.flatnonzero(mask))
+        else:
+            rows = range(size)
+            for key, value in kwargs.items():
+                column, encoded = self._lookupColumn(key, value)
+                if encoded is None:
+                    return []
+                values = column.values
+                rows = [row for row in rows if values[row] == encoded]
+        ids = self._ids
+        return [PackageView(self, row) for row in rows if self._rows.get(ids[row]) == row]
+
+    def _lookupColumn(self, key, value):
+        column = self._id_column if key == 'id' else self._columns[key]
+        return column, column.encode(value)
+
+
+instrumentation.hook(PackageStore, 'get', instrumentation.counting('packagestore.get'))
+instrumentation.hook(PackageStore, 'lookup', instrumentation.counting_sizes('packagestore.lookup',
+                                                                           'packagestore.largest lookup'))
@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+import sys
+
+from models import clock
+
+
+class ReportFormat:
+    TABLE = 'table'
+    CSV = 'csv'
+    JSONL = 'jsonl'
+    FORMATS = [TABLE, CSV, JSONL]
+
+
+# Minutes since midnight as 'HH:MM AM', without going through strftime, times on a later day end in '+1d'
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def clock_label(minutes):
+    time = clock.time_of(minutes)
+    label = f"{time.hour % 12 or 12:02d}:{time.minute:02d} {'AM' if time.hour < 12 else 'PM'}"
+    days = clock.days_of(minutes)
+    return f'{label} +{days}d' if days else label
+
+
+# Deadline of a package in minutes since midnight, None for end of day
+# deadline_times maps a deadline to its minutes, so every distinct deadline is worked out once
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def deadline_time(package, deadline_times):
+    try:
+        return deadline_times[package.deadline]
+    except KeyError:
+        deadline = package.deadline_as_time
+        deadline_times[package.deadline] = None if deadline is None else clock.minutes_of(deadline)
+        return deadline_times[package.deadline]
+
+
+# True when a package delivered at the given minutes made its deadline minutes, None is end of day
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def made_deadline(delivered, deadline):
+    return deadline is None or not clock.is_after(delivered, deadline)
+
+
+# A package as plain data, ready for json.dumps, on_time is None until the package is delivered
+# deadline_times is the cache of deadline_time, callers building many records pass one they keep
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def package_record(package, deadline_times=None):
+    delivered = package.delivery_time
+    deadline = None if delivered is None else deadline_time(package, {} if deadline_times is None else deadline_times)
+    return {
+        'id': package.id,
+        'address': package.address,
+        'city': package.city,
+        'zip': package.zip,
+        'weight': package.weight,
+        'deadline': package.deadline,
+        'status': package.status,
+        'truck': package.truck,
+        'delivery_time': None if delivered is None else clock_label(delivered),
+        'on_time': None if delivered is None else made_deadline(delivered, deadline),
+    }
+
+
+# Streaming package report
+# Packages are read once, in the order they are iterated, and every row is written as soon as it is built.
+# Rows are collected in chunks of chunk_rows and each chunk goes to the file in a single write, so a large
+# manifest costs a few writes instead of one per row, and memory stays at one chunk whatever the size.
+# The minutes of every deadline are worked out once per distinct deadline and reused for the on time flag.
+#   table  the columns of the package table of the menu
+#   csv    a header row and one row per package
+#   jsonl  one JSON object per package per line, the fields of package_record
+class ReportWriter:
+    _FIELDS = ['id', 'address', 'city', 'zip', 'weight', 'deadline', 'status', 'truck', 'delivery_time', 'on_time']
+    _TABLE_ROW = "{:<3}\t{:<10}\t{:<10}\t{:<10}\t{:<10}\t{:<10}\t{:<35}\n"
+
+    def __init__(self, file=None, report_format=ReportFormat.TABLE, chunk_rows=1024):
+        if report_format not in ReportFormat.FORMATS:
+            raise ValueError(f"Unknown report format {report_format}, expected one of {ReportFormat.FORMATS}")
+        self.file = sys.stdout if file is None else file
+        self.report_format = report_format
+        self.chunk_rows = chunk_rows
+        # deadline -> minutes since midnight, None for end of day
+        self._deadline_times = {}
+
+    # Write a header and a row for every package, returns the number of packages written
+    # Time Complexity: O(N) where N is the number of packages
+    # Space Complexity: O(chunk_rows + D) where D is the number of distinct deadlines
+    def write(self, packages):
+        buffer = io.StringIO()
+        row_writer = self._rowWriter(buffer)
+        self._writeHeader(buffer)
+        rows = pending = 0
+        for package in packages:
+            row_writer(package)
+            rows += 1
+            pending += 1
+            if pending == self.chunk_rows:
+                self._flushChunk(buffer)
+                pending = 0
+        self._flushChunk(buffer)
+        return rows
+
+    def _flushChunk(self, buffer):
+        chunk = buffer.getvalue()
+        if chunk:
+            self.file.write(chunk)
+        buffer.seek(0)
+        buffer.truncate()
+
+    def _writeHeader(self, buffer):
+        if self.report_format == ReportFormat.TABLE:
+            buffer.write(self._TABLE_ROW.format("ID", "STATUS", "WEIGHT", "DEADLINE", "DELIVERY TIME", "ON TIME",
+                                                "ADDRESS"))
+        elif self.report_format == ReportFormat.CSV:
+            buffer.write(','.join(self._FIELDS) + '\r\n')
+
+    # The function that writes the row of one package to the chunk buffer
+    def _rowWriter(self, buffer):
+        if self.report_format == ReportFormat.TABLE:
+            return lambda package: buffer.write(self._tableRow(package))
+        if self.report_format == ReportFormat.CSV:
+            writer = csv.writer(buffer)
+            return lambda package: writer.writerow(self._values(package))
+        return lambda package: buffer.write(json.dumps(dict(zip(self._FIELDS, self._values(package)))) + '\n')
+
+    # The delivery time label and the on time flag, None for both until the package is delivered
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def _delivery(self, package):
+        delivered = package.delivery_time
+        if delivered is None:
+            return None, None
+        deadline = deadline_time(package, self._deadline_times)
+        return clock_label(delivered), made_deadline(delivered, deadline)
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def _values(self, package):
+        delivery_time, on_time = self._delivery(package)
+        return [package.id, package.address, package.city, package.zip, package.weight, package.deadline,
+                package.status, package.truck, delivery_time, on_time]
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def _tableRow(self, package):
+        delivery_time, on_time = self._delivery(package)
+        return self._TABLE_ROW.format(package.id, package.status, package.weight, package.deadline,
+                                      delivery_time or "N/A", "N/A" if on_time is None else ("YES" if on_time else "NO"),
+                                      package.address)
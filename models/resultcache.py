@@ -0,0 +1,83 @@
+import hashlib
+import os
+import sys
+
+from algorithms.lrucache import LRUCache
+from models.snapshot import WorldSnapshot
+
+
+# Approximate memory held by a delivery result (dispatch, trucks...), most of it is the recorded timeline
+# Time Complexity: O(E) where E is the number of events
+# Space Complexity: O(1)
+def result_size(result):
+    events = result[0].timeline.events
+    return sys.getsizeof(events) + sum(sys.getsizeof(event) + sys.getsizeof(event.state) for event in events)
+
+
+# Memoized delivery results
+# run is the function that simulates the day, like deliver(end_time, plan, optimize, deadline_aware), and its
+# results are kept in an LRU cache keyed by the end time, a fingerprint of the plan and the options.
+# Every call checks the modification time and size of the source files first and hashes them again only when
+# those changed; when the hash changed every cached result is dropped, so a result never outlives the data it
+# was computed from.
+# Cached results are shared between callers and must not be changed.
+class ResultCache:
+    def __init__(self, run, sources=('data/distances.csv', 'data/packages.csv'), max_entries=32, max_bytes=None):
+        self.run = run
+        self.sources = sources
+        self.invalidations = 0
+        self._data_hash = None
+        self._source_stats = None
+        self._cache = LRUCache(max_entries, max_bytes, result_size if max_bytes is not None else None)
+
+    # A hash of the plan, None means the plan the load planner builds from the data
+    # Time Complexity: O(N) where N is the number of packages in the plan
+    # Space Complexity: O(N)
+    @staticmethod
+    def planFingerprint(plan):
+        if plan is None:
+            return None
+        return hashlib.blake2b(repr([[list(wave) for wave in waves] for waves in plan]).encode('ascii'),
+                               digest_size=16).digest()
+
+    # Drop the cached results when the source files changed
+    # A file rewritten within the resolution of its modification time with the same size is not noticed
+    # Time Complexity: O(F) where F is the number of source files, O(S) where S is their size when they were touched
+    # Space Complexity: O(F)
+    def _checkSources(self):
+        source_stats = []
+        for path in self.sources:
+            stat = os.stat(path)
+            source_stats.append((stat.st_mtime_ns, stat.st_size))
+        if source_stats == self._source_stats:
+            return
+        data_hash = WorldSnapshot.hashSources(*self.sources)
+        self._source_stats = source_stats
+        if data_hash != self._data_hash:
+            if self._data_hash is not None:
+                self.invalidations += 1
+            self._cache.clear()
+            self._data_hash = data_hash
+
+    # The result of run for these arguments, simulated only when it is not cached yet
+    # Time Complexity: O(F) where F is the number of source files, O(S) where S is their size when they
+    # changed, plus a run on a miss
+    # Space Complexity: O(1), plus the result on a miss
+    def get(self, end_time=None, plan=None, **options):
+        self._checkSources()
+        key = (end_time, self.planFingerprint(plan), tuple(sorted(options.items())))
+        try:
+            return self._cache.get(key)
+        except KeyError:
+            pass
+        result = self.run(end_time, plan, **options)
+        self._cache.put(key, result)
+        return result
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats['invalidations'] = self.invalidations
+        return stats
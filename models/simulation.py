@@ -0,0 +1,340 @@
+import copy
+import heapq
+from collections import deque
+
+from models import clock
+from models.flag import Flag
+from models.status import Status
+from models.timeline import EventType
+
+
+class SimulationEvent:
+    PACKAGE_ARRIVAL = 'Package Arrival'
+    ADDRESS_CORRECTION = 'Address Correction'
+    DRIVER_AVAILABLE = 'Driver Available'
+    TRUCK_AVAILABLE = 'Truck Available'
+    TRUCK_ARRIVAL = 'Truck Arrival'
+    TRUCK_RETURN = 'Truck Return'
+    PACKAGE_CHANGE = 'Package Change'
+
+
+class ChangeKind:
+    ADDRESS = 'Address Change'
+    LATE_ARRIVAL = 'Late Arrival'
+    CANCELLATION = 'Cancellation'
+
+
+# A change to a package that comes in while the day is running
+# address (with city and zip) is the new address of an address change, arrival the datetime.time a late
+# package now arrives at the hub
+class PackageChange:
+    def __init__(self, kind, package_id, address=None, city=None, zip=None, arrival=None):
+        self.kind = kind
+        self.package_id = package_id
+        self.address = address
+        self.city = city
+        self.zip = zip
+        self.arrival = arrival
+
+    def __str__(self):
+        return f"{self.kind} package={self.package_id}"
+
+
+# Discrete-event simulation of the whole fleet on one shared clock
+# Every timed change is an event in a priority queue ordered by time: delayed packages arriving at the hub,
+# the wrong address correction, drivers starting their shift, trucks becoming available, trucks arriving at a
+# stop and trucks returning to the hub. Events are handled in time order, so any number of trucks run at the
+# same time instead of one after the other.
+# Package changes (address changes, late arrivals at the hub, cancellations) are events too, see change().
+# A change only re-plans what it touches: the rest of the route of the truck carrying the package, from the
+# stop the truck is driving to and the time it gets there, or the waves still waiting at the hub.
+# Stops already driven and packages already delivered are never changed.
+# Event times are minutes since midnight like the truck clocks.
+# A truck at the hub leaves with its next wave from the plan as soon as it has a driver and every package of
+# the wave is at the hub with a correct address. A driver is freed when their truck returns.
+class Simulation:
+    # plan is one list of waves per truck, like LoadPlanner.plan() returns
+    # drivers is a list of times drivers start their shift, one driver per truck at the start of the day by default
+    # Time Complexity: O(N + T) where N is the number of packages and T the number of trucks
+    # Space Complexity: O(N + T)
+    def __init__(self, dispatch, trucks, plan, planner, drivers=None, optimizer=None, router=None):
+        self.dispatch = dispatch
+        self.trucks = trucks
+        self.planner = planner
+        self.optimizer = optimizer
+        self.router = router
+        self.now = min(truck.minutes for truck in trucks)
+        self._queue = []
+        self._sequence = 0
+        self._waves = {truck.id: [list(wave) for wave in waves] for truck, waves in zip(trucks, plan)}
+        self._idle = {truck.id: False for truck in trucks}
+        self._routes = {}
+        # truck id -> (stop, minutes) of the leg the truck is driving
+        self._legs = {}
+        self._trucks = {truck.id: truck for truck in trucks}
+        # package id -> id of the truck whose waves it is in
+        self._wave_of = {package_id: truck.id for truck, waves in zip(trucks, plan) for wave in waves
+                         for package_id in wave}
+        # (change kind, package id, truck id, stops left before, stops left after) for every re-planned route
+        self.replans = []
+        self.free_drivers = 0
+        self.events_handled = 0
+
+        starts = [self.now] * len(trucks) if drivers is None else [clock.minutes_of(time) for time in drivers]
+        for minutes in starts:
+            self.schedule(minutes, SimulationEvent.DRIVER_AVAILABLE)
+        for truck in trucks:
+            self.schedule(truck.minutes, SimulationEvent.TRUCK_AVAILABLE, truck)
+
+        # packages that are not at the hub at the start of the day, mapped to the minute they arrive
+        self._waiting = {}
+        # packages with a wrong address, they can not leave before the correction time and are given their
+        # corrected address then when dispatch knows it
+        self._corrections = set()
+        self._correction_minutes = clock.minutes_of(planner.correction_time)
+        for package in planner.packages:
+            if Flag.isWrongAddress(package.flag):
+                self._corrections.add(package.id)
+                self.schedule(max(self._correction_minutes, self.now), SimulationEvent.ADDRESS_CORRECTION, package.id)
+            arrival = Flag.delayedUntil(package.flag)
+            if arrival is not None and clock.is_after(clock.minutes_of(arrival), self.now):
+                self._waiting[package.id] = clock.minutes_of(arrival)
+                package.status = Status.DELAYED
+                self.dispatch.packages[package.id] = package
+                self.dispatch.timeline.recordPackage(0.0, EventType.DELAYED, package)
+                self.schedule(self._waiting[package.id], SimulationEvent.PACKAGE_ARRIVAL, package.id)
+
+    # Time Complexity: O(log E) where E is the number of queued events
+    # Space Complexity: O(1)
+    def schedule(self, time, kind, payload=None):
+        # the sequence number keeps events at the same time in the order they were scheduled
+        heapq.heappush(self._queue, (time, self._sequence, kind, payload))
+        self._sequence += 1
+
+    # Apply a PackageChange at the given datetime.time, by default at the current time of the simulation
+    # The change is handled in time order with every other event, so the simulation can be run up to a time,
+    # be given the changes that came in and run on
+    # A change that can not be applied (an unknown package, an address that is not in the distance table,
+    # a late arrival without a time or an unknown kind) raises a ValueError here instead of in the middle of run()
+    # Time Complexity: O(log E) where E is the number of queued events
+    # Space Complexity: O(1)
+    def change(self, change, time=None):
+        self._checkChange(change)
+        minutes = self.now if time is None else max(clock.minutes_of(time), self.now)
+        self.schedule(minutes, SimulationEvent.PACKAGE_CHANGE, change)
+        return self
+
+    def _checkChange(self, change):
+        try:
+            self.dispatch.packages[change.package_id]
+        except KeyError:
+            raise ValueError(f"{change}: unknown package {change.package_id}") from None
+        if change.kind == ChangeKind.ADDRESS:
+            self.dispatch.addressIdOf(change.address)
+        elif change.kind == ChangeKind.LATE_ARRIVAL:
+            if change.arrival is None:
+                raise ValueError(f"{change}: a late arrival needs an arrival time")
+        elif change.kind != ChangeKind.CANCELLATION:
+            raise ValueError(f"Unknown package change {change.kind}")
+
+    # Handle events in time order until the queue is empty or the next event is after until (a datetime.time)
+    # Time Complexity: O(E log E + S * N) where E is the number of events, S the number of stops
+    # and N the number of packages on a truck
+    # Space Complexity: O(E) where E is the number of queued events
+    def run(self, until=None):
+        handlers = {
+            SimulationEvent.PACKAGE_ARRIVAL: self._packageArrival,
+            SimulationEvent.ADDRESS_CORRECTION: self._addressCorrection,
+            SimulationEvent.DRIVER_AVAILABLE: self._driverAvailable,
+            SimulationEvent.TRUCK_AVAILABLE: self._truckAvailable,
+            SimulationEvent.TRUCK_ARRIVAL: self._truckArrival,
+            SimulationEvent.TRUCK_RETURN: self._truckReturn,
+            SimulationEvent.PACKAGE_CHANGE: self._packageChange,
+        }
+        until = None if until is None else clock.minutes_of(until)
+        while self._queue:
+            time, _, kind, payload = self._queue[0]
+            if until is not None and clock.is_after(time, until):
+                break
+            heapq.heappop(self._queue)
+            self.now = time
+            handlers[kind](payload)
+            self.events_handled += 1
+            if kind != SimulationEvent.TRUCK_ARRIVAL:
+                self._dispatchIdleTrucks()
+        return self
+
+    # A package is due once the simulation reaches the minute it is waited for, a late arrival change
+    # can push that minute back after the first arrival event was scheduled
+    def _isDue(self, package_id):
+        return package_id in self._waiting and not clock.is_after(self._waiting[package_id], self.now)
+
+    # A package that waits for its address correction arriving late is corrected once it is at the hub
+    def _packageArrival(self, package_id):
+        if not self._isDue(package_id):
+            return
+        package = self.dispatch.packages[package_id]
+        package.status = Status.HUB
+        self.dispatch.packages[package_id] = package
+        self.dispatch.timeline.recordPackage(self.now, EventType.ARRIVED, package)
+        del self._waiting[package_id]
+        if package_id in self._corrections and not clock.is_after(self._correction_minutes, self.now):
+            self._correctPackage(package_id)
+
+    # The correction of a package that was given a new address since, or that is not at the hub yet, is skipped,
+    # the package is corrected when it arrives
+    def _addressCorrection(self, package_id):
+        if package_id in self._corrections and package_id not in self._waiting:
+            self._correctPackage(package_id)
+
+    def _correctPackage(self, package_id):
+        self._corrections.discard(package_id)
+        if package_id in self.dispatch.corrections:
+            self.dispatch.correctPackage(self.dispatch.packages[package_id], self.now)
+
+    # Apply a change to a package and re-plan only what it affects
+    # Changes to delivered or cancelled packages are ignored, they are history
+    # Time Complexity: O(N + R) where N is the number of packages on the affected truck and R the cost of planning
+    # the rest of its route, or O(W) where W is the number of packages in the waves of the truck of the package
+    # Space Complexity: O(A) where A is the number of stops left
+    def _packageChange(self, change):
+        package = self.dispatch.packages[change.package_id]
+        if package.status in (Status.DELIVERED, Status.CANCELLED):
+            return
+        # the truck carrying the package, None while the package is not loaded
+        truck = self._trucks.get(package.truck) if package.status == Status.ENROUTE else None
+        if change.kind == ChangeKind.ADDRESS:
+            # the new address replaces the pending correction, the package no longer waits for it
+            self._corrections.discard(package.id)
+            self.dispatch.correctAddress(package, change.address, change.city, change.zip, self.now)
+        elif change.kind == ChangeKind.LATE_ARRIVAL:
+            ready = clock.minutes_of(change.arrival)
+            # a loaded package is already here, and one arriving by now is not late
+            if truck is not None or not clock.is_after(ready, self.now):
+                return
+            self._waiting[package.id] = max(self._waiting.get(package.id, ready), ready)
+            package.status = Status.DELAYED
+            self.dispatch.packages[package.id] = package
+            self.dispatch.timeline.recordPackage(self.now, EventType.DELAYED, package)
+            self.schedule(self._waiting[package.id], SimulationEvent.PACKAGE_ARRIVAL, package.id)
+            self._deferPackage(package.id)
+        elif change.kind == ChangeKind.CANCELLATION:
+            self._removeFromWaves(package.id)
+            self._waiting.pop(package.id, None)
+            self._corrections.discard(package.id)
+            self.dispatch.cancelPackage(package, truck, self.now)
+        else:
+            raise ValueError(f"Unknown package change {change.kind}")
+        if truck is not None:
+            self._replanRoute(truck, change)
+
+    # Plan the stops the truck has not driven to yet again, from the stop it is driving to and the time it
+    # gets there. The leg being driven is kept, the truck is already on its way.
+    # Time Complexity: O(N + R) where N is the number of packages on the truck and R the cost of planStops
+    # Space Complexity: O(A) where A is the number of stops left
+    def _replanRoute(self, truck, change):
+        route = self._routes.get(truck.id)
+        if route is None:
+            return
+        before = len(route)
+        if truck.packages:
+            # plan with a copy of the truck standing where the leg it is driving ends
+            ahead = copy.copy(truck)
+            if truck.id in self._legs:
+                ahead.current_location, ahead.minutes = self._legs[truck.id]
+            route = deque(self.dispatch.planStops(ahead, self.optimizer, self.router))
+        else:
+            route = deque()
+        self._routes[truck.id] = route
+        self.replans.append((change.kind, change.package_id, truck.id, before, len(route)))
+
+    # Take a package out of the wave it is in, returns the truck id and the index of the wave or None
+    # Time Complexity: O(W) where W is the number of packages in the waves of its truck
+    # Space Complexity: O(1)
+    def _removeFromWaves(self, package_id):
+        truck_id = self._wave_of.pop(package_id, None)
+        if truck_id is None:
+            return None
+        waves = self._waves[truck_id]
+        for index, wave in enumerate(waves):
+            if package_id in wave:
+                wave.remove(package_id)
+                return truck_id, index
+        return None
+
+    # Move a package that arrives late out of its wave, so the wave does not wait for it, into the next wave
+    # of the same truck that has room, or a new last wave. Packages that must go together stay on one truck.
+    # Time Complexity: O(W) where W is the number of packages in the waves of its truck
+    # Space Complexity: O(1)
+    def _deferPackage(self, package_id):
+        found = self._removeFromWaves(package_id)
+        if found is None:
+            return
+        truck_id, index = found
+        waves = self._waves[truck_id]
+        capacity = self._trucks[truck_id].package_capacity
+        later = next((wave for wave in waves[index + 1:] if len(wave) < capacity), None)
+        if later is None:
+            later = []
+            waves.append(later)
+        later.append(package_id)
+        self._wave_of[package_id] = truck_id
+
+    def _driverAvailable(self, _):
+        self.free_drivers += 1
+
+    def _truckAvailable(self, truck):
+        self._idle[truck.id] = True
+
+    def _truckReturn(self, truck):
+        truck.drive(self.dispatch.distanceBetween(truck.current_location, self.dispatch.hub), self.dispatch.hub)
+        self.dispatch.timeline.recordTruck(truck.minutes, truck)
+        self._legs.pop(truck.id, None)
+        self._routes.pop(truck.id, None)
+        self._idle[truck.id] = True
+        self.free_drivers += 1
+
+    # Send every idle truck that has a driver and a ready wave on its way
+    # Time Complexity: O(T + N) where T is the number of trucks and N the number of packages loaded
+    # Space Complexity: O(1)
+    def _dispatchIdleTrucks(self):
+        for truck in self.trucks:
+            if self.free_drivers == 0:
+                return
+            if not self._idle[truck.id]:
+                continue
+            waves = self._waves[truck.id]
+            while waves and not waves[0]:
+                waves.pop(0)
+            if not waves or any(package_id in self._waiting or package_id in self._corrections
+                                for package_id in waves[0]):
+                continue
+            wave = waves.pop(0)
+            self.free_drivers -= 1
+            self._idle[truck.id] = False
+            truck.minutes = max(truck.minutes, self.now)
+            self.dispatch.loadTruckWithPackageList(truck, wave)
+            self.dispatch.truckDeliverAllPackagesAtCurrentLocation(truck)
+            self._routes[truck.id] = deque(self.dispatch.planStops(truck, self.optimizer, self.router))
+            self._scheduleNextStop(truck)
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def _scheduleNextStop(self, truck):
+        route = self._routes[truck.id]
+        stop = route.popleft() if truck.packages and route else None
+        if stop is None:
+            distance = self.dispatch.distanceBetween(truck.current_location, self.dispatch.hub)
+            self._legs[truck.id] = (self.dispatch.hub, truck.minutesAtArrival(distance))
+            self.schedule(self._legs[truck.id][1], SimulationEvent.TRUCK_RETURN, truck)
+            return
+        distance = self.dispatch.distanceBetween(truck.current_location, stop)
+        self._legs[truck.id] = (stop, truck.minutesAtArrival(distance))
+        self.schedule(self._legs[truck.id][1], SimulationEvent.TRUCK_ARRIVAL, (truck, stop))
+
+    def _truckArrival(self, payload):
+        truck, stop = payload
+        truck.drive(self.dispatch.distanceBetween(truck.current_location, stop), stop)
+        self.dispatch.timeline.recordTruck(truck.minutes, truck)
+        self.dispatch.truckDeliverAllPackagesAtCurrentLocation(truck)
+        self._scheduleNextStop(truck)
@@ -0,0 +1,115 @@
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from algorithms.addressregistry import AddressRegistry
+from algorithms.distancematrix import DistanceMatrix
+from algorithms.neighbourindex import NeighbourIndex
+from models.ingest import IngestReport
+from models.packagestore import PackageStore
+
+
+# Snapshot of the fully loaded world: addresses, distance matrix, nearest neighbour index and package table
+# Starting from a snapshot is one memory map of one file. The distance matrix and the neighbour index are used
+# straight from the mapped pages; only the package columns are copied because the day changes them.
+# The snapshot carries a hash of the source CSVs and is only used while they are unchanged.
+class WorldSnapshot:
+    # File layout: header, metadata as utf-8 JSON, then every block of values, each starting on an 8 byte boundary
+    # header fields: magic, version, length of the metadata, source hash
+    # the metadata names every block with its typecode and number of values, in file order
+    _MAGIC = b'WRLD'
+    _VERSION = 3
+    _HEADER = struct.Struct('<4sHxxI16s')
+    _ALIGNMENT = 8
+
+    # report is the IngestReport of the package file, kept so the bad rows are known without parsing it again
+    def __init__(self, addresses, distances, packages, source_hash=b'', report=None):
+        self.addresses = addresses
+        self.distances = distances
+        self.packages = packages
+        self.source_hash = source_hash
+        self.report = IngestReport() if report is None else report
+
+    # One hash over the contents of every source file, in order
+    # Time Complexity: O(n) where n is the size of the files in bytes
+    # Space Complexity: O(1)
+    @staticmethod
+    def hashSources(*paths):
+        digest = hashlib.blake2b(digest_size=16)
+        for path in paths:
+            digest.update(DistanceMatrix.hashFile(path))
+        return digest.digest()
+
+    # Write the snapshot, the file is replaced atomically
+    # packages has to be a PackageStore, the neighbour index is built first if needed
+    # Time Complexity: O(A^2 + N) where A is the number of addresses and N is the number of packages
+    # Space Complexity: O(A + N) for the metadata
+    def write(self, path):
+        offsets, neighbours, neighbour_distances = self.distances.neighbours().toArrays()
+        package_meta, package_blocks = self.packages.dump()
+        blocks = [('distances', self.distances.buffer), ('neighbour offsets', offsets),
+                  ('neighbours', neighbours), ('neighbour distances', neighbour_distances)] + package_blocks
+        meta = {
+            'addresses': list(self.distances.addresses),
+            'distance typecode': self.distances.typecode,
+            'distance hash': self.distances.source_hash.hex(),
+            'packages': package_meta,
+            'ingest': self.report.dump(),
+            'blocks': [(name, self._typecode(values), len(values)) for name, values in blocks],
+        }
+        meta_block = json.dumps(meta).encode('utf-8')
+        header = self._HEADER.pack(self._MAGIC, self._VERSION, len(meta_block), self.source_hash.ljust(16, b'\0'))
+
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(header)
+            file.write(meta_block)
+            position = len(header) + len(meta_block)
+            for _, values in blocks:
+                file.write(b'\0' * (-position % self._ALIGNMENT))
+                position += -position % self._ALIGNMENT
+                data = memoryview(values).cast('B')
+                file.write(data)
+                position += len(data)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _typecode(values):
+        return values.typecode if isinstance(values, array.array) else values.format
+
+    # Memory-map a snapshot file
+    # Raises ValueError when the file is not a snapshot or is truncated
+    # Time Complexity: O(A + N) where A is the number of addresses and N is the number of packages
+    # Space Complexity: O(A + N), the distance matrix and neighbour index stay in the mapped pages
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < cls._HEADER.size:
+            raise ValueError(f'{path} is not a world snapshot')
+        magic, version, meta_length, source_hash = cls._HEADER.unpack_from(mapped)
+        if magic != cls._MAGIC or version != cls._VERSION:
+            raise ValueError(f'{path} is not a world snapshot')
+        position = cls._HEADER.size + meta_length
+        meta = json.loads(mapped[cls._HEADER.size:position].decode('utf-8'))
+
+        view = memoryview(mapped)
+        blocks = {}
+        for name, typecode, count in meta['blocks']:
+            position += -position % cls._ALIGNMENT
+            end = position + count * array.array(typecode).itemsize
+            if len(mapped) < end:
+                raise ValueError(f'{path} is truncated')
+            blocks[name] = view[position:end].cast(typecode)
+            position = end
+
+        neighbours = NeighbourIndex.fromArrays(blocks['neighbour offsets'], blocks['neighbours'],
+                                               blocks['neighbour distances'])
+        distances = DistanceMatrix(meta['addresses'], blocks['distances'], meta['distance typecode'],
+                                   bytes.fromhex(meta['distance hash']), neighbours)
+        packages = PackageStore.restore(meta['packages'], blocks)
+        return cls(AddressRegistry(distances.addresses), distances, packages, source_hash,
+                   IngestReport.restore(meta['ingest']))
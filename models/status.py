@@ -3,3 +3,4 @@ class Status:
     ENROUTE = 'En Route'
     DELIVERED = 'Delivered'
     DELAYED = 'Delayed'
+    CANCELLED = 'Cancelled'
@@ -0,0 +1,240 @@
+import bisect
+import copy
+
+from algorithms.hashtable import HashTable
+from models import clock
+from models.packagestore import PackageStore
+from models.report import clock_label
+
+
+class EventType:
+    DELAYED = 'Delayed'
+    ARRIVED = 'Arrived at Hub'
+    LOADED = 'Loaded'
+    DELIVERED = 'Delivered'
+    ADDRESS_CORRECTED = 'Address Corrected'
+    CANCELLED = 'Cancelled'
+    TRUCK_MOVED = 'Truck Moved'
+
+
+# A single entry in the delivery timeline
+# Package events carry a snapshot of the package state right after the event,
+# truck events carry the truck location and total distance right after the move
+class Event:
+    def __init__(self, time, sequence, kind, package_id=None, truck_id=None, state=None):
+        self.time = time
+        self.sequence = sequence
+        self.kind = kind
+        self.package_id = package_id
+        self.truck_id = truck_id
+        self.state = state
+
+    def __lt__(self, other):
+        return (self.time, self.sequence) < (other.time, other.sequence)
+
+    def __str__(self):
+        return f"{clock_label(self.time)} {self.kind} package={self.package_id} truck={self.truck_id} {self.state}"
+
+
+# Time ordered log of everything that happens during a single full run of the day
+# Times are minutes since midnight of the first day, the same numbers the simulation clock keeps.
+# A query at a time sees every event that is not clock.is_after() it.
+# Events are stamped with the time they become visible. Anything recorded after
+# holdUntil() cannot become visible before the hold time, this mirrors how deliver()
+# only runs the second wave of trucks once both trucks are back at the hub.
+# Once the day has been recorded, the state of a package at any time is answered
+# from the log instead of re-running the simulation.
+class Timeline:
+    # Time Complexity: O(N) where N is the number of packages
+    # Space Complexity: O(N) where N is the number of packages
+    def __init__(self, packages):
+        self.events = []
+        self._hold = None
+        self._sorted = True
+        # keep every package as it was before the day started, a PackageStore is copied column by column
+        # so the copy stays packed, from other tables every package is copied
+        if isinstance(packages, PackageStore):
+            self._initial = packages.copy()
+        else:
+            self._initial = {package.id: copy.copy(package) for package in packages}
+        self._order = [package.id for package in packages]
+        # per package list of event times and events, used for binary search
+        self._package_times = {package_id: [] for package_id in self._order}
+        self._package_events = {package_id: [] for package_id in self._order}
+        self._truck_times = {}
+        self._truck_events = {}
+
+    # Nothing recorded from now on can become visible before the given time
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def holdUntil(self, time):
+        if self._hold is None or time > self._hold:
+            self._hold = time
+
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def _stamp(self, time):
+        if self._hold is not None and self._hold > time:
+            return self._hold
+        return time
+
+    # Record a package event with a snapshot of the package state after the change
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def recordPackage(self, time, kind, package, truck_id=None):
+        state = (package.status, package.delivery_time, package.address, package.address_id, package.city,
+                 package.zip, package.truck)
+        event = Event(self._stamp(time), len(self.events), kind, package_id=package.id, truck_id=truck_id,
+                      state=state)
+        self._append(event)
+        if package.id not in self._package_events:
+            # package was added to the table after the timeline was created
+            if isinstance(self._initial, PackageStore):
+                self._initial.append(package.id, package)
+            else:
+                self._initial[package.id] = copy.copy(package)
+            self._order.append(package.id)
+            self._package_times[package.id] = []
+            self._package_events[package.id] = []
+        self._package_times[package.id].append(event.time)
+        self._package_events[package.id].append(event)
+
+    # Record a truck move with the truck location and total distance after the move
+    # Time Complexity: O(1)
+    # Space Complexity: O(1)
+    def recordTruck(self, time, truck):
+        event = Event(self._stamp(time), len(self.events), EventType.TRUCK_MOVED, truck_id=truck.id,
+                      state=(truck.current_location, truck.distance))
+        self._append(event)
+        self._truck_times.setdefault(truck.id, []).append(event.time)
+        self._truck_events.setdefault(truck.id, []).append(event)
+
+    def _append(self, event):
+        if self.events and event < self.events[-1]:
+            self._sorted = False
+        self.events.append(event)
+
+    # Trucks are simulated one after another so the log is only sorted once all trucks are done
+    # Time Complexity: O(E log E) where E is the number of events, O(1) if already sorted
+    # Space Complexity: O(E)
+    def _ensureSorted(self):
+        if self._sorted:
+            return
+        self.events.sort()
+        for index in (self._package_events, self._truck_events):
+            for events in index.values():
+                events.sort()
+        for times, events in ((self._package_times, self._package_events), (self._truck_times, self._truck_events)):
+            for key in events:
+                times[key] = [event.time for event in events[key]]
+        self._sorted = True
+
+    # Apply a recorded package state to a copy of the package
+    @staticmethod
+    def _apply(package, state):
+        (package.status, package.delivery_time, package.address, package.address_id, package.city,
+         package.zip, package.truck) = state
+        return package
+
+    # The state of a single package at the given time
+    # Time Complexity: O(log E) where E is the number of events for the package
+    # Space Complexity: O(1)
+    def packageAt(self, package_id, time):
+        self._ensureSorted()
+        if package_id not in self._initial:
+            raise KeyError(package_id)
+        package = copy.copy(self._initial[package_id])
+        index = bisect.bisect_right(self._package_times[package_id], time + clock.EPSILON) - 1
+        if index >= 0:
+            self._apply(package, self._package_events[package_id][index].state)
+        return package
+
+    # The state of every package at the given time, built with one sweep over the log
+    # Time Complexity: O(N + E) where N is the number of packages and E is the number of events
+    # Space Complexity: O(N) where N is the number of packages
+    def packagesAt(self, time):
+        packages = HashTable()
+        for package in self.eachPackageAt(time):
+            packages.append(package.id, package)
+        return packages
+
+    # The packages of packagesAt one at a time in the order they were added, for streaming them into a report
+    # Time Complexity: O(N + E) where N is the number of packages and E is the number of events
+    # Space Complexity: O(P) where P is the number of packages with an event before the time
+    def eachPackageAt(self, time):
+        self._ensureSorted()
+        states = {}
+        for event in self.events:
+            if clock.is_after(event.time, time):
+                break
+            if event.package_id is not None:
+                states[event.package_id] = event.state
+        for package_id in self._order:
+            package = copy.copy(self._initial[package_id])
+            if package_id in states:
+                self._apply(package, states[package_id])
+            yield package
+
+    # The status of the given packages at each of the given times, built with one sweep over the log
+    # Rows are streamed out in time order as tuples of (time, status of each package in package_ids order)
+    # Times do not need to be sorted, they are sorted before the sweep. A package id can be asked for more than
+    # once and every one of its columns is kept up to date. Unknown package ids raise a KeyError right away,
+    # not once the rows are read.
+    # Time Complexity: O(E + Q log Q + Q * K) where E is the number of events, Q the number of times and K the
+    # number of packages
+    # Space Complexity: O(K) where K is the number of packages, not counting the rows consumed by the caller
+    def statusMatrix(self, times, package_ids=None):
+        self._ensureSorted()
+        if package_ids is None:
+            package_ids = self._order
+        columns = {}
+        statuses = []
+        for column, package_id in enumerate(package_ids):
+            if package_id not in self._initial:
+                raise KeyError(package_id)
+            columns.setdefault(package_id, []).append(column)
+            statuses.append(self._initial[package_id].status)
+        return self._statusRows(sorted(times), columns, statuses)
+
+    # The sweep of statusMatrix, times are sorted and columns maps a package id to its columns
+    def _statusRows(self, times, columns, statuses):
+        events = self.events
+        event_count = len(events)
+        index = 0
+        for time in times:
+            while index < event_count and not clock.is_after(events[index].time, time):
+                event = events[index]
+                for column in columns.get(event.package_id, ()):
+                    statuses[column] = event.state[0]
+                index += 1
+            yield (time, *statuses)
+
+    # Location and total distance of a truck at the given time
+    # Time Complexity: O(log E) where E is the number of moves made by the truck
+    # Space Complexity: O(1)
+    def truckAt(self, truck_id, time):
+        self._ensureSorted()
+        if truck_id not in self._truck_events:
+            raise KeyError(truck_id)
+        index = bisect.bisect_right(self._truck_times[truck_id], time + clock.EPSILON) - 1
+        if index < 0:
+            return None, 0.0
+        return self._truck_events[truck_id][index].state
+
+    # The stops a truck drove to up to the given time, in order, a stop driven to twice in a row is listed once
+    # Without a time every stop of the day is listed
+    # Time Complexity: O(M) where M is the number of moves of the truck
+    # Space Complexity: O(M)
+    def truckStops(self, truck_id, time=None):
+        self._ensureSorted()
+        if truck_id not in self._truck_events:
+            raise KeyError(truck_id)
+        events = self._truck_events[truck_id]
+        if time is not None:
+            events = events[:bisect.bisect_right(self._truck_times[truck_id], time + clock.EPSILON)]
+        stops = []
+        for event in events:
+            location = event.state[0]
+            if not stops or stops[-1] != location:
+                stops.append(location)
+        return stops
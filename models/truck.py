@@ -1,5 +1,8 @@
 import datetime
 
+from models import clock
+from models.report import clock_label
+
 
 class Truck:
     def __init__(self, id, distance=0.0, time=0,
@@ -9,16 +12,26 @@ class Truck:
         self.id = id
         self.packages = []
         self.distance = distance
-        self.time = time
         self.current_location = current_location
         self.package_capacity = package_capacity
         self.truck_speed = truck_speed
-        self.time = datetime.datetime.combine(datetime.date.today(), datetime.datetime.strptime(start_time,
-                                                                                                '%I:%M').time())
+        # the truck clock, minutes since midnight
+        self.minutes = clock.minutes_of(datetime.datetime.strptime(start_time, '%I:%M').time())
+
+    # The truck clock as a datetime today, only built when a time is shown or compared with datetimes
+    # Time complexity: O(1)
+    # Space complexity: O(1)
+    @property
+    def time(self):
+        return clock.datetime_of(self.minutes)
+
+    @time.setter
+    def time(self, value):
+        self.minutes = clock.minutes_of(value)
 
     # Unused in the end but a good idea to have
     def __str__(self):
-        return f"Truck {self.id} ({self.current_location} {self.distance} {self.time.time()} {self.packages})"
+        return f"Truck {self.id} ({self.current_location} {self.distance} {clock_label(self.minutes)} {self.packages})"
 
     # Function that managed to load packages into a truck and raise an exception if the truck is full
     # Time complexity: O(1)
@@ -33,13 +46,31 @@ class Truck:
     # Time complexity: O(1)
     # Space complexity: O(1)
     def timeAtArrival(self, distance):
-        minutes_to_deliver = (distance / self.truck_speed) * 60
-        return self.time + datetime.timedelta(minutes=minutes_to_deliver)
+        return clock.datetime_of(self.minutesAtArrival(distance))
+
+    # The truck clock in minutes when it arrives after driving the given distance
+    # Time complexity: O(1)
+    # Space complexity: O(1)
+    def minutesAtArrival(self, distance):
+        return self.minutes + distance / self.truck_speed * 60
+
+    # Keep the truck at its location until the given time of day, used to wait for packages at the hub
+    # Time complexity: O(1)
+    # Space complexity: O(1)
+    def waitUntil(self, time):
+        self.minutes = max(self.minutes, clock.minutes_of(time))
 
     # Our function for moving the truck and updating its distance, time, and current location
     # Time complexity: O(1)
     # Space complexity: O(1)
     def drive(self, distance, address):
+        self.arrive(distance, address, self.minutesAtArrival(distance))
+
+    # Move the truck to an address with an arrival time that is already known, for example from
+    # the arrival schedule of its route
+    # Time complexity: O(1)
+    # Space complexity: O(1)
+    def arrive(self, distance, address, minutes):
         self.distance += distance
-        self.time = self.timeAtArrival(distance)
+        self.minutes = minutes
         self.current_location = address
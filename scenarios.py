@@ -0,0 +1,148 @@
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from main import deliver_with, load_world
+from models import clock
+from models.assignment import LoadPlanner
+from models.dispatch import Dispatch
+from models.report import clock_label
+from models.status import Status
+from models.truck import Truck
+
+
+# One variant of the day to evaluate
+# start_times has one start time per truck ('H:MM'), seed shuffles the package order the load planner sees
+# so ties are broken differently and a different set of loads comes out (None keeps the file order).
+# A plan of package ids per truck can be given instead of letting the planner build one.
+class Scenario:
+    def __init__(self, name, start_times=('8:00', '9:05'), truck_speed=18.0, seed=None, optimize=False,
+                 deadline_aware=False, plan=None):
+        self.name = name
+        self.start_times = start_times
+        self.truck_speed = truck_speed
+        self.seed = seed
+        self.optimize = optimize
+        self.deadline_aware = deadline_aware
+        self.plan = plan
+
+
+# finish_time is when the last truck is back, in minutes since midnight
+class ScenarioResult:
+    def __init__(self, name, mileage, late, undelivered, finish_time, seconds):
+        self.name = name
+        self.mileage = mileage
+        self.late = late
+        self.undelivered = undelivered
+        self.finish_time = finish_time
+        self.seconds = seconds
+
+    # Fewest late or missing packages first, then the shortest day, then the earliest finish
+    def rankKey(self):
+        return (self.late + self.undelivered, round(self.mileage, 1), self.finish_time, self.name)
+
+    def __str__(self):
+        return f"{self.name:<28}{self.mileage:>10.1f}{self.late:>6}{self.undelivered:>8}" \
+               f"{clock_label(self.finish_time):>11}{self.seconds:>9.3f}"
+
+    @staticmethod
+    def printHeader():
+        return f"{'Rank':<6}{'Scenario':<28}{'Miles':>10}{'Late':>6}{'Missing':>8}{'Finish':>11}{'Seconds':>9}"
+
+
+# Data every worker shares for all of its scenarios, loaded once per process by _loadWorld
+# The world comes from the same snapshot deliver() starts from, so the results compare with it. The distance
+# matrix is memory-mapped from the snapshot, so every worker reads the same pages of the file instead of
+# getting its own pickled copy. The packages are only read, every scenario runs on a fresh copy of them.
+_world = None
+
+
+# Time Complexity: O(N) where N is the number of packages, O(1) for the memory-mapped matrix
+# Space Complexity: O(N) where N is the number of packages
+def _loadWorld():
+    global _world
+    if _world is None:
+        _world = load_world()
+    return _world
+
+
+# Run a single scenario in the current process
+# Time Complexity: O(N^2+A^2) where N is the number of packages and A is the number of Addresses
+# Space Complexity: O(N+A^2)
+def run_scenario(scenario):
+    started = time.perf_counter()
+    addresses, distances, packages = _loadWorld()
+    fresh = packages.copy()
+
+    HUB = 0  # the hub is the first address in the list
+    trucks = []
+    for index, start_time in enumerate(scenario.start_times):
+        trucks.append(Truck(index + 1, current_location=HUB, start_time=start_time, truck_speed=scenario.truck_speed))
+    dispatch = Dispatch(HUB, fresh, addresses, distances)
+    order = list(fresh)
+    if scenario.seed is not None:
+        random.Random(scenario.seed).shuffle(order)
+    planner = LoadPlanner(order, trucks, distances, HUB, corrected=dispatch.correctedAddressIds())
+    deliver_with(dispatch, trucks, plan=scenario.plan, optimize=scenario.optimize,
+                 deadline_aware=scenario.deadline_aware, planner=planner)
+
+    late = undelivered = 0
+    for package in fresh:
+        if package.status != Status.DELIVERED:
+            undelivered += 1
+        elif package.deadline_as_time is not None and clock.is_after(package.delivery_time,
+                                                                     clock.minutes_of(package.deadline_as_time)):
+            late += 1
+    return ScenarioResult(scenario.name, sum(truck.distance for truck in trucks), late, undelivered,
+                          max(truck.minutes for truck in trucks), time.perf_counter() - started)
+
+
+# Evaluate every scenario and return the results ranked best first
+# Scenarios are spread over a pool of worker processes, each worker loads the data once in its initializer
+# and then only receives the small scenario descriptions. workers=1 runs everything in this process.
+# Time Complexity: O(S * D / W) where S is the number of scenarios, D the cost of one day and W the number of workers
+# Space Complexity: O(W * N + A^2) where N is the number of packages and A the number of addresses
+def run_scenarios(scenarios, workers=None):
+    scenarios = list(scenarios)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = [run_scenario(scenario) for scenario in scenarios]
+    else:
+        # write the world snapshot up front so the workers only ever map it
+        load_world()
+        chunk_size = max(1, len(scenarios) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_loadWorld) as executor:
+            results = list(executor.map(run_scenario, scenarios, chunksize=chunk_size))
+    return sorted(results, key=ScenarioResult.rankKey)
+
+
+# Every combination of start times for truck 2, truck speeds, routing modes and planner seeds
+# Time Complexity: O(S) where S is the number of scenarios
+# Space Complexity: O(S)
+def scenario_grid(second_starts=('9:05', '9:30'), speeds=(18.0,), seeds=(None, 1, 2, 3),
+                  modes=((False, False), (True, False), (False, True))):
+    scenarios = []
+    for second_start in second_starts:
+        for speed in speeds:
+            for seed in seeds:
+                for optimize, deadline_aware in modes:
+                    name = f"{second_start} {speed:g}mph" + (f" s{seed}" if seed is not None else '') + \
+                        (' opt' if optimize else '') + (' dl' if deadline_aware else '')
+                    scenarios.append(Scenario(name, ('8:00', second_start), speed, seed, optimize, deadline_aware))
+    return scenarios
+
+
+def print_ranking(results, limit=None):
+    print(ScenarioResult.printHeader())
+    for rank, result in enumerate(results[:limit], 1):
+        print(f"{rank:<6}{result}")
+
+
+if __name__ == '__main__':
+    scenarios = scenario_grid()
+    started = time.perf_counter()
+    ranked = run_scenarios(scenarios)
+    elapsed = time.perf_counter() - started
+    print_ranking(ranked)
+    print(f"{len(scenarios)} scenarios in {elapsed:.2f}s ({len(scenarios) / elapsed:.1f} per second)")
@@ -0,0 +1,276 @@
+# Local query service for package status
+# Terminals and scanners connect over a local TCP or Unix socket and send one JSON object per line,
+# every request gets one JSON object per line back, in order:
+#     {"id": 1, "op": "status", "time": "10:30 AM"}                  every package at a time
+#     {"id": 2, "op": "package", "package": 9, "time": "10:30 AM"}   one package, at the end of the day without time
+#     {"id": 3, "op": "mileage", "time": "10:30 AM", "truck": 1}     location and miles of the trucks
+#     {"id": 4, "op": "simulate"}                                    mileage, finish time and late packages of the day
+#     {"id": 6, "op": "route", "truck": 1, "time": "10:30 AM"}       every address the trucks drove through so far
+#     {"id": 5, "op": "stats"}                                       queries answered, cached days, bad package rows
+# Every query can pick a variant of the day with "options": {"optimize": true, "deadline_aware": true,
+# "shortest_paths": true}. Answers look like {"id": 1, "ok": true, "result": ...} or {"id": 1, "ok": false,
+# "error": "..."}.
+# The world is loaded once. Each variant of the day is simulated once, in a worker thread so the event loop
+# keeps answering other connections meanwhile, and kept in an LRU cache; queries are answered from the
+# recorded timeline of the day.
+# Run from the repository root: python server.py [--port 8765 | --unix PATH] [--max-days 8]
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from algorithms.lrucache import LRUCache
+from main import deliver_with, load_shortest_paths, load_world
+from models import clock
+from models.dispatch import Dispatch
+from models.ingest import IngestReport
+from models.report import clock_label, deadline_time, made_deadline, package_record
+from models.status import Status
+from models.truck import Truck
+
+HUB = 0  # the hub is the first address in the list
+_OPTIONS = ('optimize', 'deadline_aware', 'shortest_paths')
+
+
+# A bad request, its message is sent back to the client
+class QueryError(Exception):
+    pass
+
+
+# Parse a time of day given as 'HH:MM AM/PM' or as 24 hour 'HH:MM' into minutes since midnight
+# Time Complexity: O(1)
+# Space Complexity: O(1)
+def parse_time(value):
+    for time_format in ('%I:%M %p', '%H:%M', '%H:%M:%S'):
+        try:
+            return clock.minutes_of(datetime.datetime.strptime(str(value).strip().upper(), time_format))
+        except ValueError:
+            pass
+    raise QueryError(f"Invalid time {value!r}, expected HH:MM AM/PM")
+
+
+# The world and the simulated days behind the server
+class StatusService:
+    # Time Complexity: O(N + A) to load the world, see load_world
+    # Space Complexity: O(N + A^2) where N is the number of packages and A the number of addresses
+    def __init__(self, max_days=8, workers=1):
+        self.ingest_report = IngestReport()
+        self.addresses, self.distances, self.packages = load_world(report=self.ingest_report)
+        self.queries = 0
+        self.started = time.perf_counter()
+        self._paths = None
+        # deadline -> minutes since midnight, shared by every package record the service answers with
+        self._deadline_times = {}
+        self._days = LRUCache(max_days)
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._handlers = {
+            'status': self._status,
+            'package': self._package,
+            'mileage': self._mileage,
+            'simulate': self._simulate,
+            'route': self._route,
+            'stats': self._stats,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # Run the whole day for a variant on fresh copies of the packages, runs in a worker thread
+    # Time Complexity: O(N^2 + A^2), see deliver_with
+    # Space Complexity: O(N + E) where E is the number of timeline events
+    def _runDay(self, options):
+        paths = None
+        if options.get('shortest_paths'):
+            if self._paths is None:
+                self._paths = load_shortest_paths(self.distances)
+            paths = self._paths
+        trucks = [Truck(1, current_location=HUB), Truck(2, current_location=HUB, start_time='9:05')]
+        dispatch = Dispatch(HUB, self.packages.copy(), self.addresses, self.distances, paths)
+        deliver_with(dispatch, trucks, optimize=bool(options.get('optimize')),
+                     deadline_aware=bool(options.get('deadline_aware')))
+        # sort the timeline here so the first query does not do it on the event loop
+        dispatch.timeline.truckAt(trucks[0].id, 0.0)
+        return dispatch, trucks
+
+    # The simulated day for the options of a query, simulated in the executor the first time it is asked for
+    # Queries asking for a day that is being simulated wait for the same run
+    # Time Complexity: O(1) when the day is cached, a run of the day otherwise
+    # Space Complexity: O(1)
+    async def day(self, options):
+        options = options or {}
+        unknown = set(options) - set(_OPTIONS)
+        if unknown:
+            raise QueryError(f"Unknown options {sorted(unknown)}")
+        key = tuple(bool(options.get(option)) for option in _OPTIONS)
+        try:
+            return self._days.get(key)
+        except KeyError:
+            pass
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, self._runDay,
+                                                                dict(zip(_OPTIONS, key)))
+            self._pending[key] = future
+            future.add_done_callback(lambda done: self._finishDay(key, done))
+        # a client hanging up must not cancel the run other queries wait for
+        return await asyncio.shield(future)
+
+    def _finishDay(self, key, future):
+        self._pending.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self._days.put(key, future.result())
+
+    # Answer one request, errors are answered instead of raised
+    # Time Complexity: O(1) plus the query
+    # Space Complexity: O(1) plus the answer
+    async def answer(self, request):
+        answer = {'id': request.get('id') if isinstance(request, dict) else None}
+        try:
+            if not isinstance(request, dict):
+                raise QueryError("A request is a JSON object")
+            handler = self._handlers.get(request.get('op'))
+            if handler is None:
+                raise QueryError(f"Unknown op {request.get('op')!r}, expected one of {sorted(self._handlers)}")
+            answer['result'] = await handler(request)
+            answer['ok'] = True
+        except (QueryError, KeyError, TypeError, ValueError) as error:
+            answer['ok'] = False
+            answer['error'] = str(error) if not isinstance(error, KeyError) else f"Unknown id {error}"
+        except Exception as error:
+            # a failed run of the day must not drop the connection, the client gets the error and can go on
+            answer['ok'] = False
+            answer['error'] = f"Internal error: {type(error).__name__}: {error}"
+        self.queries += 1
+        return answer
+
+    # Time Complexity: O(N + E) where E is the number of events, O(K log E) for K given packages
+    # Space Complexity: O(N)
+    async def _status(self, request):
+        if 'time' not in request:
+            raise QueryError("status needs a time")
+        at = parse_time(request['time'])
+        dispatch, _ = await self.day(request.get('options'))
+        if 'packages' in request:
+            packages = [dispatch.timeline.packageAt(int(package_id), at) for package_id in request['packages']]
+        else:
+            packages = dispatch.timeline.packagesAt(at)
+        return [package_record(package, self._deadline_times) for package in packages]
+
+    # Time Complexity: O(log E) where E is the number of events of the package
+    # Space Complexity: O(1)
+    async def _package(self, request):
+        if 'package' not in request:
+            raise QueryError("package needs a package id")
+        at = parse_time(request['time']) if 'time' in request else math.inf
+        dispatch, _ = await self.day(request.get('options'))
+        return package_record(dispatch.timeline.packageAt(int(request['package']), at), self._deadline_times)
+
+    # Time Complexity: O(T log M) where T is the number of trucks and M the number of moves of a truck
+    # Space Complexity: O(T)
+    async def _mileage(self, request):
+        at = parse_time(request['time']) if 'time' in request else math.inf
+        dispatch, trucks = await self.day(request.get('options'))
+        truck_ids = [int(request['truck'])] if 'truck' in request else [truck.id for truck in trucks]
+        result = {'trucks': {}}
+        for truck_id in truck_ids:
+            location, miles = dispatch.timeline.truckAt(truck_id, at)
+            result['trucks'][truck_id] = {
+                'location': None if location is None else self.addresses.nameOf(location),
+                'miles': round(miles, 1),
+            }
+        result['total_miles'] = round(sum(truck['miles'] for truck in result['trucks'].values()), 1)
+        return result
+
+    # Time Complexity: O(N), plus a run of the day when it is not cached
+    # Space Complexity: O(1)
+    async def _simulate(self, request):
+        dispatch, trucks = await self.day(request.get('options'))
+        late = undelivered = 0
+        for package in dispatch.packages:
+            if package.status != Status.DELIVERED:
+                undelivered += 1
+            elif not made_deadline(package.delivery_time, deadline_time(package, self._deadline_times)):
+                late += 1
+        return {
+            'miles': round(sum(truck.distance for truck in trucks), 1),
+            'finish_time': clock_label(max(truck.minutes for truck in trucks)),
+            'late': late,
+            'undelivered': undelivered,
+        }
+
+    # The driver manifest of the trucks, the day's route of every truck up to the time
+    # Time Complexity: O(T * (M + p)) where T is the number of trucks, M the number of moves and p the addresses listed
+    # Space Complexity: O(T * p)
+    async def _route(self, request):
+        at = parse_time(request['time']) if 'time' in request else None
+        dispatch, trucks = await self.day(request.get('options'))
+        truck_ids = [int(request['truck'])] if 'truck' in request else [truck.id for truck in trucks]
+        return {'trucks': {truck_id: [self.addresses.nameOf(address) for address in dispatch.manifest(truck_id, at)]
+                           for truck_id in truck_ids}}
+
+    async def _stats(self, request):
+        return {
+            'queries': self.queries,
+            'packages': len(self.packages),
+            'bad_package_rows': self.ingest_report.error_count,
+            'uptime_seconds': time.perf_counter() - self.started,
+            'days': self._days.stats(),
+        }
+
+    # One client connection, requests are answered one after the other in the order they came in
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                answer = await self.answer(request)
+                writer.write(json.dumps(answer).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass  # the client went away or sent a line longer than the stream limit
+        finally:
+            writer.close()
+
+
+# Start the service on a TCP port or a Unix socket and serve until cancelled
+# ready is called with the address the server listens on, port 0 picks a free port
+# max_days is the number of variants of the day kept simulated
+async def serve(host='127.0.0.1', port=8765, unix_path=None, ready=print, max_days=8):
+    service = StatusService(max_days)
+    # simulate the default day before taking connections
+    await service.day({})
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(service.handle, path=unix_path)
+        address = unix_path
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        host, port = server.sockets[0].getsockname()[:2]
+        address = f'{host}:{port}'
+    ready(f'listening on {address}')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Answer package status queries as JSON lines over a socket')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--max-days', type=int, default=8, help='variants of the day kept simulated')
+    arguments = parser.parse_args()
+    try:
+        asyncio.run(serve(arguments.host, arguments.port, arguments.unix,
+                          ready=lambda message: print(message, flush=True), max_days=arguments.max_days))
+    except KeyboardInterrupt:
+        pass